@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Connection Rule Scaling Benchmark
+Times DrawioDiagramGenerator.add_connections on synthetic inventories of growing size
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synthetic import make_inventory
+from connection_rules import DEFAULT_RULES_PATH, CompiledRules
+from generate_infrastructure_diagram import DrawioDiagramGenerator
+
+
+class CountingDiagram:
+    """Diagram stand-in that only counts calls, so the rules are timed and not the backend"""
+
+    def __init__(self):
+        self.nodes = 0
+        self.links = 0
+
+    def add_node(self, **kwargs):
+        self.nodes += 1
+
+    def add_link(self, **kwargs):
+        self.links += 1
+
+
+def make_rules(extra):
+    """Default rules plus `extra` synthetic stack rules mixing name, label, network and regex matches"""
+    spec = json.loads(Path(DEFAULT_RULES_PATH).read_text())['rules']
+    for i in range(extra):
+        stem = ('api', 'worker', 'db', 'cache', 'webui')[i % 5]
+        spec.append({
+            'name': f"stack-{i}",
+            'source': {'name_regex': f"^{stem}-{i}\\d*$", 'network': f"project-{i % 50}-net"},
+            'target': {'label': {'com.docker.compose.service': stem}, 'not': {'name_regex': '(?i)auth'}},
+            'label': 'depends on',
+        })
+    return CompiledRules(spec)
+
+
+def time_connections(inventory, rules, repeat):
+    """Best-of-`repeat` time for evaluating every connection rule"""
+    best, links = None, 0
+    for _ in range(repeat):
+        generator = DrawioDiagramGenerator(inventory, rules=rules)
+        generator.diagram = CountingDiagram()
+        start = time.perf_counter()
+        generator.add_connections()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        links = generator.diagram.links
+    return best, links
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--rules', type=int, default=0, help="synthetic rules to add to the default set")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per size, best time is reported")
+    args = parser.parse_args()
+
+    rules = make_rules(args.rules)
+    print(f"{len(rules.rules)} connection rules")
+
+    print(f"{'containers':>10} {'edges':>8} {'total ms':>10} {'us/container':>13}")
+    previous = None
+    for size in args.sizes:
+        elapsed, links = time_connections(make_inventory(size), rules, args.repeat)
+        growth = f"  x{elapsed / previous[1]:.1f} time for x{size / previous[0]:.0f} containers" if previous else ""
+        print(f"{size:>10} {links:>8} {elapsed * 1000:>10.2f} {elapsed / size * 1e6:>13.2f}{growth}")
+        previous = (size, elapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
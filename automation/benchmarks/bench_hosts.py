@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Multi-Host Scan Benchmark
+Scans several fake Docker hosts with different latencies through scan_hosts() and
+compares the wall time with the slowest host and with scanning them one after another
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fake_docker
+from bench_scan import scale_fixtures
+from generate_infrastructure_diagram import DockerEndpoint, InfrastructureScanner, scan_hosts, scan_infrastructure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hosts', type=int, default=4, help="number of fake hosts")
+    parser.add_argument('--containers', type=int, default=50, help="containers per host")
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help="per-call latency of the slowest host in seconds, others are faster")
+    parser.add_argument('--mode', default='bulk', choices=[m for m in InfrastructureScanner.SCAN_MODES if m != 'api'])
+    args = parser.parse_args()
+
+    fixtures = scale_fixtures(fake_docker.load_fixtures(fake_docker.RECORDED_FIXTURES), args.containers)
+    endpoints = [DockerEndpoint(f"host{i}", f"tcp://host{i}:2375") for i in range(args.hosts)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for endpoint in endpoints:
+            fake_docker.write_fixtures(fake_docker.host_fixture_dir(tmp, endpoint.url), fixtures)
+        os.environ.update(fake_docker.install(Path(tmp) / "bin", tmp))
+
+        # Every host but the last answers faster, so "slowest host" is a meaningful bound
+        def scan_one(index, endpoint):
+            os.environ[fake_docker.LATENCY_ENV] = str(args.latency * (index + 1) / args.hosts)
+            start = time.perf_counter()
+            scan_infrastructure(InfrastructureScanner(mode=args.mode, host=endpoint.url))
+            return time.perf_counter() - start
+
+        host_times = [scan_one(i, e) for i, e in enumerate(endpoints)]
+        # Parallel run with the slowest latency everywhere: should cost one slowest host
+        os.environ[fake_docker.LATENCY_ENV] = str(args.latency)
+        start = time.perf_counter()
+        inventory = scan_hosts(endpoints, mode=args.mode)
+        parallel = time.perf_counter() - start
+
+    slowest = max(host_times)
+    print(f"{args.hosts} hosts x {args.containers} containers ({args.mode} mode)")
+    print(f"  sequential sum  {sum(host_times) * 1000:9.1f} ms")
+    print(f"  slowest host    {slowest * 1000:9.1f} ms")
+    print(f"  scan_hosts      {parallel * 1000:9.1f} ms  ({len(inventory.containers)} containers)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
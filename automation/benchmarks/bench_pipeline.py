@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+End-to-End Pipeline Benchmark
+Scans synthetic estates through the fake Docker CLI and renders, publishes and records
+them exactly like a production run, timing every stage at growing sizes
+
+Each size runs in a fresh interpreter so its peak memory is its own. Results can be saved
+and compared with an earlier run; thresholds (pipeline_thresholds.json) turn slow stages,
+super-linear growth and regressions against the compared run into a non-zero exit.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+import fake_docker
+from synthetic import docker_fixtures, make_inventory
+from connection_rules import DEFAULT_RULES_PATH, load_rules
+from generate_infrastructure_diagram import InfrastructureScanner, render_diagram, scan_infrastructure
+from inventory import LabelKeys
+from run_metrics import RunMetrics
+from snapshot_cache import inventory_fingerprint
+from topology_diff import ROUTE_LABEL_PATTERN
+
+RESULTS_VERSION = 1
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_THRESHOLDS = BENCHMARK_DIR / "pipeline_thresholds.json"
+DEFAULT_RESULTS_DIR = BENCHMARK_DIR / "results"
+
+# Columns of the summary table: (heading, stage)
+TABLE_STAGES = [('scan', 'scan_containers'), ('generate', 'generate_diagram'), ('links', 'add_connections'),
+                ('serialize', 'serialize'), ('publish', 'publish'), ('history', 'history')]
+
+
+def run_size(size, mode='bulk', lod=None, workdir=None):
+    """One production-like run over `size` synthetic containers; returns the RunMetrics report"""
+    workdir = Path(workdir)
+    fixture_dir = workdir / "docker"
+    if not fixture_dir.is_dir():
+        fake_docker.write_fixtures(fixture_dir, docker_fixtures(make_inventory(size)))
+    os.environ.update(fake_docker.install(workdir / "bin", fixture_dir))
+    # A fresh output tree each time: no fingerprint to skip on, no history to diff against
+    os.environ['DRAWIO_BASE_PATH'] = tempfile.mkdtemp(dir=workdir)
+
+    label_keys = LabelKeys(load_rules(os.environ.get('DRAWIO_RULES', DEFAULT_RULES_PATH)).label_keys,
+                           [ROUTE_LABEL_PATTERN])
+    metrics = RunMetrics()
+    with contextlib.redirect_stdout(io.StringIO()):
+        infrastructure = scan_infrastructure(InfrastructureScanner(mode=mode, label_keys=label_keys,
+                                                                   metrics=metrics))
+        with metrics.stage('fingerprint'):
+            fingerprint = inventory_fingerprint(infrastructure)
+        # Every manifest destination, web roots included, lands under the temporary base path
+        render_diagram(infrastructure, fingerprint, deploy=True, lod=lod, metrics=metrics)
+    metrics.finish(0)
+    if len(infrastructure.containers) != size:
+        raise RuntimeError(f"scanned {len(infrastructure.containers)} containers, expected {size}")
+    return metrics.as_dict()
+
+
+def best_of(reports):
+    """Per-stage minimum over repeated runs of one size; counts come from the last run"""
+    best = dict(reports[-1])
+    best['duration_seconds'] = min(r['duration_seconds'] for r in reports)
+    best['stages'] = {name: dict(stage, seconds=min(r['stages'][name]['seconds'] for r in reports))
+                      for name, stage in reports[-1]['stages'].items()}
+    best['peak_rss_bytes'] = max(r['peak_rss_bytes'] for r in reports)
+    return best
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=BENCHMARK_DIR)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def check(results, thresholds, baseline=None):
+    """Threshold violations as human-readable strings, empty if the run passes"""
+    failures = []
+    limits = thresholds.get('max_seconds', {})
+    min_seconds = thresholds.get('min_seconds', 0.05)
+    sizes = sorted(results['sizes'], key=int)
+    for size in sizes:
+        report = results['sizes'][size]
+        timings = dict({name: s['seconds'] for name, s in report['stages'].items()},
+                       total=report['duration_seconds'])
+        for stage, limit in limits.get(size, {}).items():
+            if stage in timings and timings[stage] > limit:
+                failures.append(f"{size} containers: {stage} took {timings[stage]:.2f}s, limit {limit}s")
+
+    # Per-container cost may grow a little with size (bigger indexes, longer pages); a
+    # quadratic stage grows it tenfold for every tenfold more containers
+    max_growth = thresholds.get('max_cost_growth')
+    for smaller, larger in zip(sizes, sizes[1:]):
+        small, large = results['sizes'][smaller], results['sizes'][larger]
+        for stage, timing in large['stages'].items():
+            before = small['stages'].get(stage)
+            if max_growth is None or before is None or timing['seconds'] < min_seconds or not before['seconds']:
+                continue
+            growth = (timing['seconds'] / before['seconds']) / (int(larger) / int(smaller))
+            if growth > max_growth:
+                failures.append(f"{stage}: per-container cost grew x{growth:.1f} from {smaller} to {larger} "
+                                f"containers, limit x{max_growth}")
+
+    max_regression = thresholds.get('max_regression')
+    if baseline is not None and max_regression is not None:
+        for size in sizes:
+            before = baseline['sizes'].get(size)
+            if before is None:
+                continue
+            for stage, timing in results['sizes'][size]['stages'].items():
+                previous = before['stages'].get(stage)
+                if previous is None or timing['seconds'] < min_seconds:
+                    continue
+                ratio = timing['seconds'] / max(previous['seconds'], 1e-9)
+                if ratio > max_regression:
+                    failures.append(f"{size} containers: {stage} x{ratio:.2f} slower than the baseline "
+                                    f"({previous['seconds']:.3f}s -> {timing['seconds']:.3f}s), "
+                                    f"limit x{max_regression}")
+    return failures
+
+
+def print_table(results, baseline=None):
+    headings = ' '.join(f"{heading:>9}" for heading, _ in TABLE_STAGES)
+    print(f"{'containers':>10} {'total':>9} {headings} {'docker':>7} {'docker s':>9} {'nodes':>7} {'edges':>7} "
+          f"{'KB out':>8} {'peak MB':>8}")
+    for size in sorted(results['sizes'], key=int):
+        report = results['sizes'][size]
+        stages = ' '.join(f"{report['stages'].get(stage, {}).get('seconds', 0):>9.3f}" for _, stage in TABLE_STAGES)
+        # Time inside the (fake) docker CLI, part of the scan stages; the rest is the scanner's own
+        calls = report['calls'].get('subprocess', {'count': 0, 'seconds': 0})
+        print(f"{size:>10} {report['duration_seconds']:>9.3f} {stages} {calls['count']:>7} {calls['seconds']:>9.3f} "
+              f"{report['counts'].get('nodes', 0):>7} {report['counts'].get('edges', 0):>7} "
+              f"{report['output'].get('bytes', 0) / 1024:>8.0f} {report['peak_rss_bytes'] / 2 ** 20:>8.1f}")
+        previous = baseline['sizes'].get(size) if baseline else None
+        if previous:
+            ratios = ' '.join(
+                f"{_ratio(report['stages'].get(stage), previous['stages'].get(stage)):>9}" for _, stage in TABLE_STAGES)
+            total = _ratio({'seconds': report['duration_seconds']}, {'seconds': previous['duration_seconds']})
+            print(f"{'vs base':>10} {total:>9} {ratios}")
+
+
+def _ratio(current, previous):
+    if not current or not previous or not previous['seconds']:
+        return '-'
+    return f"x{current['seconds'] / previous['seconds']:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="container counts to run")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per size, the best time per stage is kept")
+    parser.add_argument('--mode', default='bulk', choices=[m for m in InfrastructureScanner.SCAN_MODES if m != 'api'])
+    parser.add_argument('--lod', choices=('network', 'host'), help="render with --lod pages")
+    parser.add_argument('--save', metavar='PATH', nargs='?', const='',
+                        help=f"save the results as JSON (default: {DEFAULT_RESULTS_DIR.name}/pipeline_<time>.json)")
+    parser.add_argument('--compare', metavar='PATH', help="earlier saved results to compare with")
+    parser.add_argument('--thresholds', metavar='PATH', default=str(DEFAULT_THRESHOLDS),
+                        help="limits that fail the run (default: pipeline_thresholds.json)")
+    args = parser.parse_args()
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'commit': git_commit(),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'mode': args.mode,
+        'lod': args.lod,
+        'sizes': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            workdir = Path(tmp) / str(size)
+            workdir.mkdir()
+            reports = []
+            for _ in range(args.repeat):
+                # A fresh interpreter per run, so peak memory and caches belong to this size alone
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                    reports.append(pool.submit(run_size, size, args.mode, args.lod, workdir).result())
+            results['sizes'][str(size)] = best_of(reports)
+            print(f"  {size} containers: {results['sizes'][str(size)]['duration_seconds']:.2f}s", file=sys.stderr)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_table(results, baseline)
+
+    if args.save is not None:
+        path = Path(args.save) if args.save else DEFAULT_RESULTS_DIR / f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Results saved to {path}")
+
+    thresholds = json.loads(Path(args.thresholds).read_text()) if args.thresholds else {}
+    failures = check(results, thresholds, baseline)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Within thresholds")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
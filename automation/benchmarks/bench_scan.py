@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Container Scan Benchmark
+Replays recorded `docker ps`/`docker inspect` fixtures through each scan mode of
+InfrastructureScanner and reports how long container discovery takes
+"""
+
+import argparse
+import copy
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fake_docker
+from generate_infrastructure_diagram import InfrastructureScanner
+
+
+def scale_fixtures(fixtures, count):
+    """Replicate the recorded containers until there are `count` of them"""
+    recorded = list(zip(fixtures['ps'], fixtures['inspect']))
+    ps_entries, inspect = [], []
+    for i in range(count):
+        ps_entry, details = copy.deepcopy(recorded[i % len(recorded)])
+        if i >= len(recorded):
+            name = f"{ps_entry['Names']}-{i // len(recorded)}"
+            full_id = hashlib.sha256(name.encode()).hexdigest()
+            ps_entry['Names'], ps_entry['ID'] = name, full_id[:12]
+            details['Name'], details['Id'] = f"/{name}", full_id
+        ps_entries.append(ps_entry)
+        inspect.append(details)
+    return dict(fixtures, ps=ps_entries, inspect=inspect)
+
+
+def time_scan(mode, repeat):
+    """Best-of-`repeat` wall time for one scan_containers() call"""
+    best, containers = None, None
+    for _ in range(repeat):
+        scanner = InfrastructureScanner(mode=mode)
+        start = time.perf_counter()
+        containers = scanner.scan_containers()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, containers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--containers', type=int, default=150, help="number of containers to replay")
+    parser.add_argument('--fixtures', default=str(fake_docker.RECORDED_FIXTURES), help="recorded fixture directory")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per mode, best time is reported")
+    parser.add_argument('--modes', nargs='+', default=['per-container', 'bulk'],
+                        choices=[m for m in InfrastructureScanner.SCAN_MODES if m != 'api'])
+    args = parser.parse_args()
+
+    fixtures = scale_fixtures(fake_docker.load_fixtures(args.fixtures), args.containers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_dir = Path(tmp) / "fixtures"
+        fake_docker.write_fixtures(fixture_dir, fixtures)
+        os.environ.update(fake_docker.install(Path(tmp) / "bin", fixture_dir))
+
+        print(f"Replaying {args.containers} containers from {args.fixtures}")
+        results = {}
+        for mode in args.modes:
+            elapsed, containers = time_scan(mode, args.repeat)
+            results[mode] = containers
+            print(f"  {mode:<14} {elapsed * 1000:9.1f} ms  ({len(containers)} containers)")
+
+    reference = results[args.modes[0]]
+    for mode in args.modes[1:]:
+        if results[mode] != reference:
+            print(f"❌ {mode} returned different containers than {args.modes[0]}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
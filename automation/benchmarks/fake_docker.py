@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Fake Docker CLI
+Replays recorded `docker` JSON output so the scanner can be exercised without a daemon
+
+`-H <url>` selects the fixtures in `<fixture dir>/hosts/<host>`, where <host> is the URL's
+host name or the socket file name without extension; a host without fixtures behaves like
+an unreachable daemon. FAKE_DOCKER_LATENCY adds a delay (seconds) to every call.
+"""
+
+import json
+import os
+import re
+import stat
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+FIXTURES_ENV = 'FAKE_DOCKER_FIXTURES'
+LATENCY_ENV = 'FAKE_DOCKER_LATENCY'
+RECORDED_FIXTURES = Path(__file__).parent / "fixtures" / "docker"
+
+# write_fixtures() puts one inspect object per line, so lookups parse only the lines asked for
+_INSPECT_KEYS = re.compile(r'"Id": "([0-9a-f]+)".*?"Name": "/([^"]+)"')
+
+
+def _read_lines(path):
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines() if line]
+
+
+def load_fixtures(fixture_dir):
+    """Load recorded `docker ps`/`inspect`/`network ls`/`volume ls` output"""
+    fixture_dir = Path(fixture_dir)
+    return {
+        'ps': _read_lines(fixture_dir / "ps.jsonl"),
+        'inspect': json.loads((fixture_dir / "inspect.json").read_text()),
+        'networks': _read_lines(fixture_dir / "networks.jsonl"),
+        'volumes': _read_lines(fixture_dir / "volumes.jsonl"),
+    }
+
+
+def write_fixtures(fixture_dir, fixtures):
+    """Write fixtures in the layout `load_fixtures` and the fake CLI read"""
+    fixture_dir = Path(fixture_dir)
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    for key, name in (('ps', "ps.jsonl"), ('networks', "networks.jsonl"), ('volumes', "volumes.jsonl")):
+        with open(fixture_dir / name, "w") as f:
+            for entry in fixtures[key]:
+                f.write(json.dumps(entry) + "\n")
+    with open(fixture_dir / "inspect.json", "w") as f:
+        # Still a JSON array, but one object per line (see _INSPECT_KEYS)
+        f.write("[\n" + ",\n".join(json.dumps(details) for details in fixtures['inspect']) + "\n]\n")
+
+
+def host_fixture_dir(fixture_dir, url):
+    """Where the fixtures of a `-H` endpoint live"""
+    parts = urlsplit(url if '://' in url else f"unix://{url}")
+    return Path(fixture_dir) / "hosts" / (parts.hostname or Path(parts.path).stem)
+
+
+def install(bin_dir, fixture_dir):
+    """Put a `docker` shim in bin_dir and return an environment that resolves to it"""
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    shim = bin_dir / "docker"
+    shim.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{Path(__file__).resolve()}" "$@"\n')
+    shim.chmod(shim.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    env = dict(os.environ)
+    env['PATH'] = f"{bin_dir}{os.pathsep}{env.get('PATH', '')}"
+    env[FIXTURES_ENV] = str(fixture_dir)
+    return env
+
+
+def _print_lines(entries):
+    for entry in entries:
+        print(json.dumps(entry))
+
+
+def _inspect(path, refs):
+    """Inspect objects matching full IDs, short IDs or names, and the refs that matched nothing"""
+    text = path.read_text()
+    lines = text.splitlines()
+    if not all(_INSPECT_KEYS.match(line, 1) for line in lines[1:-1]):
+        # Recorded pretty-printed fixtures: parse the whole file
+        lines = ['['] + [json.dumps(details) for details in json.loads(text)] + [']']
+    wanted = set(refs)
+    found = {}
+    for line in lines[1:-1]:
+        full_id, name = _INSPECT_KEYS.match(line, 1).groups()
+        for ref in (full_id, full_id[:12], name):
+            if ref in wanted:
+                found[ref] = line
+    missing = [ref for ref in refs if ref not in found]
+    return [json.loads(found[ref].rstrip(',')) for ref in refs if ref in found], missing
+
+
+def main(argv):
+    fixture_dir = os.environ.get(FIXTURES_ENV, RECORDED_FIXTURES)
+    if argv[:1] in (['-H'], ['--host']):
+        host, argv = argv[1], argv[2:]
+        fixture_dir = host_fixture_dir(fixture_dir, host)
+        if not fixture_dir.is_dir():
+            print(f"Cannot connect to the Docker daemon at {host}. Is the docker daemon running?", file=sys.stderr)
+            return 1
+    time.sleep(float(os.environ.get(LATENCY_ENV, 0)))
+    fixture_dir = Path(fixture_dir)
+
+    # Drop `--format json`, every listing is replayed in that format
+    args = [a for i, a in enumerate(argv) if a != '--format' and (i == 0 or argv[i - 1] != '--format')]
+
+    if args[:1] == ['ps']:
+        # `--filter id=<id>` may repeat, matching any of the IDs
+        ids = [args[i + 1][3:] for i, a in enumerate(args[:-1]) if a == '--filter' and args[i + 1].startswith('id=')]
+        _print_lines([p for p in _read_lines(fixture_dir / "ps.jsonl")
+                      if not ids or any(p['ID'].startswith(i[:12]) for i in ids)])
+    elif args[:2] == ['network', 'ls']:
+        _print_lines(_read_lines(fixture_dir / "networks.jsonl"))
+    elif args[:2] == ['volume', 'ls']:
+        _print_lines(_read_lines(fixture_dir / "volumes.jsonl"))
+    elif args[:1] == ['inspect']:
+        found, missing = _inspect(fixture_dir / "inspect.json", args[1:])
+        print(json.dumps(found, indent=4))
+        for ref in missing:
+            print(f"Error: No such object: {ref}", file=sys.stderr)
+        return 1 if missing else 0
+    else:
+        print(f"fake docker: unsupported command: {' '.join(argv)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Synthetic Inventory Generator
+Builds realistic scan results of arbitrary size for benchmarks, as inventories or as
+fixtures the fake Docker CLI replays
+"""
+
+import argparse
+import hashlib
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fake_docker
+from inventory import Inventory, make_container, make_network, make_volume, save_inventory
+
+# The services add_connections has explicit rules for, always present
+CORE_SERVICES = [
+    ('traefik', 'traefik:v3.1', ['traefik-proxy'], ['80:80', '443:443'], {}),
+    ('keycloak', 'quay.io/keycloak/keycloak:26.0', ['traefik-proxy', 'keycloak-net'], ['8443:8443'],
+     {'traefik.enable': 'true'}),
+    ('keycloak-postgres', 'postgres:15', ['keycloak-net'], [], {}),
+    ('postgres', 'postgres:16', ['postgres-net'], ['5432:5432'], {}),
+    ('pgadmin', 'dpage/pgadmin4:latest', ['traefik-proxy', 'postgres-net'], ['8901:80'], {'traefik.enable': 'true'}),
+    ('drawio', 'jgraph/drawio:latest', ['traefik-proxy'], [], {}),
+    ('drawio-auth-proxy', 'quay.io/oauth2-proxy/oauth2-proxy:v7.12.0', ['traefik-proxy', 'keycloak-net'],
+     ['4180:4180'], {'traefik.enable': 'true'}),
+    ('portainer', 'portainer/portainer-ce:2.21.4', ['traefik-proxy'], ['9000:9000'], {'traefik.enable': 'true'}),
+]
+
+# (name stem, image) pairs covering every container category
+SERVICE_TEMPLATES = [
+    ('api', 'ghcr.io/example/api:1.4'),
+    ('webui', 'ghcr.io/example/webui:2.0'),
+    ('worker', 'ghcr.io/example/worker:1.4'),
+    ('db', 'postgres:16'),
+    ('cache', 'redis:7-alpine'),
+    ('docs', 'mongo:7'),
+    ('edge', 'nginx:alpine'),
+    ('admin', 'adminer:latest'),
+    ('auth', 'quay.io/oauth2-proxy/oauth2-proxy:v7.12.0'),
+    ('backend', 'ghcr.io/example/backend:3.1'),
+]
+
+# Stems whose containers reference others in their environment
+DEPENDENT_SERVICES = {'api', 'worker', 'backend'}
+
+
+def make_inventory(containers, networks=None, multi_homed=0.2, routed=0.3, seed=0):
+    """Scan result with `containers` containers spread over `networks` project networks"""
+    rng = random.Random(seed)
+    networks = networks or max(1, containers // 12)
+    project_networks = [f"project-{i}-net" for i in range(networks)]
+    all_networks = ['traefik-proxy', 'keycloak-net', 'postgres-net', 'mailu'] + project_networks
+
+    records = []
+    for name, image, nets, ports, labels in CORE_SERVICES[:containers]:
+        records.append(make_container(name, image, 'Up 2 days', nets, ports, labels))
+
+    for i in range(len(records), containers):
+        stem, image = SERVICE_TEMPLATES[i % len(SERVICE_TEMPLATES)]
+        nets = [rng.choice(project_networks)]
+        if rng.random() < multi_homed:
+            nets.append(rng.choice(all_networks))
+        labels = {'com.docker.compose.project': nets[0].rsplit('-', 1)[0], 'com.docker.compose.service': stem}
+        if rng.random() < routed:
+            nets.append('traefik-proxy')
+            labels['traefik.enable'] = 'true'
+            labels[f'traefik.http.routers.{stem}-{i}.rule'] = f"Host(`{stem}-{i}.example.com`)"
+        ports = [f"{20000 + i}:{8000 + i % 100}"] if rng.random() < 0.25 else []
+        # Application services reach their block's database by name and any cache by service alias;
+        # workers also depend on the project's api in compose
+        env_hosts = ()
+        if stem in DEPENDENT_SERVICES:
+            env_hosts = ('cache', f"db-{i - i % len(SERVICE_TEMPLATES) + 3}")
+        if stem == 'worker':
+            labels['com.docker.compose.depends_on'] = 'api:service_started:false'
+        records.append(make_container(f"{stem}-{i}", image, 'Up 2 days', dict.fromkeys(nets), ports, labels,
+                                      env_hosts=env_hosts))
+
+    return Inventory(records,
+                     [make_network(n, 'bridge', 'local') for n in all_networks],
+                     [make_volume(f"{c.name}_data", 'local') for c in records[::3]])
+
+
+def docker_fixtures(inventory):
+    """The `docker ps`/`inspect`/`network ls`/`volume ls` output a daemon running `inventory` would print
+
+    Scanning these through fake_docker.py gives back the same inventory.
+    """
+    ps_entries, inspect = [], []
+    for container in inventory.containers:
+        full_id = hashlib.sha256(container.name.encode()).hexdigest()
+        ports = {}
+        for binding in container.ports:
+            host_port, container_port = binding.split(':')
+            ports.setdefault(f"{container_port}/tcp", []).append({'HostIp': '0.0.0.0', 'HostPort': host_port})
+        ps_entries.append({'ID': full_id[:12], 'Image': container.image, 'Names': container.name,
+                           'Networks': ','.join(container.networks), 'State': 'running', 'Status': container.status})
+        inspect.append({
+            'Id': full_id,
+            'Name': f"/{container.name}",
+            'Image': f"sha256:{hashlib.sha256(container.image.encode()).hexdigest()}",
+            'Config': {'Hostname': full_id[:12], 'Image': container.image, 'Labels': dict(container.labels),
+                       'Env': ['PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin']
+                              + [f"UPSTREAM_{n}_URL=http://{host}:8080" for n, host in enumerate(container.env_hosts)]},
+            'NetworkSettings': {'Ports': ports, 'Networks': {network: {} for network in container.networks}},
+        })
+    return {
+        'ps': ps_entries,
+        'inspect': inspect,
+        # The default networks a daemon always lists; the scanner skips them
+        'networks': [{'Name': name, 'Driver': name if name != 'none' else 'null', 'Scope': 'local'}
+                     for name in ('bridge', 'host', 'none')]
+                    + [{'Name': n.name, 'Driver': n.driver, 'Scope': n.scope} for n in inventory.networks],
+        'volumes': [{'Name': v.name, 'Driver': v.driver, 'Scope': 'local'} for v in inventory.volumes],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic inventory for --from-inventory")
+    parser.add_argument('containers', type=int, help="number of containers")
+    parser.add_argument('output', help="inventory file to write (.json or .msgpack), or a directory with --docker")
+    parser.add_argument('--networks', type=int, help="project networks (default: one per 12 containers)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--docker', action='store_true',
+                        help="write fake Docker CLI fixtures (see fake_docker.py) instead of an inventory")
+    args = parser.parse_args()
+
+    inventory = make_inventory(args.containers, networks=args.networks, seed=args.seed)
+    if args.docker:
+        fake_docker.write_fixtures(args.output, docker_fixtures(inventory))
+    else:
+        save_inventory(inventory, args.output)
+    print(f"Wrote {len(inventory.containers)} containers, {len(inventory.networks)} networks to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
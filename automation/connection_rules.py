@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Connection Rule Engine
+Loads declarative connection rules and compiles them into a single-pass container matcher
+"""
+
+import json
+import re
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+
+from dependencies import DependencyRules
+
+try:
+    import yaml
+except ImportError:  # PyYAML is only needed for .yaml/.yml rule files
+    yaml = None
+
+DEFAULT_RULES_PATH = Path(__file__).parent / "connection_rules.json"
+
+# Keys a match expression may use; all present keys must match (logical AND)
+MATCH_KEYS = {'name', 'name_regex', 'image', 'image_regex', 'label', 'network', 'not'}
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _image_repository(image):
+    """Image reference without tag or digest: registry:5000/app:1.0 -> registry:5000/app"""
+    image = image.split('@')[0]
+    repository, _, tag = image.rpartition(':')
+    return repository if repository and '/' not in tag else image
+
+
+def _scoped_regex(pattern):
+    """Wrap a pattern so it can be combined with others; a leading (?i) becomes (?i:...)"""
+    flags = re.match(r'^\(\?([aiLmsux]+)\)', pattern)
+    if flags:
+        return f"(?{flags.group(1)}:{pattern[flags.end():]})"
+    return f"(?:{pattern})"
+
+
+class ConnectionRule:
+    """One declarative edge rule: every source match is linked to every target match"""
+
+    def __init__(self, spec):
+        self.name = spec.get('name', '<unnamed>')
+        self.label = spec.get('label', '')
+        self.style = spec.get('style', '')
+        self.allow_self = spec.get('allow_self', False)
+        self.source = spec['source']
+        self.target = spec['target']
+        self.requires = spec.get('requires')
+
+
+class _Selector:
+    """A compiled match expression"""
+
+    __slots__ = ('atoms', 'patterns', 'negation')
+
+    def __init__(self):
+        self.atoms = []      # index atoms: name/image/network/label conditions
+        self.patterns = []   # regex pattern ids, checked only once the index atoms hold
+        self.negation = None  # selector id of the `not` clause
+
+
+class CompiledRules:
+    """Connection rules compiled into lookup indexes and combined regexes
+
+    `dependencies` is the rule file's "dependencies" section, see dependencies.py; without
+    it no dependencies are discovered.
+    """
+
+    def __init__(self, rules, dependencies=None):
+        self.rules = [ConnectionRule(spec) for spec in rules]
+        try:
+            self.dependencies = DependencyRules(dependencies) if dependencies else None
+        except ValueError as e:
+            raise ValueError(f"Connection rule dependencies: {e}") from e
+
+        self._selectors = []
+        self._root_selectors = defaultdict(list)  # index atom -> endpoint selectors using it
+        self._unindexed = []                      # endpoint selectors without index atoms
+        self._names = defaultdict(list)   # container name -> atoms
+        self._images = defaultdict(list)  # image repository (no tag) -> atoms
+        self._labels = defaultdict(list)  # (label key, value) -> atoms
+        self._label_keys = defaultdict(list)  # label key with any value -> atoms
+        self._networks = defaultdict(list)  # network name -> atoms
+        self._patterns = []               # pattern id -> (field, compiled regex)
+        self._pattern_ids = {}            # (field, pattern) -> pattern id, shared between rules
+        self._atom_count = 0
+
+        self._rule_selectors = []
+        for rule in self.rules:
+            try:
+                self._rule_selectors.append((
+                    self._compile_endpoint(rule.source),
+                    self._compile_endpoint(rule.target),
+                    self._compile_root(rule.requires) if rule.requires is not None else None,
+                ))
+            except (ValueError, re.error) as e:
+                raise ValueError(f"Connection rule '{rule.name}': {e}") from e
+
+        # Endpoints with only regex conditions must be tried on every container. Their
+        # patterns are combined into one regex per field that answers "which of them match"
+        # in a single call: each is an optional lookahead recording an empty named group
+        self._combined = {}
+        upfront = sorted({p for s in self._unindexed for p in self._all_patterns(s)})
+        for field in ('name', 'image'):
+            pids = [p for p in upfront if self._patterns[p][0] == field]
+            if pids:
+                regex = re.compile(''.join(
+                    f"(?:(?=[\\s\\S]*?{_scoped_regex(self._patterns[p][1].pattern)})(?P<p{p}>))?" for p in pids))
+                self._combined[field] = (regex, [(p, regex.groupindex[f"p{p}"]) for p in pids])
+
+    @property
+    def label_keys(self):
+        """Label keys any rule (or dependency discovery) looks at"""
+        keys = {key for key, _ in self._labels} | set(self._label_keys)
+        if self.dependencies is not None:
+            keys |= self.dependencies.label_keys
+        return keys
+
+    def _all_patterns(self, selector):
+        while selector is not None:
+            yield from self._selectors[selector].patterns
+            selector = self._selectors[selector].negation
+
+    def _new_atom(self, selector, index, keys):
+        atom = self._atom_count
+        self._atom_count += 1
+        for key in keys:
+            index[key].append(atom)
+        self._selectors[selector].atoms.append(atom)
+
+    def _compile_endpoint(self, spec):
+        # Fixed diagram nodes such as "internet" are not matched against containers
+        if 'node' in spec:
+            return spec['node']
+        return self._compile_root(spec)
+
+    def _compile_root(self, spec):
+        selector = self._compile_selector(spec)
+        if self._selectors[selector].atoms:
+            for atom in self._selectors[selector].atoms:
+                self._root_selectors[atom].append(selector)
+        else:
+            self._unindexed.append(selector)
+        return selector
+
+    def _compile_selector(self, spec):
+        unknown = set(spec) - MATCH_KEYS
+        if unknown:
+            raise ValueError(f"unknown match keys: {', '.join(sorted(unknown))}")
+
+        selector = len(self._selectors)
+        self._selectors.append(_Selector())
+        if 'name' in spec:
+            self._new_atom(selector, self._names, _as_list(spec['name']))
+        if 'image' in spec:
+            self._new_atom(selector, self._images, [_image_repository(i) for i in _as_list(spec['image'])])
+        if 'network' in spec:
+            self._new_atom(selector, self._networks, _as_list(spec['network']))
+        for key, value in spec.get('label', {}).items():
+            if value is None:
+                self._new_atom(selector, self._label_keys, [key])
+            else:
+                self._new_atom(selector, self._labels, [(key, str(value))])
+        for field in ('name', 'image'):
+            if f'{field}_regex' in spec:
+                key = (field, spec[f'{field}_regex'])
+                if key not in self._pattern_ids:
+                    self._pattern_ids[key] = len(self._patterns)
+                    self._patterns.append((field, re.compile(key[1])))
+                self._selectors[selector].patterns.append(self._pattern_ids[key])
+
+        if 'not' in spec:
+            self._selectors[selector].negation = self._compile_selector(spec['not'])
+        return selector
+
+    def _matching_selectors(self, container):
+        """Endpoint selectors matched by one container"""
+        # Index atoms first: plain dictionary lookups
+        atoms = set(self._names.get(container.name, ()))
+        atoms.update(self._images.get(_image_repository(container.image), ()))
+        for network in container.networks:
+            atoms.update(self._networks.get(network, ()))
+        for key, value in container.labels.items():
+            atoms.update(self._label_keys.get(key, ()))
+            atoms.update(self._labels.get((key, value), ()))
+
+        # Regex results: one combined call per field, the rest on demand
+        pattern_hits = {}
+        for field, (regex, groups) in self._combined.items():
+            values = regex.match(getattr(container, field)).groups()
+            for pid, group in groups:
+                pattern_hits[pid] = values[group - 1] is not None
+
+        def pattern_matches(pid):
+            if pid not in pattern_hits:
+                field, regex = self._patterns[pid]
+                pattern_hits[pid] = regex.search(getattr(container, field)) is not None
+            return pattern_hits[pid]
+
+        def matches(selector):
+            compiled = self._selectors[selector]
+            return (all(a in atoms for a in compiled.atoms)
+                    and all(pattern_matches(p) for p in compiled.patterns)
+                    and (compiled.negation is None or not matches(compiled.negation)))
+
+        candidates = set(self._unindexed)
+        for atom in atoms:
+            candidates.update(self._root_selectors.get(atom, ()))
+        return [s for s in candidates if matches(s)]
+
+    def evaluate(self, containers, node_id, fixed_node_id=None):
+        """Yield (source id, target id, rule) for every edge the rules produce
+
+        `fixed_node_id` maps fixed endpoints such as "internet" to diagram ids, e.g. per host.
+        """
+        # Single pass: bucket containers by every selector they match, in container order
+        buckets = defaultdict(list)
+        for container in containers:
+            for selector in self._matching_selectors(container):
+                buckets[selector].append(container)
+
+        def endpoints(endpoint):
+            if isinstance(endpoint, str):
+                return [(fixed_node_id(endpoint) if fixed_node_id else endpoint, None)]
+            return [(node_id(c), c.name) for c in buckets[endpoint]]
+
+        for rule, (source, target, requires) in zip(self.rules, self._rule_selectors):
+            if requires is not None and not buckets[requires]:
+                continue
+            targets = endpoints(target)
+            for source_id, source_name in endpoints(source):
+                for target_id, target_name in targets:
+                    if source_name is not None and source_name == target_name and not rule.allow_self:
+                        continue
+                    yield source_id, target_id, rule
+
+
+@lru_cache(maxsize=8)
+def _compile_file(path, mtime):
+    if path.suffix in ('.yaml', '.yml'):
+        if yaml is None:
+            raise ImportError(f"PyYAML is required to read {path} (pip install pyyaml)")
+        spec = yaml.safe_load(path.read_text())
+    else:
+        spec = json.loads(path.read_text())
+    return CompiledRules(spec.get('rules', []), spec.get('dependencies'))
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    """Load and compile a JSON/YAML rule file; recompiled only when the file changes"""
+    path = Path(path)
+    return _compile_file(path, path.stat().st_mtime_ns)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Container Categories and Styles
+Compiled, cached categorization of containers and precomputed draw.io style strings
+"""
+
+import json
+import re
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+
+NodeStyle = namedtuple('NodeStyle', ['shape', 'fill_color', 'stroke_color', 'style'])
+
+DEFAULT_CATEGORY = 'service'
+
+# (category, field, substrings) - the first rule with a substring in the field wins
+DEFAULT_CATEGORY_RULES = (
+    ('database', 'image', ('postgres', 'mysql', 'mongo', 'redis')),
+    ('proxy', 'image', ('nginx', 'traefik', 'haproxy')),
+    ('auth', 'name', ('keycloak', 'auth', 'oauth')),
+    ('frontend', 'name', ('ui', 'frontend', 'webui')),
+    ('backend', 'name', ('api', 'backend')),
+    ('admin', 'name', ('admin', 'pgadmin')),
+)
+
+# category -> (shape, fillColor, strokeColor)
+DEFAULT_STYLES = {
+    'database': ('cylinder', '#FFE6CC', '#D79B00'),
+    'proxy': ('hexagon', '#E6F3FF', '#0066CC'),
+    'auth': ('rectangle', '#FFE6F2', '#CC0066'),
+    'frontend': ('rectangle', '#E6FFE6', '#00CC00'),
+    'backend': ('rectangle', '#F0E6FF', '#6600CC'),
+    'admin': ('rectangle', '#FFFFE6', '#CCCC00'),
+    'service': ('rectangle', '#F5F5F5', '#666666'),
+}
+
+# Legend entries in display order: (label, category)
+LEGEND = (
+    ("Database", 'database'),
+    ("Proxy/LB", 'proxy'),
+    ("Auth", 'auth'),
+    ("Frontend", 'frontend'),
+    ("Backend", 'backend'),
+    ("Admin", 'admin'),
+)
+
+CATEGORY_CACHE_SIZE = 8192
+
+
+def node_style(shape, fill_color, stroke_color):
+    """Build the draw.io style string for a container shape once"""
+    if shape in ('cylinder', 'hexagon'):
+        style = f"shape={shape};whiteSpace=wrap;html=1;fillColor={fill_color};strokeColor={stroke_color};"
+    else:
+        style = f"rounded=1;whiteSpace=wrap;html=1;fillColor={fill_color};strokeColor={stroke_color};"
+    return NodeStyle(shape, fill_color, stroke_color, style)
+
+
+class Categorizer:
+    """Maps (image, name) to a category and its precomputed style"""
+
+    def __init__(self, rules=DEFAULT_CATEGORY_RULES, image_prefixes=None, styles=None):
+        # Image prefixes are matched first, longest prefix wins
+        self.image_prefixes = tuple(sorted((image_prefixes or {}).items(), key=lambda p: -len(p[0])))
+        # One case-insensitive alternation per rule instead of a chain of `in` tests
+        self.rules = tuple(
+            (category, field, re.compile('|'.join(re.escape(s) for s in substrings), re.IGNORECASE))
+            for category, field, substrings in rules
+        )
+
+        table = {category: node_style(*spec) for category, spec in DEFAULT_STYLES.items()}
+        for category, spec in (styles or {}).items():
+            table[category] = node_style(spec.get('shape', 'rectangle'), spec['fillColor'], spec['strokeColor'])
+        self.styles = MappingProxyType(table)
+
+        # Per-instance LRU; the instance outlives a single render in watch mode
+        self.categorize = lru_cache(maxsize=CATEGORY_CACHE_SIZE)(self._categorize)
+
+    def _categorize(self, image, name):
+        """Category for a container image and name"""
+        for prefix, category in self.image_prefixes:
+            if image.startswith(prefix):
+                return category
+        values = {'image': image, 'name': name}
+        for category, field, pattern in self.rules:
+            if pattern.search(values[field]):
+                return category
+        return DEFAULT_CATEGORY
+
+    def style_for(self, category):
+        return self.styles.get(category, self.styles[DEFAULT_CATEGORY])
+
+
+DEFAULT_CATEGORIZER = Categorizer()
+
+
+@lru_cache(maxsize=8)
+def _load_file(path, mtime):
+    spec = json.loads(path.read_text())
+    rules = tuple(
+        (rule['category'], rule.get('field', 'name'), tuple(rule['contains']))
+        for rule in spec.get('rules', ())
+    ) or DEFAULT_CATEGORY_RULES
+    return Categorizer(rules, spec.get('image_prefixes'), spec.get('styles'))
+
+
+def load_categorizer(path=None):
+    """Categorizer from a JSON config file, or the built-in one; reused until the file changes"""
+    if not path:
+        return DEFAULT_CATEGORIZER
+    path = Path(path)
+    return _load_file(path, path.stat().st_mtime_ns)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Dependency Discovery
+Infers service dependencies from what a bulk scan already returns: Docker Compose labels,
+the depends_on of the compose files those labels point to, and hostnames referenced by
+container environment variables
+"""
+
+import json
+import re
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:  # PyYAML is only needed to read compose files; labels and env work without it
+    yaml = None
+
+COMPOSE_PROJECT = "com.docker.compose.project"
+COMPOSE_SERVICE = "com.docker.compose.service"
+COMPOSE_DEPENDS_ON = "com.docker.compose.depends_on"
+COMPOSE_CONFIG_FILES = "com.docker.compose.project.config_files"
+COMPOSE_WORKING_DIR = "com.docker.compose.project.working_dir"
+
+# Container labels dependency discovery reads; the scanner must keep them
+COMPOSE_LABEL_KEYS = {COMPOSE_PROJECT, COMPOSE_SERVICE, COMPOSE_DEPENDS_ON, COMPOSE_CONFIG_FILES, COMPOSE_WORKING_DIR}
+
+# Keys of the rule file's "dependencies" section and of each kind in it
+DEPENDENCY_KINDS = ('compose', 'environment')
+KIND_KEYS = {'label', 'style', 'files'}
+
+# Hostnames in environment values: URL hosts (scheme://[user@]host), host:port pairs, and
+# the whole value of variables named like *_HOST or *_ADDR
+_URL_HOST = re.compile(r'[A-Za-z][\w+.-]*://(?:[^@/\s]*@)?([^:/?#\s,;@]+)')
+_HOST_PORT = re.compile(r'(?:^|(?<=[\s,;=/@]))([A-Za-z][\w.-]*):\d{1,5}(?=$|[\s,;/])')
+_HOST_VARIABLE = re.compile(r'.*(?:HOST|HOSTNAME|HOSTS|SERVER|SERVERS|ADDR|ADDRESS|ENDPOINT|BROKERS?)', re.I)
+# Container names and compose service aliases; dotted names are external or IP addresses
+_HOSTNAME = re.compile(r'[A-Za-z][\w-]*')
+_NOT_CONTAINERS = {'localhost'}
+
+# What a malformed or unreadable compose file raises
+_COMPOSE_ERRORS = (OSError, ValueError, AttributeError, TypeError) + ((yaml.YAMLError,) if yaml else ())
+
+DependencyKind = namedtuple('DependencyKind', ['name', 'label', 'style'])
+
+_warned = set()
+
+
+def _warn_once(message):
+    if message not in _warned:
+        _warned.add(message)
+        print(f"⚠️  {message}")
+
+
+def env_host_references(env):
+    """Sorted hostnames that `KEY=value` environment entries refer to, for Container.env_hosts
+
+    Only the names are kept, never the values they came from (which may hold credentials).
+    """
+    hosts = set()
+    for entry in env:
+        key, _, value = entry.partition('=')
+        if not value:
+            continue
+        hosts.update(_URL_HOST.findall(value))
+        hosts.update(_HOST_PORT.findall(value))
+        if _HOST_VARIABLE.fullmatch(key):
+            for item in re.split(r'[\s,;]+', value):
+                if '/' in item:
+                    continue
+                hosts.add(item.rsplit(':', 1)[0] if item.count(':') == 1 else item)
+    return tuple(sorted(h for h in hosts if _HOSTNAME.fullmatch(h) and h.lower() not in _NOT_CONTAINERS))
+
+
+@lru_cache(maxsize=256)
+def _parse_compose_file(path, mtime):
+    """{service: [services it depends on]} of one compose file; re-read only when it changes"""
+    if path.suffix == '.json':
+        spec = json.loads(path.read_text())
+    elif yaml is None:
+        raise ImportError(f"PyYAML is required to read {path} (pip install pyyaml)")
+    else:
+        spec = yaml.safe_load(path.read_text())
+    services = (spec or {}).get('services') or {}
+    dependencies = {}
+    for name, service in services.items():
+        # depends_on is a list of names, or a mapping of names to conditions
+        depends_on = (service or {}).get('depends_on') or ()
+        dependencies[name] = list(depends_on)
+    return dependencies
+
+
+def compose_file_dependencies(path):
+    """_parse_compose_file() for a path, or {} if it cannot be read here"""
+    path = Path(path)
+    try:
+        return _parse_compose_file(path, path.stat().st_mtime_ns)
+    except FileNotFoundError:
+        # Compose files live on the Docker host; rendering elsewhere only has the labels
+        return {}
+    except ImportError as e:
+        _warn_once(str(e))
+    except _COMPOSE_ERRORS as e:
+        _warn_once(f"Could not read compose file {path}: {e}")
+    return {}
+
+
+def _label_dependencies(value):
+    # Compose v2 records depends_on itself: "db:service_started:false,cache:service_healthy:true"
+    return [item.split(':', 1)[0] for item in value.split(',') if item]
+
+
+def _shares_network(container, other):
+    return not set(container.networks).isdisjoint(other.networks)
+
+
+class DependencyRules:
+    """Dependency discovery configured by the "dependencies" section of a connection rule file
+
+    Each kind present in the section is enabled and drawn with its own label and style:
+
+        "dependencies": {
+          "compose": {"label": "depends on", "style": "...", "files": true},
+          "environment": {"label": "uses", "style": "..."}
+        }
+    """
+
+    def __init__(self, spec):
+        unknown = set(spec) - set(DEPENDENCY_KINDS)
+        if unknown:
+            raise ValueError(f"unknown dependency kinds: {', '.join(sorted(unknown))}")
+        self.kinds = {}
+        for name, options in spec.items():
+            if options is False:
+                continue
+            options = options if isinstance(options, dict) else {}
+            unknown = set(options) - KIND_KEYS
+            if unknown:
+                raise ValueError(f"dependency kind '{name}': unknown keys: {', '.join(sorted(unknown))}")
+            self.kinds[name] = DependencyKind(name, options.get('label', ''), options.get('style', ''))
+        # Read depends_on from the compose files of projects whose labels do not carry it
+        self.read_files = (spec.get('compose') or {}).get('files', True) if 'compose' in self.kinds else False
+
+    @property
+    def label_keys(self):
+        return set(COMPOSE_LABEL_KEYS) if 'compose' in self.kinds else set()
+
+    def evaluate(self, containers, node_id):
+        """Yield (source id, target id, kind) for every dependency between `containers`
+
+        A dependency found by several kinds is drawn once, by the first of them.
+        """
+        seen = set()
+        for kind, edges in (('compose', self._compose_edges), ('environment', self._environment_edges)):
+            if kind not in self.kinds:
+                continue
+            for source, target in edges(containers):
+                if source is target or (source.name, target.name) in seen:
+                    continue
+                seen.add((source.name, target.name))
+                yield node_id(source), node_id(target), self.kinds[kind]
+
+    def _compose_edges(self, containers):
+        services = defaultdict(list)
+        projects = defaultdict(list)
+        for container in containers:
+            project = container.labels.get(COMPOSE_PROJECT)
+            service = container.labels.get(COMPOSE_SERVICE)
+            if project and service:
+                services[project, service].append(container)
+                projects[project].append(container)
+
+        for project, members in projects.items():
+            from_files = None
+            for container in members:
+                labels = container.labels
+                if COMPOSE_DEPENDS_ON in labels:
+                    depends_on = _label_dependencies(labels[COMPOSE_DEPENDS_ON])
+                else:
+                    if from_files is None:
+                        from_files = self._project_file_dependencies(members)
+                    depends_on = from_files.get(labels[COMPOSE_SERVICE], ())
+                for dependency in depends_on:
+                    for target in services.get((project, dependency), ()):
+                        yield container, target
+
+    def compose_files(self, containers):
+        """Compose files dependency discovery may read for `containers`, in first-seen order"""
+        if not self.read_files:
+            return []
+        paths = {}
+        for container in containers:
+            # Files are paths on the Docker host: only readable for the local daemon
+            if container.host is not None:
+                continue
+            working_dir = container.labels.get(COMPOSE_WORKING_DIR, '')
+            for name in container.labels.get(COMPOSE_CONFIG_FILES, '').split(','):
+                if name:
+                    paths.setdefault(Path(working_dir, name), None)
+        return list(paths)
+
+    def _project_file_dependencies(self, members):
+        """Merged depends_on of every compose file a project's containers were started from"""
+        dependencies = defaultdict(list)
+        for path in self.compose_files(members):
+            for service, depends_on in compose_file_dependencies(path).items():
+                dependencies[service].extend(d for d in depends_on if d not in dependencies[service])
+        return dependencies
+
+    def _environment_edges(self, containers):
+        # Docker DNS resolves container names on shared networks. Compose service names do
+        # too, but the same service name in several projects on one network is ambiguous,
+        # so they are only resolved within the referring container's own project
+        by_name = {}
+        by_service = defaultdict(list)
+        for container in containers:
+            by_name[container.name] = container
+            project = container.labels.get(COMPOSE_PROJECT)
+            service = container.labels.get(COMPOSE_SERVICE)
+            if project and service:
+                by_service[project, service].append(container)
+
+        for container in containers:
+            project = container.labels.get(COMPOSE_PROJECT)
+            for host in container.env_hosts:
+                target = by_name.get(host)
+                if target is not None:
+                    targets = [target]
+                else:
+                    targets = by_service.get((project, host), ()) if project else ()
+                for target in targets:
+                    if _shares_network(container, target):
+                        yield container, target
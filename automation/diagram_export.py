@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Diagram Export
+Renders draw.io pages to standalone SVG (and PNG) previews plus a static HTML viewer,
+without a browser: shapes, labels and links are drawn straight from the mxGraph model
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    import cairosvg
+except ImportError:  # cairosvg is optional, only needed for PNG export
+    cairosvg = None
+
+from diagram_merge import parse_pages
+from history_store import diagram_digest
+
+EXPORT_FORMATS = ('svg', 'png')
+MANIFEST_NAME = "export.json"
+VIEWER_NAME = "index.html"
+DIAGRAM_NAME = "infrastructure.drawio"
+
+# Bump when rendering changes, so cached exports are redrawn
+RENDERER_VERSION = 2
+
+# draw.io defaults for styles that leave them out
+DEFAULT_FONT_SIZE = 12
+ROUNDING_FACTOR = 0.15
+PAGE_MARGIN = 20
+# Average glyph width as a share of the font size, for wrapping labels without font metrics
+CHAR_WIDTH = 0.6
+LINE_HEIGHT = 1.2
+PNG_SCALE = 1.0
+
+_PAGE_LINK = re.compile(r'data:page/id,(.+)')
+_LINE_BREAK = re.compile(r'<br\s*/?>|</div>|</p>', re.IGNORECASE)
+_TAG = re.compile(r'<[^>]+>')
+
+
+def parse_formats(spec):
+    """Export formats from a comma-separated list; ValueError or ImportError if one cannot be produced"""
+    formats = tuple(dict.fromkeys(f.strip() for f in spec.split(',') if f.strip()))
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown or not formats:
+        raise ValueError(f"export formats must be among {', '.join(EXPORT_FORMATS)}, got {spec!r}")
+    if 'png' in formats and cairosvg is None:
+        raise ImportError("cairosvg is required for PNG export (pip install cairosvg)")
+    return formats
+
+
+def parse_style(style):
+    """draw.io style string as a dict; a bare leading token such as `ellipse` names the shape"""
+    values = {}
+    for item in (style or '').split(';'):
+        if not item:
+            continue
+        key, sep, value = item.partition('=')
+        if sep:
+            values[key] = value
+        else:
+            values.setdefault('shape', key)
+    return values
+
+
+def label_lines(label, style):
+    """Plain text lines of a (possibly HTML) label"""
+    if style.get('html') == '1':
+        label = html.unescape(_TAG.sub('', _LINE_BREAK.sub('\n', label)))
+    return label.split('\n')
+
+
+def wrap(lines, width, font_size):
+    """Greedy word wrap to the given pixel width"""
+    limit = max(1, int(width / (font_size * CHAR_WIDTH)))
+    wrapped = []
+    for line in lines:
+        current = ''
+        for word in line.split(' '):
+            if current and len(current) + 1 + len(word) > limit:
+                wrapped.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        wrapped.append(current)
+    return wrapped
+
+
+def _number(value):
+    # Short, stable coordinates: 12.0 -> 12, 12.3456 -> 12.35
+    return f"{round(value, 2):g}"
+
+
+def _shape_svg(shape, x, y, w, h, style, attributes):
+    """SVG element for a vertex outline"""
+    n = _number
+    if shape == 'ellipse':
+        return f'<ellipse cx="{n(x + w / 2)}" cy="{n(y + h / 2)}" rx="{n(w / 2)}" ry="{n(h / 2)}"{attributes}/>'
+    if shape == 'hexagon':
+        points = [(x + w / 4, y), (x + w * 3 / 4, y), (x + w, y + h / 2), (x + w * 3 / 4, y + h), (x + w / 4, y + h),
+                  (x, y + h / 2)]
+        return f'<polygon points="{" ".join(f"{n(px)},{n(py)}" for px, py in points)}"{attributes}/>'
+    if shape == 'cylinder':
+        dy = min(15, h / 5)
+        body = (f"M{n(x)},{n(y + dy)} C{n(x)},{n(y - dy / 3)} {n(x + w)},{n(y - dy / 3)} {n(x + w)},{n(y + dy)} "
+                f"L{n(x + w)},{n(y + h - dy)} C{n(x + w)},{n(y + h + dy / 3)} {n(x)},{n(y + h + dy / 3)} "
+                f"{n(x)},{n(y + h - dy)} Z")
+        rim = f"M{n(x)},{n(y + dy)} C{n(x)},{n(y + 2 * dy)} {n(x + w)},{n(y + 2 * dy)} {n(x + w)},{n(y + dy)}"
+        rim_attributes = re.sub(r' fill="[^"]*"', ' fill="none"', attributes)
+        return f'<path d="{body}"{attributes}/><path d="{rim}"{rim_attributes}/>'
+    if shape == 'cloud':
+        # mxGraph's cloud outline, in fractions of the bounds
+        curves = [(0.25, 0.25), (0.05, 0.25, 0, 0.5, 0.16, 0.55), (0, 0.66, 0.18, 0.9, 0.31, 0.8),
+                  (0.4, 1, 0.7, 1, 0.8, 0.8), (1, 0.8, 1, 0.6, 0.875, 0.5), (1, 0.3, 0.8, 0.1, 0.625, 0.2),
+                  (0.5, 0.05, 0.3, 0.05, 0.25, 0.25)]
+        start, *rest = curves
+        d = f"M{n(x + start[0] * w)},{n(y + start[1] * h)} " + ' '.join(
+            'C' + ' '.join(f"{n(x + c[i] * w)},{n(y + c[i + 1] * h)}" for i in (0, 2, 4)) for c in rest) + ' Z'
+        return f'<path d="{d}"{attributes}/>'
+    rounding = f' rx="{n(min(w, h) * ROUNDING_FACTOR)}"' if style.get('rounded') == '1' else ''
+    return f'<rect x="{n(x)}" y="{n(y)}" width="{n(w)}" height="{n(h)}"{rounding}{attributes}/>'
+
+
+def _stroke_attributes(style, default_stroke='#000000', fill=None):
+    attributes = f' fill="{fill if fill is not None else style.get("fillColor", "#FFFFFF")}"'
+    attributes += f' stroke="{style.get("strokeColor", default_stroke)}"'
+    if style.get('strokeWidth', '1') != '1':
+        attributes += f' stroke-width="{style["strokeWidth"]}"'
+    if style.get('dashed') == '1':
+        attributes += f' stroke-dasharray="{style.get("dashPattern", "3 3")}"'
+    if 'opacity' in style:
+        attributes += f' opacity="{float(style["opacity"]) / 100:g}"'
+    return attributes
+
+
+def _text_svg(lines, cx, cy, style, background=False):
+    """Centered multi-line text, optionally on a white box (edge labels)"""
+    if not any(lines):
+        return ''
+    size = float(style.get('fontSize', DEFAULT_FONT_SIZE))
+    weight = ' font-weight="bold"' if int(style.get('fontStyle', 0)) & 1 else ''
+    color = style.get('fontColor', '#000000')
+    top = cy - (len(lines) - 1) * size * LINE_HEIGHT / 2
+    parts = []
+    if background:
+        width = max(len(line) for line in lines) * size * CHAR_WIDTH + 4
+        height = len(lines) * size * LINE_HEIGHT
+        parts.append(f'<rect x="{_number(cx - width / 2)}" y="{_number(cy - height / 2)}" width="{_number(width)}" '
+                     f'height="{_number(height)}" fill="#FFFFFF"/>')
+    spans = ''.join(f'<tspan x="{_number(cx)}" y="{_number(top + i * size * LINE_HEIGHT)}">{escape(line)}</tspan>'
+                    for i, line in enumerate(lines))
+    parts.append(f'<text font-size="{size:g}" fill="{color}"{weight} text-anchor="middle" '
+                 f'dominant-baseline="central">{spans}</text>')
+    return ''.join(parts)
+
+
+def _clip(bounds, toward):
+    """Point where the line from the centre of `bounds` to `toward` leaves the box"""
+    x, y, w, h = bounds
+    cx, cy = x + w / 2, y + h / 2
+    dx, dy = toward[0] - cx, toward[1] - cy
+    if not dx and not dy:
+        return cx, cy
+    scale = min(w / 2 / abs(dx) if dx else float('inf'), h / 2 / abs(dy) if dy else float('inf'))
+    return cx + dx * scale, cy + dy * scale
+
+
+def _cells(model):
+    """(id, attributes holder, mxCell) of each top-level cell in a page's <root>"""
+    for cell in model.find('root'):
+        mx_cell = cell if cell.tag == 'mxCell' else cell.find('mxCell')
+        if mx_cell is not None:
+            yield cell.get('id'), cell, mx_cell
+
+
+def _label(cell, mx_cell):
+    return (cell.get('value') if cell is mx_cell else cell.get('label')) or ''
+
+
+def _href(link, page_files):
+    match = _PAGE_LINK.fullmatch(link)
+    if match:
+        target = page_files.get(match.group(1))
+        return f"{VIEWER_NAME}#{target}" if target else None
+    return link
+
+
+def render_svg(model, page_files=None):
+    """Standalone SVG of one page's mxGraphModel element
+
+    Page links (see drawio_writer.page_link) point into the viewer; `page_files` maps page
+    ids to the file stems they were exported as. Edges are drawn as straight connectors.
+    """
+    page_files = page_files or {}
+    bounds = {}
+    vertices = []
+    edges = []
+    for cell_id, cell, mx_cell in _cells(model):
+        geometry = mx_cell.find('mxGeometry')
+        if mx_cell.get('vertex') == '1' and geometry is not None:
+            box = tuple(float(geometry.get(key, 0)) for key in ('x', 'y', 'width', 'height'))
+            bounds[cell_id] = box
+            vertices.append((cell, mx_cell, box))
+        elif mx_cell.get('edge') == '1':
+            edges.append((cell, mx_cell))
+
+    if bounds:
+        left = min(x for x, _, _, _ in bounds.values()) - PAGE_MARGIN
+        top = min(y for _, y, _, _ in bounds.values()) - PAGE_MARGIN
+        right = max(x + w for x, _, w, _ in bounds.values()) + PAGE_MARGIN
+        bottom = max(y + h for _, y, _, h in bounds.values()) + PAGE_MARGIN
+    else:
+        left = top = 0
+        right = bottom = 2 * PAGE_MARGIN
+    width, height = right - left, bottom - top
+
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+           f'width="{_number(width)}" height="{_number(height)}" '
+           f'viewBox="{_number(left)} {_number(top)} {_number(width)} {_number(height)}" '
+           f'font-family="Helvetica, Arial, sans-serif">',
+           '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" '
+           'orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10 z" fill="context-stroke"/></marker></defs>',
+           f'<rect x="{_number(left)}" y="{_number(top)}" width="{_number(width)}" height="{_number(height)}" '
+           f'fill="#FFFFFF"/>']
+
+    # Document order is draw.io's z-order: network boxes first, containers on top of them
+    for cell, mx_cell, (x, y, w, h) in vertices:
+        style = parse_style(mx_cell.get('style'))
+        shape = style.get('shape', 'rectangle')
+        parts = [_shape_svg(shape, x, y, w, h, style, _stroke_attributes(style))]
+        font_size = float(style.get('fontSize', DEFAULT_FONT_SIZE))
+        lines = label_lines(_label(cell, mx_cell), style)
+        if style.get('whiteSpace') == 'wrap':
+            lines = wrap(lines, w - 8, font_size)
+        if style.get('verticalAlign') == 'top':
+            cy = y + 4 + (len(lines) * font_size * LINE_HEIGHT) / 2
+        else:
+            cy = y + h / 2
+        parts.append(_text_svg(lines, x + w / 2, cy, style))
+        href = _href(cell.get('link', ''), page_files) if cell.get('link') else None
+        if href:
+            out.append(f'<a xlink:href={quoteattr(href)} target="_top">{"".join(parts)}</a>')
+        else:
+            out.append(''.join(parts))
+
+    for cell, mx_cell in edges:
+        source, target = bounds.get(mx_cell.get('source')), bounds.get(mx_cell.get('target'))
+        if source is None or target is None:
+            continue
+        style = parse_style(mx_cell.get('style'))
+        centre = lambda box: (box[0] + box[2] / 2, box[1] + box[3] / 2)
+        x1, y1 = _clip(source, centre(target))
+        x2, y2 = _clip(target, centre(source))
+        marker = '' if style.get('endArrow') == 'none' else ' marker-end="url(#arrow)"'
+        out.append(f'<line x1="{_number(x1)}" y1="{_number(y1)}" x2="{_number(x2)}" y2="{_number(y2)}"'
+                   f'{_stroke_attributes(style, fill="none")}{marker}/>')
+        lines = label_lines(_label(cell, mx_cell), style)
+        out.append(_text_svg(lines, (x1 + x2) / 2, (y1 + y2) / 2, dict(style, fontSize=style.get('fontSize', '11')),
+                             background=True))
+
+    out.append('</svg>\n')
+    return '\n'.join(part for part in out if part)
+
+
+def _write_atomic(path, data):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def _export_page(model_xml, stem, export_dir, formats, page_files):
+    """Render one page to `stem`.svg/.png in `export_dir`; returns the file names written"""
+    svg = render_svg(ET.fromstring(model_xml), page_files).encode()
+    files = {}
+    if 'svg' in formats:
+        _write_atomic(export_dir / f"{stem}.svg", svg)
+        files['svg'] = f"{stem}.svg"
+    if 'png' in formats:
+        _write_atomic(export_dir / f"{stem}.png", cairosvg.svg2png(bytestring=svg, scale=PNG_SCALE))
+        files['png'] = f"{stem}.png"
+    return files
+
+
+def page_stem(name, taken):
+    """File name stem for a page: lowercase name with runs of other characters as dashes, made unique"""
+    stem = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'page'
+    candidate, suffix = stem, 2
+    while candidate in taken:
+        candidate = f"{stem}-{suffix}"
+        suffix += 1
+    taken.add(candidate)
+    return candidate
+
+
+def load_manifest(export_dir):
+    try:
+        return json.loads((Path(export_dir) / MANIFEST_NAME).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _has_files(page, formats, export_dir):
+    return all(fmt in page['files'] and (export_dir / page['files'][fmt]).exists() for fmt in formats)
+
+
+def _is_current(entry, previous, formats, export_dir):
+    # A page is kept when the same content was exported to every wanted format before
+    return previous is not None and previous['digest'] == entry['digest'] and _has_files(previous, formats, export_dir)
+
+
+def export_diagram(data, export_dir, formats=('svg',), workers=None, title="Infrastructure"):
+    """Export every page of a serialized diagram into `export_dir` with a viewer; returns files written
+
+    Nothing is written when the diagram (ignoring its render timestamp) was already exported
+    in these formats; otherwise only pages whose content changed are rendered again.
+    """
+    formats = parse_formats(','.join(formats))
+    export_dir = Path(export_dir)
+    digest = diagram_digest(data)
+    manifest = load_manifest(export_dir)
+    previous_pages = {}
+    if manifest and manifest.get('renderer') == RENDERER_VERSION:
+        previous_pages = {page['stem']: page for page in manifest['pages']}
+        if (manifest.get('diagram') == digest and set(formats) <= set(manifest.get('formats', ()))
+                and all(_has_files(page, formats, export_dir) for page in manifest['pages'])):
+            return []
+
+    _, pages = parse_pages(data)
+    taken = set()
+    entries = []
+    for page in pages.values():
+        model_xml = ET.tostring(page.model, encoding='unicode')
+        entries.append({'name': page.name, 'id': page.diagram.get('id'), 'stem': page_stem(page.name, taken),
+                        'digest': hashlib.sha256(model_xml.encode()).hexdigest(), 'model': model_xml})
+    page_files = {entry['id']: entry['stem'] for entry in entries}
+    # Links between pages are part of a page's content; a renamed target page redraws it
+    links_digest = hashlib.sha256(json.dumps(page_files, sort_keys=True).encode()).hexdigest()
+    for entry in entries:
+        entry['digest'] = hashlib.sha256((entry['digest'] + links_digest).encode()).hexdigest()
+
+    export_dir.mkdir(parents=True, exist_ok=True)
+    stale = [e for e in entries if not _is_current(e, previous_pages.get(e['stem']), formats, export_dir)]
+    render = partial(_export_page, export_dir=export_dir, formats=tuple(formats), page_files=page_files)
+    workers = min(workers or os.cpu_count() or 1, len(stale))
+    jobs = ([e['model'] for e in stale], [e['stem'] for e in stale])
+    if workers <= 1:
+        results = list(map(render, *jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # A few chunks per worker keeps pickling overhead low and the pool evenly loaded
+            results = list(pool.map(render, *jobs, chunksize=max(1, len(stale) // (workers * 4))))
+    written = [export_dir / name for files in results for name in files.values()]
+    rendered = {e['stem']: files for e, files in zip(stale, results)}
+
+    for entry in entries:
+        del entry['model']
+        entry['files'] = rendered.get(entry['stem']) or {fmt: previous_pages[entry['stem']]['files'][fmt]
+                                                         for fmt in formats}
+
+    _write_atomic(export_dir / DIAGRAM_NAME, data)
+    _write_atomic(export_dir / VIEWER_NAME, viewer_html(entries, title).encode())
+    written += [export_dir / DIAGRAM_NAME, export_dir / VIEWER_NAME]
+
+    # Files of pages that no longer exist
+    current = {name for entry in entries for name in entry['files'].values()}
+    for page in previous_pages.values():
+        for name in page['files'].values():
+            if name not in current:
+                (export_dir / name).unlink(missing_ok=True)
+
+    # The manifest goes last: an interrupted export is redone in full next time
+    _write_atomic(export_dir / MANIFEST_NAME, json.dumps({
+        'renderer': RENDERER_VERSION,
+        'diagram': digest,
+        'formats': list(formats),
+        'pages': entries,
+    }, indent=1).encode())
+    written.append(export_dir / MANIFEST_NAME)
+    return written
+
+
+def mirror_export(export_dir, target_dir):
+    """Copy an export into another directory (e.g. a web root); returns the files written
+
+    Only pages whose digest changed are copied, stale pages are removed and the manifest
+    goes last, as in export_diagram().
+    """
+    export_dir, target_dir = Path(export_dir), Path(target_dir)
+    source = load_manifest(export_dir)
+    if source is None:
+        raise FileNotFoundError(f"No export in {export_dir}")
+    target = load_manifest(target_dir)
+    if target == source and all(_has_files(page, source['formats'], target_dir) for page in source['pages']):
+        return []
+    previous_pages = {}
+    if target and target.get('renderer') == source['renderer']:
+        previous_pages = {page['stem']: page for page in target['pages']}
+
+    target_dir.mkdir(parents=True, exist_ok=True)
+    names = [DIAGRAM_NAME, VIEWER_NAME]
+    for page in source['pages']:
+        previous = previous_pages.get(page['stem'])
+        for fmt, name in page['files'].items():
+            if (previous is None or previous['digest'] != page['digest'] or previous['files'].get(fmt) != name
+                    or not (target_dir / name).exists()):
+                names.append(name)
+    for name in names:
+        _write_atomic(target_dir / name, (export_dir / name).read_bytes())
+    written = [target_dir / name for name in names]
+
+    current = {name for page in source['pages'] for name in page['files'].values()}
+    for page in previous_pages.values():
+        for name in page['files'].values():
+            if name not in current:
+                (target_dir / name).unlink(missing_ok=True)
+
+    _write_atomic(target_dir / MANIFEST_NAME, (export_dir / MANIFEST_NAME).read_bytes())
+    written.append(target_dir / MANIFEST_NAME)
+    return written
+
+
+_VIEWER_STYLE = """
+body { margin: 0; font-family: Helvetica, Arial, sans-serif; display: flex; height: 100vh; }
+nav { width: 240px; overflow-y: auto; border-right: 1px solid #ddd; background: #fafafa; font-size: 14px; }
+nav h1 { font-size: 16px; margin: 12px; }
+nav a { display: block; padding: 4px 12px; color: #0066cc; text-decoration: none; }
+nav a.current { background: #e6f3ff; font-weight: bold; }
+nav .files { padding: 8px 12px; border-top: 1px solid #ddd; margin-top: 8px; }
+nav .files a { display: inline; padding: 0; }
+main { flex: 1; overflow: auto; }
+main object, main img { display: block; }
+main.fit object { width: 100%; height: 100%; }
+main.fit img { max-width: 100%; max-height: 100%; }
+"""
+
+_VIEWER_SCRIPT = """
+var pages = document.querySelectorAll('nav a[data-stem]');
+function show() {
+  if (!pages.length) return;
+  var stem = location.hash.slice(1) || pages[0].dataset.stem;
+  pages.forEach(function (a) {
+    if (a.dataset.stem === stem) {
+      a.className = 'current';
+      // SVG keeps page links clickable; PNG-only exports show the image instead
+      var svg = document.getElementById('page'), image = document.getElementById('image');
+      if (a.dataset.svg) {
+        svg.data = a.dataset.svg;
+      } else {
+        image.src = a.dataset.png;
+      }
+      svg.style.display = a.dataset.svg ? '' : 'none';
+      image.style.display = a.dataset.svg ? 'none' : '';
+      document.getElementById('png').href = a.dataset.png || '';
+      document.getElementById('png').style.display = a.dataset.png ? '' : 'none';
+      document.title = a.textContent;
+    } else {
+      a.className = '';
+    }
+  });
+}
+document.getElementById('fit').onclick = function () { document.querySelector('main').classList.toggle('fit'); };
+window.onhashchange = show;
+show();
+"""
+
+
+def viewer_html(pages, title="Infrastructure"):
+    """Static page-switching viewer over the exported SVGs (or PNGs); needs no network access"""
+    links = []
+    for page in pages:
+        attributes = f'href="#{page["stem"]}" data-stem="{page["stem"]}"'
+        for fmt, name in page['files'].items():
+            attributes += f' data-{fmt}="{name}"'
+        links.append(f'<a {attributes}>{escape(page["name"])}</a>\n')
+    links = ''.join(links)
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{escape(title)}</title>
+<style>{_VIEWER_STYLE}</style>
+</head>
+<body>
+<nav>
+<h1>{escape(title)}</h1>
+{links}<div class="files">
+<a id="fit" href="javascript:void(0)">Fit to window</a> &middot;
+<a id="png" href="" download>PNG</a><br>
+<a href="{DIAGRAM_NAME}" download>Download .drawio</a> to edit
+</div>
+</nav>
+<main class="fit"><object id="page" type="image/svg+xml"></object><img id="image" alt=""></main>
+<script>{_VIEWER_SCRIPT}</script>
+</body>
+</html>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a draw.io diagram to SVG/PNG pages and an HTML viewer")
+    parser.add_argument('diagram', help="a .drawio file, e.g. <output>/infrastructure_latest.drawio")
+    parser.add_argument('export_dir', help="directory for the pages, index.html and export.json")
+    parser.add_argument('--formats', default='svg', help="comma-separated: svg, png (default: svg)")
+    parser.add_argument('--workers', type=int, help="processes rendering pages (default: one per CPU)")
+    args = parser.parse_args()
+    try:
+        formats = parse_formats(args.formats)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+
+    written = export_diagram(Path(args.diagram).read_bytes(), args.export_dir, formats=formats, workers=args.workers)
+    print(f"Exported {len(written)} files to {args.export_dir}" if written else "Export is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Diagram Merge
+Carries manual edits from an existing diagram into a freshly generated one
+"""
+
+import binascii
+import re
+import xml.etree.ElementTree as ET
+import zlib
+
+from drawio_writer import compress_page, decompress_page
+
+# Cells the generator owns: container/network nodes (optionally host-qualified), the fixed
+# entry points, legend and page navigation, and links (N2G-style md5 ids). Any other id was
+# added by hand.
+_GENERATED_ID = re.compile(
+    r'(?:[^/]+/)?(?:container_.+|network_.+|legend_.+|nav_.+|internet|internal_network|host)'
+    r'|[0-9a-f]{32}|link_id:.+')
+
+# The two structural cells every draw.io page starts with
+_ROOT_CELLS = ('0', '1')
+
+
+def is_generated(cell_id):
+    return _GENERATED_ID.fullmatch(cell_id) is not None
+
+
+class Page:
+    """One diagram page: its <diagram> element and an id -> cell index over its model"""
+
+    def __init__(self, diagram):
+        self.diagram = diagram
+        if len(diagram):
+            self.model = diagram.find('mxGraphModel')
+        else:
+            # Compressed page: the model is deflated text inside <diagram>
+            self.model = ET.fromstring(decompress_page(diagram.text.strip()))
+        self.root = self.model.find('root')
+        # Top-level children are <mxCell> or <object>/<UserObject> wrapping one
+        self.cells = {cell.get('id'): cell for cell in self.root}
+
+    @property
+    def name(self):
+        return self.diagram.get('name') or self.diagram.get('id')
+
+
+def parse_pages(data):
+    """(mxfile element, {page name: Page}) of a serialized diagram; ValueError if it cannot be read"""
+    try:
+        mxfile = ET.fromstring(data)
+        pages = {}
+        for diagram in mxfile.iter('diagram'):
+            page = Page(diagram)
+            pages.setdefault(page.name, page)
+    except (ET.ParseError, binascii.Error, zlib.error, AttributeError) as e:
+        raise ValueError(f"not a readable draw.io diagram: {e}") from e
+    return mxfile, pages
+
+
+def _mx_cell(cell):
+    return cell if cell.tag == 'mxCell' else cell.find('mxCell')
+
+
+def _label_attribute(cell):
+    # draw.io stores the label as `value` on bare cells and `label` on <object> wrappers
+    return 'value' if cell.tag == 'mxCell' else 'label'
+
+
+def _shape(element):
+    # Comparable form of an element tree; much cheaper than serializing it
+    return element.tag, sorted(element.attrib.items()), [_shape(child) for child in element]
+
+
+def _geometry(cell):
+    geometry = _mx_cell(cell).find('mxGeometry')
+    return _shape(geometry) if geometry is not None else None
+
+
+def _aspects(cell):
+    """The parts of a cell a person edits: geometry, style and label"""
+    return {
+        'geometry': _geometry(cell),
+        'style': _mx_cell(cell).get('style'),
+        'label': cell.get(_label_attribute(cell)),
+    }
+
+
+def _merge_cell(edited, generated, base):
+    """The edited cell, with every aspect nobody touched by hand updated from the new render
+
+    Without a base (the previous render) every aspect except the label counts as edited.
+    """
+    mine, theirs = _aspects(edited), _aspects(generated)
+    original = _aspects(base) if base is not None else None
+    for aspect, value in theirs.items():
+        if original is not None:
+            keep = mine[aspect] != original[aspect]
+        else:
+            keep = aspect != 'label'
+        if keep or mine[aspect] == value:
+            continue
+        if aspect == 'geometry':
+            target = _mx_cell(edited)
+            old = target.find('mxGeometry')
+            if old is not None:
+                target.remove(old)
+            target.append(_mx_cell(generated).find('mxGeometry'))
+        elif aspect == 'style':
+            _mx_cell(edited).set('style', value)
+        else:
+            edited.set(_label_attribute(edited), value or '')
+    return edited
+
+
+def _references(cell):
+    mx_cell = _mx_cell(cell)
+    return [mx_cell.get(key) for key in ('source', 'target', 'parent') if mx_cell.get(key)]
+
+
+def merge_page(edited, generated, base=None):
+    """Cells of a regenerated page with the edits from the same page of an existing diagram
+
+    Generated cells that still exist keep their hand-made geometry, style and label; new
+    ones are added and gone ones dropped. Cells added by hand are kept in their place.
+    """
+    merged = {}
+    order = []
+    for cell_id, cell in generated.cells.items():
+        if cell_id in _ROOT_CELLS:
+            continue
+        previous = edited.cells.get(cell_id)
+        base_cell = base.cells.get(cell_id) if base is not None else None
+        merged[cell_id] = _merge_cell(previous, cell, base_cell) if previous is not None else cell
+        order.append(cell_id)
+
+    # Hand-made cells go back right after the cell they followed in the edited page
+    following = {}
+    anchor = None
+    for cell_id, cell in edited.cells.items():
+        if cell_id in _ROOT_CELLS:
+            continue
+        if cell_id in merged:
+            anchor = cell_id
+        elif not is_generated(cell_id):
+            following.setdefault(anchor, []).append(cell)
+
+    cells = [cell for cell_id, cell in edited.cells.items() if cell_id in _ROOT_CELLS]
+    cells += following.get(None, [])
+    for cell_id in order:
+        cells.append(merged[cell_id])
+        cells += following.get(cell_id, [])
+
+    # Hand-made links or children of a removed node would dangle
+    present = {cell.get('id') for cell in cells}
+    return [cell for cell in cells if all(ref in present for ref in _references(cell))]
+
+
+def merge_diagrams(edited_data, generated_data, base_data=None):
+    """Serialized diagram: `generated_data` with the manual edits found in `edited_data`
+
+    `base_data` is what was generated last time (the file before it was edited); with it,
+    only what actually differs from it counts as a manual edit, so untouched nodes follow
+    the new layout. Pages are matched by name.
+    """
+    mxfile, generated_pages = parse_pages(generated_data)
+    _, edited_pages = parse_pages(edited_data)
+    base_pages = parse_pages(base_data)[1] if base_data else None
+    compressed = mxfile.get('compressed') == 'true'
+
+    for name, page in generated_pages.items():
+        edited = edited_pages.get(name)
+        if edited is None:
+            continue
+        page.root[:] = merge_page(edited, page, base_pages.get(name) if base_pages else None)
+        if compressed:
+            page.diagram.text = compress_page(ET.tostring(page.model, encoding='unicode'))
+
+    # Pages added by hand survive; regenerated pages that no longer exist do not
+    for name, edited in edited_pages.items():
+        if name in generated_pages:
+            continue
+        if base_pages is not None:
+            hand_made = name not in base_pages
+        else:
+            hand_made = not all(is_generated(cell_id) for cell_id in edited.cells if cell_id not in _ROOT_CELLS)
+        if hand_made:
+            mxfile.append(edited.diagram)
+
+    return (ET.tostring(mxfile, encoding='unicode') + '\n').encode()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Diagram Service
+Resident HTTP service that keeps the inventory warm from Docker events and serves the
+current diagram on demand, with ETags, an LRU render cache and request coalescing
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from urllib.parse import parse_qsl, urlsplit
+
+DIAGRAM_PATH = "/infrastructure.drawio"
+STATUS_PATH = "/status"
+CONTENT_TYPE = "application/vnd.jgraph.mxfile"
+
+# Requests arriving before the first scan finishes wait this long before a 503
+READY_TIMEOUT = 30
+MAX_HEADER_LINES = 100
+KEEP_ALIVE_TIMEOUT = 15
+
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class RenderCache:
+    """Rendered diagrams by (fingerprint, inputs, options), least recently used evicted first"""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        data = self.entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        self.entries[key] = data
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'entries': len(self.entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                'misses': self.misses, 'bytes': sum(len(data) for data in self.entries.values())}
+
+
+def entity_tag(key):
+    """Weak ETag for a render key: the same inventory, input files and options give an equivalent diagram
+
+    Only the document's render timestamp differs between two renders of one key, so a
+    client's copy stays valid even after the cache evicted the bytes it was sent.
+    """
+    digest = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+    # Weak comparison: W/ prefixes are ignored on both sides
+    candidates = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return etag.removeprefix('W/') in candidates
+
+
+class DiagramService:
+    """Current inventory plus an on-demand, cached renderer behind a small HTTP/1.1 server
+
+    `render(inventory, **options)` returns serialized diagram bytes; it runs in a worker
+    thread so cached requests keep being answered while it works. `options` maps each
+    query parameter clients may pass to its allowed values, the first being the default.
+    `inputs(inventory)` digests the files a render reads besides the inventory (rules,
+    categories); it is part of every cache key and ETag, so editing them reaches clients.
+    """
+
+    def __init__(self, render, options, cache_size=8, warm=True, inputs=None):
+        self.render = render
+        self.options = options
+        self.inputs = inputs
+        self.cache = RenderCache(cache_size)
+        self.warm = warm
+        self.inventory = None
+        self.fingerprint = None
+        self.updated = None
+        self.renders = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._ready = None
+        self._loop = None
+
+    def default_options(self):
+        return tuple((name, values[0]) for name, values in self.options.items())
+
+    def parse_options(self, query):
+        """Normalized options tuple from a query string; ValueError for unknown names or values"""
+        requested = dict(parse_qsl(query, keep_blank_values=True))
+        unknown = set(requested) - set(self.options)
+        if unknown:
+            raise ValueError(f"unknown parameter {sorted(unknown)[0]!r}, expected {', '.join(self.options)}")
+        options = []
+        for name, values in self.options.items():
+            value = requested.get(name, values[0])
+            if value not in values:
+                raise ValueError(f"{name} must be one of {', '.join(v or '(empty)' for v in values)}")
+            options.append((name, value))
+        return tuple(options)
+
+    def update(self, inventory, fingerprint):
+        """Swap in a new inventory; must run on the event loop (see publish())"""
+        self.inventory = inventory
+        self.fingerprint = fingerprint
+        self.updated = time.time()
+        self._ready.set()
+        if self.warm:
+            # Render the default view straight away, so the first request after a change is a hit
+            asyncio.ensure_future(self.diagram(self.default_options()))
+
+    def publish(self, inventory, fingerprint):
+        """Thread-safe update(), for the watcher's on_change callback"""
+        self._loop.call_soon_threadsafe(self.update, inventory, fingerprint)
+
+    def key(self, options):
+        """Cache key of the current inventory rendered with `options`"""
+        inputs = self.inputs(self.inventory) if self.inputs is not None else None
+        return self.fingerprint, inputs, options
+
+    async def diagram(self, options):
+        """(etag, bytes) of the current inventory rendered with `options`
+
+        Concurrent requests for a key that is being rendered wait for that one render.
+        """
+        key = self.key(options)
+        etag = entity_tag(key)
+        data = self.cache.get(key)
+        if data is not None:
+            return etag, data
+        pending = self._inflight.get(key)
+        if pending is None:
+            # Its own task, so a requester going away does not cancel it for the others
+            pending = self._inflight[key] = asyncio.ensure_future(self._render(key, self.inventory))
+            pending.add_done_callback(_log_failure)
+        else:
+            self.coalesced += 1
+        return etag, await asyncio.shield(pending)
+
+    async def _render(self, key, inventory):
+        options = key[-1]
+        try:
+            data = await self._loop.run_in_executor(None, lambda: self.render(inventory, **dict(options)))
+        finally:
+            del self._inflight[key]
+        self.renders += 1
+        self.cache.put(key, data)
+        return data
+
+    def status(self):
+        inventory = self.inventory
+        return {
+            'ready': inventory is not None,
+            'fingerprint': self.fingerprint,
+            'updated': formatdate(self.updated, usegmt=True) if self.updated else None,
+            'containers': len(inventory.containers) if inventory else None,
+            'networks': len(inventory.networks) if inventory else None,
+            'volumes': len(inventory.volumes) if inventory else None,
+            'renders': self.renders,
+            'coalesced': self.coalesced,
+            'cache': self.cache.stats(),
+        }
+
+    async def start(self, host, port):
+        """Bind to the running loop and start listening; returns the asyncio server"""
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                method, target, version, headers = request
+                keep_alive = self._keep_alive(version, headers)
+                status, response_headers, body = await self._respond(method, target, headers)
+                self._write_response(writer, status, response_headers, body, keep_alive, head=method == 'HEAD')
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """(method, target, version, headers) of the next request, None at end of stream or on garbage"""
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            return None
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            return None
+        return parts[0], parts[1], parts[2], headers
+
+    @staticmethod
+    def _keep_alive(version, headers):
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    async def _respond(self, method, target, headers):
+        """(status, headers, body) for one request"""
+        if method not in ('GET', 'HEAD'):
+            return 405, {'Allow': 'GET, HEAD'}, b''
+        url = urlsplit(target)
+        if url.path == STATUS_PATH:
+            return 200, {'Content-Type': 'application/json'}, json.dumps(self.status(), indent=2).encode()
+        if url.path != DIAGRAM_PATH:
+            return 404, {}, b''
+        try:
+            options = self.parse_options(url.query)
+        except ValueError as e:
+            return 400, {'Content-Type': 'text/plain; charset=utf-8'}, f"{e}\n".encode()
+        try:
+            await asyncio.wait_for(self._ready.wait(), READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            return 503, {'Retry-After': '5'}, b''
+
+        etag = entity_tag(self.key(options))
+        cache_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        # Answered from the key alone, without rendering or even a cache entry
+        if _etag_matches(headers.get('if-none-match'), etag):
+            return 304, cache_headers, b''
+        try:
+            etag, data = await self.diagram(options)
+        except Exception:
+            # Logged once by the render task
+            return 500, {}, b''
+        return 200, dict(cache_headers, **{
+            'ETag': etag,
+            'Content-Type': CONTENT_TYPE,
+            'Content-Disposition': 'inline; filename="infrastructure.drawio"',
+        }), data
+
+    @staticmethod
+    def _write_response(writer, status, headers, body, keep_alive, head=False):
+        lines = [f"HTTP/1.1 {status} {_REASONS[status]}",
+                 f"Date: {formatdate(usegmt=True)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status != 304:
+            lines.append(f"Content-Length: {len(body)}")
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if not head and status != 304:
+            writer.write(body)
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Render failed: {task.exception()}")
+
+
+def parse_address(address, default_port=8765):
+    """(host, port) from 'host:port', ':port' or 'host'"""
+    host, sep, port = address.rpartition(':')
+    if not sep:
+        return address or None, default_port
+    return host or None, int(port)
+
+
+def run_service(service, address, watcher):
+    """Serve on `address` while `watcher` keeps the inventory current from a background thread"""
+    host, port = parse_address(address)
+
+    async def main():
+        server = await service.start(host, port)
+        addresses = ', '.join(f"http://{s.getsockname()[0]}:{s.getsockname()[1]}{DIAGRAM_PATH}"
+                              for s in server.sockets)
+        print(f"🌐 Serving {addresses}")
+        threading.Thread(target=watcher.run, daemon=True).start()
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    finally:
+        watcher.stop()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Streaming Draw.io Writer
+Writes mxGraph XML as nodes and links are added, with the same interface as N2G's drawio_diagram
+"""
+
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from urllib.parse import quote, unquote
+from xml.sax.saxutils import escape
+
+BACKENDS = ('stream', 'n2g')
+
+# Spooled output stays in memory up to this size, then moves to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+_MXFILE_END = b'</mxfile>\n'
+
+_ATTRIBUTE_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'}
+
+
+def _attr(value):
+    return escape(str(value), _ATTRIBUTE_ENTITIES)
+
+
+class _CompressedPage:
+    """Encodes page XML the way draw.io stores compressed diagrams: base64(deflate(encodeURIComponent(xml)))"""
+
+    def __init__(self, out):
+        self.out = out
+        self.compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        self.pending = b''  # base64 works on 3-byte groups, the remainder waits for more data
+
+    def write(self, text):
+        self._emit(self.compressor.compress(quote(text, safe="!~*'()").encode('ascii')))
+
+    def close(self):
+        self._emit(self.compressor.flush())
+        self.out.write(base64.b64encode(self.pending))
+        self.pending = b''
+
+    def _emit(self, data):
+        data = self.pending + data
+        cut = len(data) - len(data) % 3
+        self.out.write(base64.b64encode(data[:cut]))
+        self.pending = data[cut:]
+
+
+def page_link(page_id):
+    """Link target that opens another page of the same document"""
+    return f"data:page/id,{page_id}"
+
+
+def compress_page(xml):
+    """Encode a page's mxGraphModel XML in draw.io's compressed form"""
+    out = io.BytesIO()
+    page = _CompressedPage(out)
+    page.write(xml)
+    page.close()
+    return out.getvalue().decode('ascii')
+
+
+def decompress_page(text):
+    """Inverse of compress_page(): the mxGraphModel XML of a compressed page"""
+    return unquote(zlib.decompress(base64.b64decode(text), -15).decode('utf-8'))
+
+
+class StreamingDrawioDiagram:
+    """Draw.io document writer that never holds the element tree in memory"""
+
+    def __init__(self, compressed=False, spool_size=SPOOL_SIZE):
+        self.compressed = compressed
+        self.default_node_style = "rounded=1;whiteSpace=wrap;html=1;"
+        self.default_link_style = "endArrow=none;"
+        self.node_count = 0
+        self.link_count = 0
+
+        self._spool = tempfile.SpooledTemporaryFile(max_size=spool_size, mode='w+b')
+        self._spool.write(f'<mxfile host="drawio-automation" modified="{time.strftime("%Y-%m-%dT%H:%M:%S")}" '
+                          f'type="device" compressed="{str(compressed).lower()}">\n'.encode())
+        self._body_start = self._spool.tell()
+        self._page = None
+        self._page_ids = set()
+        self._page_names = {}
+        self._node_ids = set()
+        self._link_ids = set()
+        self._finished = False
+
+    def add_diagram(self, id, name="", width=1360, height=864):
+        """Start a new diagram page; later nodes and links go onto it"""
+        if self._finished:
+            raise RuntimeError("diagram already serialized, no more pages can be added")
+        if id in self._page_ids:
+            return
+        self._close_page()
+        name = name if name.strip() else id
+        self._page_ids.add(id)
+        self._page_names[name] = id
+        self._spool.write(f'  <diagram id="{_attr(id)}" name="{_attr(name)}">'.encode())
+        self._page = _CompressedPage(self._spool) if self.compressed else self._spool
+        self._node_ids = set()
+        self._link_ids = set()
+        self._write(
+            f'\n    <mxGraphModel dx="{width}" dy="{height}" grid="1" gridSize="10" guides="1" tooltips="1" '
+            f'connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" '
+            f'math="0" shadow="1">\n      <root>\n        <mxCell id="0" />\n        <mxCell id="1" parent="0" />\n'
+        )
+
+    def add_node(self, id, label="", data=None, url="", style="", width=120, height=60,
+                 x_pos=200, y_pos=150, **kwargs):
+        """Write a node; a repeated id on the same page is skipped"""
+        if id in self._node_ids:
+            return
+        self._node_ids.add(id)
+        self.node_count += 1
+        style = style or self.default_node_style
+        label = label if label.strip() else id
+        attributes = self._object_attributes(data, url, kwargs)
+        self._write(
+            f'        <object id="{_attr(id)}" label="{_attr(self._label(label, style))}"{attributes}>'
+            f'<mxCell style="{_attr(style)}" vertex="1" parent="1">'
+            f'<mxGeometry x="{x_pos}" y="{y_pos}" width="{width}" height="{height}" as="geometry" />'
+            f'</mxCell></object>\n'
+        )
+
+    def add_link(self, source, target, style="", label="", data=None, url="", src_label="", trgt_label="",
+                 src_label_style="", trgt_label_style="", link_id=None, **kwargs):
+        """Write a link between two nodes; both should already have been added"""
+        if link_id:
+            link_id = f"link_id:{link_id}"
+        else:
+            # Same id scheme as N2G, so both backends produce stable, comparable ids
+            edge = sorted([label, source, target, src_label, trgt_label])
+            link_id = hashlib.md5(",".join(edge).encode()).hexdigest()
+        if link_id in self._link_ids:
+            return
+        self._link_ids.add(link_id)
+        self.link_count += 1
+        style = style or self.default_link_style
+        attributes = self._object_attributes(data, url, kwargs)
+        self._write(
+            f'        <object id="{_attr(link_id)}" label="{_attr(self._label(label, style))}"{attributes}>'
+            f'<mxCell style="{_attr(style)}" edge="1" parent="1" source="{_attr(source)}" target="{_attr(target)}">'
+            f'<mxGeometry relative="1" as="geometry" /></mxCell></object>\n'
+        )
+        for suffix, text, label_style, x in (('src', src_label, src_label_style, -0.5),
+                                              ('trgt', trgt_label, trgt_label_style, 0.5)):
+            if text:
+                self._write(
+                    f'        <mxCell id="{_attr(link_id)}-{suffix}" value="{_attr(text)}" '
+                    f'style="{_attr(label_style or "labelBackgroundColor=#ffffff;")};" vertex="1" connectable="0" '
+                    f'parent="{_attr(link_id)}"><mxGeometry x="{x}" relative="1" as="geometry">'
+                    f'<mxPoint as="offset" /></mxGeometry></mxCell>\n'
+                )
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def add_pages_xml(self, data, page_ids, node_count=0, link_count=0):
+        """Append finished pages from another writer, see pages_xml(); `page_ids` are their ids
+
+        Both writers must agree on compression. Lets pages be rendered separately, e.g. in
+        worker processes, and combined into one document.
+        """
+        if self._finished:
+            raise RuntimeError("diagram already serialized, no more pages can be added")
+        self._close_page()
+        for page_id in page_ids:
+            self._page_ids.add(page_id)
+            self._page_names[page_id] = page_id
+        self._spool.write(data)
+        self.node_count += node_count
+        self.link_count += link_count
+
+    def pages_xml(self):
+        """Finish the document and return only its <diagram> elements, for add_pages_xml()"""
+        self._finish()
+        self._spool.seek(self._body_start)
+        return self._spool.read()[:-len(_MXFILE_END)]
+
+    def write_to(self, stream):
+        """Finish the document and copy it to a binary stream"""
+        self._finish()
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, stream)
+
+    def dump_xml(self):
+        """Finish the document and return it as text"""
+        self._finish()
+        self._spool.seek(0)
+        return self._spool.read().decode()
+
+    def dump_file(self, filename=None, folder="./Output/"):
+        """Finish the document and save it, with N2G's filename/folder semantics"""
+        os.makedirs(folder, exist_ok=True)
+        if not filename:
+            filename = f"{time.ctime().replace(':', '-')}_output.drawio"
+        with open(os.path.join(folder, filename), 'wb') as outfile:
+            self.write_to(outfile)
+
+    def _object_attributes(self, data, url, extra):
+        attributes = dict(data or {})
+        attributes.update((k, v) for k, v in extra.items() if v is not None)
+        if url:
+            # A page name becomes an in-document link to that page
+            page_id = self._page_names.get(url)
+            attributes['link'] = page_link(page_id) if page_id else url
+        return ''.join(f' {key}="{_attr(value)}"' for key, value in attributes.items())
+
+    @staticmethod
+    def _label(label, style):
+        # HTML labels need <br> for line breaks, plain labels keep the newline
+        return label.replace('\n', '<br>') if 'html=1' in style else label
+
+    def _write(self, text):
+        if self._page is None:
+            raise RuntimeError("add_diagram() must be called before adding nodes or links")
+        if self.compressed:
+            self._page.write(text)
+        else:
+            self._spool.write(text.encode())
+
+    def _close_page(self):
+        if self._page is None:
+            return
+        self._write('      </root>\n    </mxGraphModel>\n')
+        if self.compressed:
+            self._page.close()
+        self._spool.write(b'</diagram>\n')
+        self._page = None
+
+    def _finish(self):
+        if not self._finished:
+            self._close_page()
+            self._spool.write(_MXFILE_END)
+            self._finished = True
+
+
+def create_diagram(backend='stream', compressed=False):
+    """New diagram document for a backend name; N2G is only imported when asked for"""
+    if backend == 'n2g':
+        from N2G import drawio_diagram
+        return drawio_diagram()
+    if backend != 'stream':
+        raise ValueError(f"Unknown diagram backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return StreamingDrawioDiagram(compressed=compressed)
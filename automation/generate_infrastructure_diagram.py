@@ -4,87 +4,267 @@ Infrastructure to Draw.io Diagram Generator
 Scans Docker infrastructure and generates editable Draw.io diagrams
 """
 
+import argparse
+import cProfile
+import hashlib
+import io
+import pstats
 import subprocess
 import json
 import re
-from N2G import drawio_diagram
+import socket
+import http.client
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import combinations
+from urllib.parse import quote, urlsplit
 from datetime import datetime
+from functools import partial
 import os
+import sys
 from pathlib import Path
 
+from container_styles import LEGEND, load_categorizer
+from drawio_writer import BACKENDS, StreamingDrawioDiagram, create_diagram, page_link
+from layout import LAYOUTS, get_layout
+from publish import DEFAULT_MANIFEST_PATH, Publisher
+from history_store import HistoryStore, RetentionPolicy, diagram_digest
+from diagram_merge import merge_diagrams
+from connection_rules import DEFAULT_RULES_PATH, load_rules
+from dependencies import env_host_references
+from snapshot_cache import SnapshotCache, inventory_fingerprint, options_digest
+from topology_diff import HIGHLIGHT_STYLES, ROUTE_LABEL_PATTERN, TopologyDiff, changes_inventory, write_report
+from inventory import Inventory, LabelKeys, load_inventory, make_container, make_network, make_volume, save_inventory
+from run_metrics import RunMetrics
+
+# Exit codes understood by update-diagram.sh
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_UNCHANGED = 3  # Scan matched the last rendered fingerprint, nothing was written
+EXIT_CHANGED = 4    # --diff-only: the topology differs from the last rendered snapshot
+
+# Render options that change what is published; a run with other values is never skipped as unchanged
+DIGESTED_OPTIONS = ('layout', 'backend', 'compressed', 'deploy', 'host_pages', 'highlight_changes', 'lod')
+
+# A Docker daemon to scan: display name and a DOCKER_HOST-style URL (unix://, tcp://, ssh://)
+DockerEndpoint = namedtuple('DockerEndpoint', ['name', 'url'])
+
+# Level of detail: an overview page of network summaries plus one detail page per network or per host
+LOD_MODES = ('network', 'host')
+OVERVIEW_PAGE = "Overview"
+
+# One detail page: its name, the part of the inventory it shows, the host it belongs to and
+# the names of the detail pages it links to besides the overview
+DetailPage = namedtuple('DetailPage', ['name', 'data', 'host', 'links'])
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to the Docker Engine API over its unix socket"""
+    
+    def __init__(self, socket_path, timeout=30):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+    
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
 class InfrastructureScanner:
     """Scans Docker infrastructure and collects information"""
     
-    def __init__(self):
+    # Container discovery modes:
+    #   per-container - `docker ps` then one `docker inspect` per container (original behaviour)
+    #   bulk          - `docker ps` then a single `docker inspect` for all container IDs
+    #   api           - Docker Engine API over the unix socket with a bounded worker pool
+    SCAN_MODES = ('per-container', 'bulk', 'api')
+    INSPECT_BATCH_SIZE = 200  # IDs per `docker inspect` call, keeps argv well below ARG_MAX
+    API_WORKERS = 8
+    
+    def __init__(self, mode='bulk', socket_path='/var/run/docker.sock', host=None, timeout=None, label_keys=None,
+                 metrics=None):
+        if mode not in self.SCAN_MODES:
+            raise ValueError(f"Unknown scan mode '{mode}', expected one of {', '.join(self.SCAN_MODES)}")
+        self.mode = mode
+        self.socket_path = socket_path
+        # Docker endpoint URL handed to the CLI as -H; None uses the CLI's own default
+        self.host = host
+        if host and host.startswith('unix://'):
+            self.socket_path = host[len('unix://'):]
+        elif host and mode == 'api' and not host.startswith('tcp://'):
+            raise ValueError(f"API scan mode needs a unix:// or tcp:// endpoint, got '{host}'")
+        # Whole-scan budget: every docker call and API request gets what is left of it
+        self.deadline = time.monotonic() + timeout if timeout else None
+        # Container labels to keep (the keys the connection rules use); None keeps them all
+        self.label_keys = label_keys
+        # Docker CLI runs and API requests are counted and timed here
+        self.metrics = metrics or RunMetrics()
         self.containers = []
         self.networks = []
         self.volumes = []
         
-    def scan_containers(self):
-        """Get all running Docker containers with details"""
-        cmd = ["docker", "ps", "--format", "json"]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+    def scan_containers(self, container_ids=None):
+        """Get all running Docker containers with details, or only the given container IDs"""
+        if container_ids is not None and not container_ids:
+            return self.containers
+        if self.mode == 'api':
+            return self._scan_containers_api(container_ids)
         
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                container = json.loads(line)
-                # Get additional details
-                inspect_cmd = ["docker", "inspect", container['Names']]
-                inspect_result = subprocess.run(inspect_cmd, capture_output=True, text=True)
+        cmd = ["ps", "--format", "json"]
+        for container_id in container_ids or ():
+            cmd += ["--filter", f"id={container_id}"]
+        result = self._docker(*cmd, listing=True)
+        ps_entries = [json.loads(line) for line in result.stdout.strip().split('\n') if line]
+        
+        if self.mode == 'per-container':
+            for container in ps_entries:
+                inspect_result = self._docker("inspect", container['Names'])
                 if inspect_result.returncode == 0:
                     details = json.loads(inspect_result.stdout)[0]
-                    
-                    # Extract network information
-                    networks = list(details['NetworkSettings']['Networks'].keys())
-                    
-                    # Extract exposed ports
-                    ports = []
-                    if details['NetworkSettings']['Ports']:
-                        for port, bindings in details['NetworkSettings']['Ports'].items():
-                            if bindings:
-                                for binding in bindings:
-                                    ports.append(f"{binding.get('HostPort', '')}:{port.split('/')[0]}")
-                    
-                    self.containers.append({
-                        'name': container['Names'],
-                        'image': container['Image'],
-                        'status': container['Status'],
-                        'networks': networks,
-                        'ports': ports,
-                        'labels': details['Config'].get('Labels', {})
-                    })
+                    self.containers.append(self._container_record(container, details))
+            return self.containers
+        
+        details_by_id = self._inspect_bulk([c['ID'] for c in ps_entries])
+        for container in ps_entries:
+            # `docker ps` reports short IDs, `docker inspect` full ones
+            details = details_by_id.get(container['ID'][:12])
+            if details is not None:
+                self.containers.append(self._container_record(container, details))
+        
+        return self.containers
+    
+    def _inspect_bulk(self, container_ids):
+        """Inspect many containers with as few `docker inspect` calls as possible"""
+        details_by_id = {}
+        for start in range(0, len(container_ids), self.INSPECT_BATCH_SIZE):
+            batch = container_ids[start:start + self.INSPECT_BATCH_SIZE]
+            result = self._docker("inspect", *batch)
+            # A container that exits between `ps` and `inspect` makes the call fail,
+            # but the remaining containers are still printed - skip only the missing ones
+            if not result.stdout.strip():
+                continue
+            for details in json.loads(result.stdout):
+                details_by_id[details['Id'][:12]] = details
+        return details_by_id
+    
+    def _scan_containers_api(self, container_ids=None):
+        """Get running containers from the Docker Engine API, inspecting them concurrently"""
+        path = '/containers/json'
+        if container_ids:
+            path += '?filters=' + quote(json.dumps({'id': list(container_ids)}))
+        summaries = self._api_get(path)
+        with ThreadPoolExecutor(max_workers=self.API_WORKERS) as pool:
+            inspected = list(pool.map(self._api_inspect, [s['Id'] for s in summaries]))
+        
+        for summary, details in zip(summaries, inspected):
+            if details is None:
+                continue
+            container = {
+                'Names': details['Name'].lstrip('/'),
+                'Image': summary['Image'],
+                'Status': summary['Status'],
+            }
+            self.containers.append(self._container_record(container, details))
         
         return self.containers
     
+    def _api_inspect(self, container_id):
+        """Inspect one container through the Engine API, None if it has gone away"""
+        try:
+            return self._api_get(f'/containers/{container_id}/json')
+        except LookupError:
+            return None
+    
+    def _api_get(self, path):
+        """GET a Docker Engine API path over the unix socket and decode the JSON body"""
+        if self.host and self.host.startswith('tcp://'):
+            conn = http.client.HTTPConnection(urlsplit(self.host).netloc, timeout=self._remaining() or 30)
+        else:
+            conn = _UnixHTTPConnection(self.socket_path, timeout=self._remaining() or 30)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            body = response.read()
+        finally:
+            conn.close()
+            self.metrics.record_call('api', time.perf_counter() - start)
+        if response.status == 404:
+            raise LookupError(path)
+        if response.status != 200:
+            raise RuntimeError(f"Docker API {path} returned {response.status}: {body[:200]!r}")
+        return json.loads(body)
+    
+    def _docker(self, *args, listing=False):
+        """Run a docker CLI command against this scanner's endpoint within the scan deadline"""
+        cmd = ["docker", *(["-H", self.host] if self.host else []), *args]
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=self._remaining())
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"`{' '.join(cmd[:4])}` timed out") from None
+        finally:
+            self.metrics.record_call('subprocess', time.perf_counter() - start)
+        # An unreachable named endpoint must fail its host rather than look like an empty one
+        if listing and self.host and result.returncode != 0:
+            raise RuntimeError(f"`{' '.join(cmd[:4])}` failed: {result.stderr.strip()[:200]}")
+        return result
+    
+    def _remaining(self):
+        """Seconds left before the scan deadline, None without one"""
+        if self.deadline is None:
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"scan of {self.host or 'local daemon'} ran out of time")
+        return remaining
+    
+    def _container_record(self, container, details):
+        """Build the container record from a `docker ps` entry and its inspect details"""
+        # Extract network information
+        networks = list(details['NetworkSettings']['Networks'].keys())
+        
+        # Extract exposed ports
+        ports = []
+        if details['NetworkSettings']['Ports']:
+            for port, bindings in details['NetworkSettings']['Ports'].items():
+                if bindings:
+                    for binding in bindings:
+                        ports.append(f"{binding.get('HostPort', '')}:{port.split('/')[0]}")
+        
+        return make_container(
+            container['Names'],
+            container['Image'],
+            container['Status'],
+            networks,
+            ports,
+            details['Config'].get('Labels') or {},
+            label_keys=self.label_keys,
+            env_hosts=env_host_references(details['Config'].get('Env') or ())
+        )
+    
     def scan_networks(self):
         """Get all Docker networks"""
-        cmd = ["docker", "network", "ls", "--format", "json"]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = self._docker("network", "ls", "--format", "json", listing=True)
         
         for line in result.stdout.strip().split('\n'):
             if line:
                 network = json.loads(line)
                 if network['Name'] not in ['bridge', 'host', 'none']:  # Skip default networks
-                    self.networks.append({
-                        'name': network['Name'],
-                        'driver': network['Driver'],
-                        'scope': network['Scope']
-                    })
+                    self.networks.append(make_network(network['Name'], network['Driver'], network['Scope']))
         
         return self.networks
     
     def scan_volumes(self):
         """Get all Docker volumes"""
-        cmd = ["docker", "volume", "ls", "--format", "json"]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = self._docker("volume", "ls", "--format", "json", listing=True)
         
         for line in result.stdout.strip().split('\n'):
             if line:
                 volume = json.loads(line)
-                self.volumes.append({
-                    'name': volume['Name'],
-                    'driver': volume['Driver']
-                })
+                self.volumes.append(make_volume(volume['Name'], volume['Driver']))
         
         return self.volumes
 
@@ -92,12 +272,34 @@ class InfrastructureScanner:
 class DrawioDiagramGenerator:
     """Generates Draw.io diagrams from infrastructure data"""
     
-    def __init__(self, infrastructure_data):
+    # Vertical gap between host sections when several hosts share one page
+    HOST_GAP = 150
+    
+    # Network summary nodes on the overview page
+    SUMMARY_WIDTH = 260
+    SUMMARY_HEIGHT = 110
+    SUMMARY_COLUMNS = 6
+    SUMMARY_GAP = 60
+    
+    def __init__(self, infrastructure_data, rules=None, categorizer=None, layout=None, diagram=None,
+                 host_pages=False, lod=None, workers=None, metrics=None):
         self.data = infrastructure_data
-        self.diagram = drawio_diagram()
-        self.diagram.add_diagram("Infrastructure Overview")
+        # Compiled connection rules, see connection_rules.json
+        self.rules = rules or load_rules(os.environ.get('DRAWIO_RULES', DEFAULT_RULES_PATH))
+        # Category and style tables, compiled once and shared between renders
+        self.categorizer = categorizer or load_categorizer(os.environ.get('DRAWIO_CATEGORIES'))
+        # Layout engine positioning network boxes and containers, see layout.py
+        self.layout = layout or get_layout(os.environ.get('DRAWIO_LAYOUT', 'auto'))
+        # Streaming writer by default; DRAWIO_BACKEND=n2g builds the N2G element tree instead
+        self.diagram = diagram or create_diagram(os.environ.get('DRAWIO_BACKEND', 'stream'))
+        # Multi-host inventories: one page per host instead of host sections stacked on one page
+        self.host_pages = host_pages
+        # Level of detail (see LOD_MODES): overview plus detail pages rendered by `workers` processes
+        self.lod = lod
+        self.workers = workers
+        self.metrics = metrics or RunMetrics()
         
-        # Position tracking
+        # Position tracking, keyed by host-qualified name for multi-host inventories
         self.x_pos = 100
         self.y_pos = 100
         self.network_positions = {}
@@ -105,226 +307,266 @@ class DrawioDiagramGenerator:
         
     def categorize_container(self, container):
         """Categorize container by type based on image/name"""
-        name = container['name'].lower()
-        image = container['image'].lower()
-        
-        if 'postgres' in image or 'mysql' in image or 'mongo' in image or 'redis' in image:
-            return 'database'
-        elif 'nginx' in image or 'traefik' in image or 'haproxy' in image:
-            return 'proxy'
-        elif 'keycloak' in name or 'auth' in name or 'oauth' in name:
-            return 'auth'
-        elif 'ui' in name or 'frontend' in name or 'webui' in name:
-            return 'frontend'
-        elif 'api' in name or 'backend' in name:
-            return 'backend'
-        elif 'admin' in name or 'pgadmin' in name:
-            return 'admin'
-        else:
-            return 'service'
+        return self.categorizer.categorize(container.image, container.name)
     
     def get_shape_style(self, category):
-        """Get shape style based on container category"""
-        styles = {
-            'database': {
-                'shape': 'cylinder',
-                'fillColor': '#FFE6CC',
-                'strokeColor': '#D79B00'
-            },
-            'proxy': {
-                'shape': 'hexagon',
-                'fillColor': '#E6F3FF',
-                'strokeColor': '#0066CC'
-            },
-            'auth': {
-                'shape': 'rectangle',
-                'fillColor': '#FFE6F2',
-                'strokeColor': '#CC0066'
-            },
-            'frontend': {
-                'shape': 'rectangle',
-                'fillColor': '#E6FFE6',
-                'strokeColor': '#00CC00'
-            },
-            'backend': {
-                'shape': 'rectangle',
-                'fillColor': '#F0E6FF',
-                'strokeColor': '#6600CC'
-            },
-            'admin': {
-                'shape': 'rectangle',
-                'fillColor': '#FFFFE6',
-                'strokeColor': '#CCCC00'
-            },
-            'service': {
-                'shape': 'rectangle',
-                'fillColor': '#F5F5F5',
-                'strokeColor': '#666666'
-            }
-        }
-        return styles.get(category, styles['service'])
+        """Get the precomputed shape style for a container category"""
+        return self.categorizer.style_for(category)
+    
+    @staticmethod
+    def qualify(node_id, host=None):
+        """Diagram id of a node, prefixed with its host for multi-host inventories"""
+        return f"{host}/{node_id}" if host else node_id
     
     def generate_diagram(self):
         """Generate the Draw.io diagram"""
+        if self.lod:
+            self.add_detail_pages()
+            return
+        if self.host_pages and self.data.hosts:
+            for host in self.data.hosts:
+                self.diagram.add_diagram(f"Host: {host}")
+                self.add_section(self.data.for_host(host), host=host)
+            return
+        self.diagram.add_diagram("Infrastructure Overview")
+        self.add_sections(self.data)
+    
+    def add_detail_pages(self):
+        """Overview page of network summaries, then the detail pages, rendered in parallel"""
+        if not hasattr(self.diagram, 'add_pages_xml'):
+            raise ValueError("Level-of-detail pages require the stream backend")
+        pages = plan_detail_pages(self.data, self.lod)
+        self.add_overview_page(pages)
+        results = render_detail_pages(pages, layout=self.layout, compressed=self.diagram.compressed,
+                                      workers=self.workers)
+        for page, (xml, node_count, link_count) in zip(pages, results):
+            self.diagram.add_pages_xml(xml, [page.name], node_count, link_count)
+    
+    def add_overview_page(self, pages):
+        """One summary node per network, linked to the detail page showing it
+
+        Summaries show the container count and the most common categories; networks sharing
+        containers are connected, labelled with how many they share.
+        """
+        self.diagram.add_diagram(OVERVIEW_PAGE)
+        page_of = {}
+        for page in pages:
+            for network in page.data.networks:
+                page_of.setdefault((page.host, network.name), page.name)
+            # Containers on no drawn network: the host page, or their own standalone page
+            if self.lod == 'host' or not page.data.networks:
+                page_of.setdefault((page.host, None), page.name)
         
-        # First, create network groups with specified order
-        # Order: traefik-proxy (double height), keycloak-net, postgres-net, mailu, then all others
-        network_order = ['traefik-proxy', 'keycloak-net', 'postgres-net', 'mailu']
-        network_y_positions = {
-            'traefik-proxy': 280,   # Just below Traefik
-            'keycloak-net': 930,    # 280 + 600 (traefik-proxy height) + 50 (gap)
-            'postgres-net': 1280,   # 930 + 350
-            'mailu': 1630,          # 1280 + 350
-        }
-        other_network_y = 1980  # Start position for other networks (1630 + 350)
-        
-        # Process networks in specified order first
-        processed_networks = []
-        
-        # Add priority networks first
-        for priority_network in network_order:
-            for network in self.data['networks']:
-                if network['name'] == priority_network:
-                    network_id = f"network_{network['name']}"
-                    net_x = 100
-                    net_y = network_y_positions[network['name']]
-                    # Make traefik-proxy network twice as tall
-                    net_height = 600 if network['name'] == 'traefik-proxy' else 300
-                    
-                    self.diagram.add_node(
-                        id=network_id,
-                        label=f"Network: {network['name']}",
-                        width=800,
-                        height=net_height,
-                        x_pos=net_x,
-                        y_pos=net_y,
-                        shape="rectangle",
-                        style="rounded=1;whiteSpace=wrap;html=1;fillColor=#F0F0F0;strokeColor=#909090;dashed=1;strokeWidth=2;"
-                    )
-                    self.network_positions[network['name']] = {
-                        'x': net_x,
-                        'y': net_y,
-                        'width': 800,
-                        'height': net_height,
-                        'containers': []
-                    }
-                    processed_networks.append(network['name'])
-                    break
-        
-        # Add remaining networks
-        for network in self.data['networks']:
-            if network['name'] not in processed_networks:
-                network_id = f"network_{network['name']}"
-                net_x = 100
-                net_y = other_network_y
-                other_network_y += 350  # Increment for next network
-                
+        y = 50
+        for host in self.data.hosts or [None]:
+            data = self.data.for_host(host) if host else self.data
+            if host:
+                self.diagram.add_node(
+                    id=self.qualify("host", host),
+                    label=f"Host: {host}",
+                    width=250,
+                    height=40,
+                    x_pos=100,
+                    y_pos=y,
+                    shape="rectangle",
+                    style="rounded=0;whiteSpace=wrap;html=1;fillColor=#E0E0E0;fontStyle=1;fontSize=16;",
+                    url=page_link(detail_page_name('host', host)) if self.lod == 'host' else ""
+                )
+                y += 80
+            members = {network.name: [] for network in data.networks}
+            standalone = []
+            for container in data.containers:
+                attached = [n for n in container.networks if n in members]
+                for network in attached:
+                    members[network].append(container)
+                if not attached:
+                    standalone.append(container)
+            summaries = list(members.items()) + ([(None, standalone)] if standalone else [])
+            
+            for index, (network, containers) in enumerate(summaries):
+                categories = Counter(self.categorize_container(c) for c in containers)
+                label = f"Network: {network}" if network else "Standalone"
+                label += f"\n{len(containers)} containers"
+                if categories:
+                    label += "\n" + ", ".join(f"{category} {count}" for category, count in categories.most_common(3))
+                page = page_of.get((host, network))
                 self.diagram.add_node(
-                    id=network_id,
-                    label=f"Network: {network['name']}",
-                    width=800,
-                    height=300,
-                    x_pos=net_x,
-                    y_pos=net_y,
+                    id=self.qualify(f"network_{network}" if network else "nav_standalone", host),
+                    label=label,
+                    width=self.SUMMARY_WIDTH,
+                    height=self.SUMMARY_HEIGHT,
+                    x_pos=100 + (index % self.SUMMARY_COLUMNS) * (self.SUMMARY_WIDTH + self.SUMMARY_GAP),
+                    y_pos=y + (index // self.SUMMARY_COLUMNS) * (self.SUMMARY_HEIGHT + self.SUMMARY_GAP),
                     shape="rectangle",
-                    style="rounded=1;whiteSpace=wrap;html=1;fillColor=#F0F0F0;strokeColor=#909090;dashed=1;strokeWidth=2;"
+                    style="rounded=1;whiteSpace=wrap;html=1;fillColor=#F0F0F0;strokeColor=#909090;dashed=1;strokeWidth=2;",
+                    url=page_link(page) if page else ""
+                )
+            rows = -(-len(summaries) // self.SUMMARY_COLUMNS)
+            y += rows * (self.SUMMARY_HEIGHT + self.SUMMARY_GAP) + self.HOST_GAP
+            
+            # Containers attached to several networks are what ties the summaries together
+            shared = Counter()
+            for container in data.containers:
+                attached = sorted({n for n in container.networks if n in members})
+                shared.update(combinations(attached, 2))
+            for (source, target), count in shared.items():
+                self.diagram.add_link(
+                    source=self.qualify(f"network_{source}", host),
+                    target=self.qualify(f"network_{target}", host),
+                    label=f"{count} shared",
+                    style="endArrow=none;html=1;strokeColor=#909090;"
                 )
-                self.network_positions[network['name']] = {
-                    'x': net_x,
-                    'y': net_y,
-                    'width': 800,
-                    'height': 300,
-                    'containers': []
-                }
+    
+    def add_detail_page(self, page):
+        """A detail page: the usual section for the page's inventory plus navigation links"""
+        self.diagram.add_diagram(page.name)
+        self.diagram.add_node(
+            id="nav_overview",
+            label=f"◀ {OVERVIEW_PAGE}",
+            width=150,
+            height=30,
+            x_pos=100,
+            y_pos=10,
+            shape="rectangle",
+            style="rounded=1;whiteSpace=wrap;html=1;fillColor=#FFFFFF;strokeColor=#0066CC;fontColor=#0066CC;",
+            url=page_link(OVERVIEW_PAGE)
+        )
+        bottom = self.add_section(page.data, host=page.host)
+        # Pages sharing containers with this one, in rows below the section
+        for index, name in enumerate(page.links):
+            self.diagram.add_node(
+                id=f"nav_{name}",
+                label=f"▶ {name}",
+                width=250,
+                height=30,
+                x_pos=100 + (index % self.SUMMARY_COLUMNS) * 270,
+                y_pos=bottom + 60 + (index // self.SUMMARY_COLUMNS) * 40,
+                shape="rectangle",
+                style="rounded=1;whiteSpace=wrap;html=1;fillColor=#FFFFFF;strokeColor=#0066CC;fontColor=#0066CC;",
+                url=page_link(name)
+            )
+    
+    def add_changes_page(self, diff, inventory):
+        """Extra page with the changes since the previous snapshot highlighted
+
+        `inventory` is the current inventory plus what was removed, see topology_diff.changes_inventory().
+        """
+        self.diagram.add_diagram("Changes")
+        self.add_sections(inventory, highlights=diff.highlights())
+    
+    def add_sections(self, data, highlights=None):
+        """Draw a whole inventory on the current page, one section per host stacked top to bottom"""
+        if not data.hosts:
+            self.add_section(data, highlights=highlights)
+            return
+        y_offset = 0
+        for index, host in enumerate(data.hosts):
+            # The legend is drawn once, beside the first host
+            bottom = self.add_section(data.for_host(host), host=host, y_offset=y_offset, legend=index == 0,
+                                      highlights=highlights)
+            y_offset = bottom + self.HOST_GAP
+    
+    def add_section(self, data, host=None, y_offset=0, legend=True, highlights=None):
+        """Draw one host's networks, containers, entry points and connections; returns the bottom y
+
+        `highlights` maps 'containers' and 'networks' to {qualified name: change status (added,
+        changed, removed)}, see TopologyDiff.highlights().
+        """
+        layout = self.layout.arrange(data.networks, data.containers)
+        bottom = y_offset + 280  # Below the entry points
+        highlights = highlights or {}
+        network_status = highlights.get('networks', {})
+        container_status = highlights.get('containers', {})
+        
+        if host:
+            self.diagram.add_node(
+                id=self.qualify("host", host),
+                label=f"Host: {host}",
+                width=250,
+                height=40,
+                x_pos=100,
+                y_pos=y_offset + 50,
+                shape="rectangle",
+                style="rounded=0;whiteSpace=wrap;html=1;fillColor=#E0E0E0;fontStyle=1;fontSize=16;"
+            )
         
-        # Add containers to their networks
-        for container in self.data['containers']:
+        # Network groups first, so containers are drawn on top of them
+        for box in layout.boxes:
+            status = network_status.get(self.qualify(box.name, host))
+            self.diagram.add_node(
+                id=self.qualify(f"network_{box.name}", host),
+                label=f"Network: {box.name}" + (f" [{status}]" if status else ""),
+                width=box.width,
+                height=box.height,
+                x_pos=box.x,
+                y_pos=box.y + y_offset,
+                shape="rectangle",
+                style="rounded=1;whiteSpace=wrap;html=1;fillColor=#F0F0F0;strokeColor=#909090;dashed=1;strokeWidth=2;"
+                      + HIGHLIGHT_STYLES.get(status, "")
+            )
+            self.network_positions[self.qualify(box.name, host)] = {
+                'x': box.x,
+                'y': box.y + y_offset,
+                'width': box.width,
+                'height': box.height,
+                'containers': box.containers
+            }
+            bottom = max(bottom, box.y + y_offset + box.height)
+        
+        # Add containers at the positions the layout chose
+        for container in data.containers:
             category = self.categorize_container(container)
             style = self.get_shape_style(category)
+            x, y = layout.positions[container.name]
+            y += y_offset
             
-            # Special positioning for Traefik - right below Internet node for visual flow
-            # Internet (y=50) -> Traefik (y=180) -> traefik-proxy network box below
-            if container['name'] == 'traefik':
-                x = 425  # Center it below the Internet cloud (which is at x=400, width=200)
-                y = 180  # Just below Internet node (which ends at y=150)
-            else:
-                # Place container in its primary network
-                primary_network = container['networks'][0] if container['networks'] else None
-                
-                if primary_network and primary_network in self.network_positions:
-                    net_pos = self.network_positions[primary_network]
-                    # Calculate position within network
-                    containers_in_network = len(net_pos['containers'])
-                    x = net_pos['x'] + 50 + (containers_in_network % 4) * 180
-                    y = net_pos['y'] + 50 + (containers_in_network // 4) * 120
-                    net_pos['containers'].append(container['name'])
-                else:
-                    # Standalone container
-                    x = 950
-                    y = 100 + len([c for c in self.container_positions.values()]) * 120
-            
-            container_id = f"container_{container['name']}"
+            container_id = self.qualify(f"container_{container.name}", host)
             
             # Prepare label with details
-            ports_str = ', '.join(container['ports'][:3]) if container['ports'] else 'No ports'
-            label = f"{container['name']}\n{container['image'].split(':')[0]}\n{ports_str}"
+            ports_str = ', '.join(container.ports[:3]) if container.ports else 'No ports'
+            label = f"{container.name}\n{container.image.split(':')[0]}\n{ports_str}"
+            status = container_status.get(self.qualify(container.name, host))
+            if status:
+                label += f"\n[{status}]"
             
             # Add container node
-            if style['shape'] == 'cylinder':
-                self.diagram.add_node(
-                    id=container_id,
-                    label=label,
-                    width=150,
-                    height=80,
-                    x_pos=x,
-                    y_pos=y,
-                    shape="cylinder",
-                    style=f"shape=cylinder;whiteSpace=wrap;html=1;fillColor={style['fillColor']};strokeColor={style['strokeColor']};"
-                )
-            elif style['shape'] == 'hexagon':
-                self.diagram.add_node(
-                    id=container_id,
-                    label=label,
-                    width=150,
-                    height=80,
-                    x_pos=x,
-                    y_pos=y,
-                    shape="hexagon",
-                    style=f"shape=hexagon;whiteSpace=wrap;html=1;fillColor={style['fillColor']};strokeColor={style['strokeColor']};"
-                )
-            else:
-                self.diagram.add_node(
-                    id=container_id,
-                    label=label,
-                    width=150,
-                    height=80,
-                    x_pos=x,
-                    y_pos=y,
-                    shape="rectangle",
-                    style=f"rounded=1;whiteSpace=wrap;html=1;fillColor={style['fillColor']};strokeColor={style['strokeColor']};"
-                )
+            self.diagram.add_node(
+                id=container_id,
+                label=label,
+                width=150,
+                height=80,
+                x_pos=x,
+                y_pos=y,
+                shape=style.shape,
+                style=style.style + HIGHLIGHT_STYLES.get(status, "")
+            )
             
-            self.container_positions[container['name']] = {'x': x, 'y': y}
+            self.container_positions[self.qualify(container.name, host)] = {'x': x, 'y': y}
+            bottom = max(bottom, y + 80)
         
         # Add external internet node
-        self.add_external_nodes()
+        self.add_external_nodes(host=host, y_offset=y_offset)
         
         # Add connections based on common patterns
-        self.add_connections()
+        self.add_connections(data.containers, host=host)
         
         # Add legend
-        self.add_legend()
+        if legend:
+            legend_x, legend_y = layout.legend_position
+            self.add_legend(legend_x, legend_y + y_offset, host=host if self.host_pages else None)
+            bottom = max(bottom, legend_y + y_offset + 40 + len(LEGEND) * 35)
+        return bottom
         
-    def add_external_nodes(self):
+    def add_external_nodes(self, host=None, y_offset=0):
         """Add external/internet nodes to show traffic sources"""
         # Add Internet cloud node
         self.diagram.add_node(
-            id="internet",
+            id=self.qualify("internet", host),
             label="Internet\n(Public Traffic)",
             width=200,
             height=100,
             x_pos=400,
-            y_pos=50,
+            y_pos=50 + y_offset,
             shape="cloud",
             style="ellipse;shape=cloud;whiteSpace=wrap;html=1;fillColor=#FFE6E6;strokeColor=#CC0000;strokeWidth=2;"
         )
@@ -332,121 +574,45 @@ class DrawioDiagramGenerator:
         # Add Internal Network node at same level as Traefik (both are entry points)
         # Internet (y=50) -> Both Traefik and Internal Network at y=180
         self.diagram.add_node(
-            id="internal_network",
+            id=self.qualify("internal_network", host),
             label="Internal Network\n(LAN Traffic)",
             width=200,
             height=100,
             x_pos=650,  # To the right of Traefik (which is at x=425)
-            y_pos=180,  # Same level as Traefik
+            y_pos=180 + y_offset,  # Same level as Traefik
             shape="cloud",
             style="ellipse;shape=cloud;whiteSpace=wrap;html=1;fillColor=#E6F3FF;strokeColor=#0066CC;strokeWidth=2;"
         )
     
-    def add_connections(self):
-        """Add connections between containers based on common patterns"""
-        
-        # Connect Internet to Traefik (main ingress point)
-        traefik_main = next((c for c in self.data['containers'] if c['name'] == 'traefik'), None)
-        if traefik_main:
-            traefik_id = f"container_{traefik_main['name']}"
-            # Internet -> Traefik (ports 80/443)
-            self.diagram.add_link(
-                source="internet",
-                target=traefik_id,
-                label="HTTPS (443)\nHTTP (80)",
-                style="edgeStyle=orthogonalEdgeStyle;curved=1;strokeColor=#CC0000;strokeWidth=2;"
-            )
-            
-            # Internal Network -> Services with internal access
-            # Connect to services with direct port access
-            direct_access_services = [
-                ('keycloak', '8443'),
-                ('pgadmin', '8901'),
-                ('postgres', '5432'),
-                ('portainer', '9000'),
-                ('shellhub-ssh', '2222'),
-            ]
-            
-            for service_name, port in direct_access_services:
-                service = next((c for c in self.data['containers'] if c['name'] == service_name), None)
-                if service:
-                    self.diagram.add_link(
-                        source="internal_network",
-                        target=f"container_{service['name']}",
-                        label=f"Port {port}",
-                        style="edgeStyle=orthogonalEdgeStyle;curved=1;strokeColor=#0066CC;dashed=1;"
-                    )
-        
-        # Only connect Traefik to services it actually routes to (based on labels)
-        traefik_containers = [c for c in self.data['containers'] if 'traefik' in c['name'].lower() and 'certs-dumper' not in c['name'].lower()]
-        
-        for traefik in traefik_containers:
-            traefik_id = f"container_{traefik['name']}"
-            
-            # Check Traefik labels for routing - only connect containers with traefik labels
-            for container in self.data['containers']:
-                if container['name'] != traefik['name']:
-                    labels = container.get('labels', {})
-                    # Check if container has Traefik routing enabled
-                    if any('traefik.enable=true' in f"{key}={value}" for key, value in labels.items()):
-                        container_id = f"container_{container['name']}"
-                        self.diagram.add_link(
-                            source=traefik_id,
-                            target=container_id,
-                            label="routes",
-                            style="edgeStyle=orthogonalEdgeStyle;curved=1;strokeColor=#0066CC;"
-                        )
-        
-        # Connect Keycloak ONLY to its database
-        keycloak_containers = [c for c in self.data['containers'] if c['name'] == 'keycloak']
-        for keycloak in keycloak_containers:
-            keycloak_id = f"container_{keycloak['name']}"
-            # Only connect to keycloak-postgres
-            for container in self.data['containers']:
-                if container['name'] == 'keycloak-postgres':
-                    db_id = f"container_{container['name']}"
-                    self.diagram.add_link(
-                        source=keycloak_id,
-                        target=db_id,
-                        label="database",
-                        style="edgeStyle=orthogonalEdgeStyle;curved=1;strokeColor=#CC0066;"
-                    )
-        
-        # Connect OAuth2 proxies to their backend services
-        oauth_proxies = [c for c in self.data['containers'] if 'oauth2-proxy' in c['image'].lower() or 'oauth' in c['name'].lower()]
-        for oauth in oauth_proxies:
-            oauth_id = f"container_{oauth['name']}"
-            # Connect drawio-auth-proxy to drawio
-            if oauth['name'] == 'drawio-auth-proxy':
-                for container in self.data['containers']:
-                    if container['name'] == 'drawio':
-                        service_id = f"container_{container['name']}"
-                        self.diagram.add_link(
-                            source=oauth_id,
-                            target=service_id,
-                            label="protects",
-                            style="edgeStyle=orthogonalEdgeStyle;curved=1;strokeColor=#FF9900;dashed=1;"
-                        )
-        
-        # Connect pgAdmin to main postgres database only
-        pgadmin = next((c for c in self.data['containers'] if c['name'] == 'pgadmin'), None)
-        postgres = next((c for c in self.data['containers'] if c['name'] == 'postgres'), None)
-        
-        if pgadmin and postgres:
-            self.diagram.add_link(
-                source=f"container_{pgadmin['name']}",
-                target=f"container_{postgres['name']}",
-                label="manages",
-                style="edgeStyle=orthogonalEdgeStyle;curved=1;strokeColor=#CCCC00;dashed=1;"
-            )
+    def add_connections(self, containers=None, host=None):
+        """Add connections between containers from the declarative connection rules and discovered dependencies"""
+        containers = self.data.containers if containers is None else containers
+        node_id = lambda c: self.qualify(f"container_{c.name}", host)
+        with self.metrics.stage('add_connections'):
+            linked = set()
+            for source, target, rule in self.rules.evaluate(containers, node_id=node_id,
+                                                            fixed_node_id=lambda node: self.qualify(node, host)):
+                linked.add((source, target))
+                self.diagram.add_link(
+                    source=source,
+                    target=target,
+                    label=rule.label,
+                    style=rule.style
+                )
+            if self.rules.dependencies is None:
+                return
+            with self.metrics.stage('discover_dependencies'):
+                # An explicit rule between the same two containers says more than a discovered edge
+                for source, target, kind in self.rules.dependencies.evaluate(containers, node_id=node_id):
+                    if (source, target) in linked:
+                        continue
+                    self.diagram.add_link(source=source, target=target, label=kind.label, style=kind.style)
     
-    def add_legend(self):
+    def add_legend(self, legend_x=950, legend_y=600, host=None):
         """Add a legend to explain the shapes and colors"""
-        legend_x = 950
-        legend_y = 600
         
         self.diagram.add_node(
-            id="legend_title",
+            id=self.qualify("legend_title", host),
             label="Legend",
             width=200,
             height=30,
@@ -456,94 +622,605 @@ class DrawioDiagramGenerator:
             style="rounded=0;whiteSpace=wrap;html=1;fillColor=#E0E0E0;fontStyle=1;"
         )
         
-        legend_items = [
-            ("Database", "cylinder", "#FFE6CC", "#D79B00"),
-            ("Proxy/LB", "hexagon", "#E6F3FF", "#0066CC"),
-            ("Auth", "rectangle", "#FFE6F2", "#CC0066"),
-            ("Frontend", "rectangle", "#E6FFE6", "#00CC00"),
-            ("Backend", "rectangle", "#F0E6FF", "#6600CC"),
-            ("Admin", "rectangle", "#FFFFE6", "#CCCC00"),
-        ]
-        
-        for i, (label, shape, fill, stroke) in enumerate(legend_items):
+        for i, (label, category) in enumerate(LEGEND):
             y = legend_y + 40 + (i * 35)
-            
-            if shape == "cylinder":
-                style = f"shape=cylinder;whiteSpace=wrap;html=1;fillColor={fill};strokeColor={stroke};"
-            elif shape == "hexagon":
-                style = f"shape=hexagon;whiteSpace=wrap;html=1;fillColor={fill};strokeColor={stroke};"
-            else:
-                style = f"rounded=1;whiteSpace=wrap;html=1;fillColor={fill};strokeColor={stroke};"
+            style = self.get_shape_style(category)
             
             self.diagram.add_node(
-                id=f"legend_{label}",
+                id=self.qualify(f"legend_{label}", host),
                 label=label,
                 width=80,
                 height=30,
                 x_pos=legend_x,
                 y_pos=y,
-                shape=shape if shape != "rectangle" else None,
-                style=style
+                shape=style.shape if style.shape != "rectangle" else None,
+                style=style.style
             )
     
+    def serialize(self):
+        """Serialize the finished diagram once, for publishing to several destinations"""
+        if hasattr(self.diagram, 'write_to'):
+            buffer = io.BytesIO()
+            self.diagram.write_to(buffer)
+            return buffer.getvalue()
+        return self.diagram.dump_xml().encode()
+    
     def save_diagram(self, output_path):
         """Save the diagram to a file"""
-        self.diagram.dump_file(output_path)
+        folder, filename = os.path.split(output_path)
+        self.diagram.dump_file(filename, folder=folder or '.')
         print(f"✅ Diagram saved to: {output_path}")
 
 
-def main():
-    """Main function to generate the infrastructure diagram"""
-    
-    print("🔍 Scanning Docker infrastructure...")
-    scanner = InfrastructureScanner()
-    
-    infrastructure = {
-        'containers': scanner.scan_containers(),
-        'networks': scanner.scan_networks(),
-        'volumes': scanner.scan_volumes()
-    }
-    
-    print(f"Found: {len(infrastructure['containers'])} containers, "
-          f"{len(infrastructure['networks'])} networks, "
-          f"{len(infrastructure['volumes'])} volumes")
+def detail_page_name(lod, host=None, network=None):
+    """Name (and id) of the detail page showing a network, or a whole host with lod='host'"""
+    if lod == 'host':
+        return f"Host: {host}" if host else "All Containers"
+    if network is None:
+        return f"Standalone: {host}" if host else "Standalone"
+    return f"Network: {DrawioDiagramGenerator.qualify(network, host)}"
+
+
+def plan_detail_pages(inventory, lod):
+    """DetailPages for an inventory: one per host, or one per network plus one for containers on none"""
+    pages = []
+    for host in inventory.hosts or [None]:
+        data = inventory.for_host(host) if host else inventory
+        if lod == 'host':
+            pages.append(DetailPage(detail_page_name(lod, host), data, host, []))
+            continue
+        members = {network.name: [] for network in data.networks}
+        drawn = set(members)
+        standalone = []
+        for container in data.containers:
+            attached = [n for n in container.networks if n in members]
+            for network in attached:
+                # The page's own network first, so every layout draws the container inside its box
+                members[network].append(container._replace(
+                    networks=(network,) + tuple(n for n in container.networks if n != network)))
+            if not attached:
+                standalone.append(container)
+        for network in data.networks:
+            containers = members.pop(network.name, None)
+            if containers is None:
+                continue
+            links = sorted({n for c in containers for n in c.networks[1:] if n in drawn})
+            pages.append(DetailPage(detail_page_name(lod, host, network.name),
+                                    Inventory(containers, [network], []), host,
+                                    [detail_page_name(lod, host, n) for n in links]))
+        if standalone:
+            pages.append(DetailPage(detail_page_name(lod, host), Inventory(standalone, [], []), host, []))
+    return pages
+
+
+def _render_detail_page(page, layout=None, compressed=False):
+    """Render one DetailPage on its own; returns its <diagram> XML and node and link counts"""
+    generator = DrawioDiagramGenerator(page.data, layout=layout,
+                                       diagram=StreamingDrawioDiagram(compressed=compressed))
+    generator.add_detail_page(page)
+    return generator.diagram.pages_xml(), generator.diagram.node_count, generator.diagram.link_count
+
+
+def render_detail_pages(pages, layout=None, compressed=False, workers=None):
+    """Render detail pages in worker processes; yields _render_detail_page() results in page order"""
+    render = partial(_render_detail_page, layout=layout, compressed=compressed)
+    workers = min(workers or os.cpu_count() or 1, len(pages))
+    if workers <= 1:
+        yield from map(render, pages)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # A few chunks per worker keeps pickling overhead low and the pool evenly loaded
+        yield from pool.map(render, pages, chunksize=max(1, len(pages) // (workers * 4)))
+
+
+def scan_infrastructure(scanner):
+    """Run a full scan and return the Inventory the generator consumes"""
+    with scanner.metrics.stage('scan_containers'):
+        containers = scanner.scan_containers()
+    with scanner.metrics.stage('scan_networks'):
+        networks = scanner.scan_networks()
+    with scanner.metrics.stage('scan_volumes'):
+        volumes = scanner.scan_volumes()
+    return Inventory(containers, networks, volumes)
+
+
+def parse_endpoints(spec):
+    """Parse a comma-separated list of `[name=]url` Docker endpoints
+
+    Without a name the URL's host is used (the socket file name for unix sockets).
+    """
+    endpoints = []
+    for entry in filter(None, (e.strip() for e in spec.split(','))):
+        name, _, url = entry.partition('=') if '=' in entry.split('://')[0] else ('', '', entry)
+        if '://' not in url:
+            url = f"unix://{url}"
+        parts = urlsplit(url)
+        if parts.scheme not in ('unix', 'tcp', 'ssh'):
+            raise ValueError(f"Unsupported Docker endpoint '{url}', expected unix://, tcp:// or ssh://")
+        name = name or parts.hostname or Path(parts.path).stem
+        if any(e.name == name for e in endpoints):
+            raise ValueError(f"Duplicate Docker host name '{name}', use name=url to tell them apart")
+        endpoints.append(DockerEndpoint(name, url))
+    return endpoints
+
+
+def scan_hosts(endpoints, mode='bulk', timeout=None, label_keys=None, metrics=None):
+    """Scan several Docker hosts in parallel and merge them into one inventory
+
+    Every container, network and volume gets its `host` set and the inventory lists the
+    hosts that answered in `hosts`. A host that fails or runs out of time is left out with
+    a warning, so the scan takes about as long as the slowest host.
+    """
+    def scan(endpoint):
+        return scan_infrastructure(InfrastructureScanner(mode=mode, host=endpoint.url, timeout=timeout,
+                                                         label_keys=label_keys, metrics=metrics))
     
-    print("\n🎨 Generating Draw.io diagram...")
-    generator = DrawioDiagramGenerator(infrastructure)
-    generator.generate_diagram()
+    merged = Inventory([], [], [], hosts=[])
+    with ThreadPoolExecutor(max_workers=len(endpoints)) as pool:
+        futures = [pool.submit(scan, endpoint) for endpoint in endpoints]
+        for endpoint, future in zip(endpoints, futures):
+            try:
+                inventory = future.result()
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"⚠️  Skipping Docker host {endpoint.name} ({endpoint.url}): {e}")
+                continue
+            host = sys.intern(endpoint.name)
+            merged.hosts.append(host)
+            for records, scanned in ((merged.containers, inventory.containers),
+                                     (merged.networks, inventory.networks),
+                                     (merged.volumes, inventory.volumes)):
+                records.extend(record._replace(host=host) for record in scanned)
     
+    if not merged.hosts:
+        raise RuntimeError("None of the Docker hosts could be scanned")
+    return merged
+
+
+def get_output_dir():
+    """Output directory for generated diagrams"""
     # Use environment variable or default to user home
     base_path = os.environ.get('DRAWIO_BASE_PATH', str(Path.home()))
     output_dir = Path(base_path) / "projects" / "drawio" / "output"
     output_dir.mkdir(parents=True, exist_ok=True)
+    return output_dir
+
+
+def get_snapshot_cache():
+    """Fingerprint of the last rendered scan, kept next to infrastructure_latest.drawio"""
+    return SnapshotCache(get_output_dir() / "infrastructure_latest.fingerprint")
+
+
+def get_history_store():
+    """Compressed snapshot history; DRAWIO_HISTORY_SCANS=0 keeps diagrams only"""
+    return HistoryStore(get_output_dir() / "history",
+                        keep_scans=os.environ.get('DRAWIO_HISTORY_SCANS', '1') != '0')
+
+
+def preserve_edits(data, latest_path, base=None):
+    """Carry manual edits made to the latest diagram over into a new render
+
+    `base` is the previous unmerged render (HistoryStore.latest_render()), not the merged file
+    published from it, so edits carried over once are still seen as edits on later runs; if the
+    latest file still matches it there is nothing to keep.
+    """
+    try:
+        edited = latest_path.read_bytes()
+    except FileNotFoundError:
+        return data
+    if base is not None and diagram_digest(base) == diagram_digest(edited):
+        return data
+    try:
+        merged = merge_diagrams(edited, data, base)
+    except ValueError as e:
+        print(f"⚠️  Could not merge manual edits from {latest_path}, regenerating it: {e}")
+        return data
+    print(f"✏️  Kept manual edits from {latest_path}")
+    return merged
+
+
+def diff_against(previous, infrastructure, fingerprint, output_dir):
+    """Diff an inventory against a (timestamp, Inventory) history snapshot and write the change report"""
+    previous_timestamp, previous_inventory = previous
+    diff = TopologyDiff(previous_inventory, infrastructure)
+    report_path = output_dir / "infrastructure_changes.json"
+    write_report(diff, report_path, previous_snapshot=previous_timestamp, fingerprint=fingerprint)
+    print(f"🔀 Changes since {previous_timestamp}: {diff.describe()} (report: {report_path})")
+    return diff
+
+
+def render_diagram(infrastructure, fingerprint, layout=None, backend='stream', compressed=False,
+                   deploy=False, manifest=None, host_pages=False, highlight_changes=False, fresh=False,
+                   lod=None, workers=None, export=None, export_dir=None, options_digest=None, metrics=None):
+    """Generate the diagram, serialize it once, publish it to every manifest destination and record the fingerprint
+
+    `options_digest` (see render_options_digest()) is stored with the fingerprint, so a run with
+    other options is not skipped as unchanged.
+    """
+    metrics = metrics or RunMetrics()
+    output_dir = get_output_dir()
+    history = get_history_store()
+    with metrics.stage('diff'):
+        previous = history.latest_scan()
+        diff = None
+        if previous is not None:
+            diff = diff_against(previous, infrastructure, fingerprint, output_dir)
     
-    # Create history subdirectory
-    history_dir = output_dir / "history"
-    history_dir.mkdir(parents=True, exist_ok=True)
+    print("\n🎨 Generating Draw.io diagram...")
+    generator = DrawioDiagramGenerator(infrastructure,
+                                       layout=get_layout(layout) if layout else None,
+                                       diagram=create_diagram(backend, compressed=compressed),
+                                       host_pages=host_pages, lod=lod, workers=workers, metrics=metrics)
+    with metrics.stage('generate_diagram'):
+        generator.generate_diagram()
+        if highlight_changes and diff is not None and diff.changed:
+            generator.add_changes_page(diff, changes_inventory(previous[1], infrastructure))
+    with metrics.stage('serialize'):
+        data = generator.serialize()
+    metrics.count(nodes=getattr(generator.diagram, 'node_count', None),
+                  edges=getattr(generator.diagram, 'link_count', None),
+                  pages=getattr(generator.diagram, 'page_count', None))
+    render = data
+    if not fresh:
+        with metrics.stage('merge_edits'):
+            data = preserve_edits(data, output_dir / "infrastructure_latest.drawio", base=history.latest_render())
     
-    # Save with timestamp
+    # Timestamped and latest copies (plus web roots when deploying), see publish_manifest.json
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = output_dir / f"infrastructure_{timestamp}.drawio"
-    generator.save_diagram(str(output_file))
+    publisher = get_publisher(manifest)
+    variables = publish_variables(timestamp)
+    with metrics.stage('publish'):
+        written = publisher.publish(data, variables, deploy=deploy)
+    metrics.output.update(bytes=len(data), files=len(written))
+    for path in written:
+        print(f"✅ Diagram saved to: {path}")
+    
+    # History keeps one compressed object per distinct diagram, thinned to hourly/daily snapshots
+    with metrics.stage('history'):
+        history.add(data, timestamp, infrastructure=infrastructure, fingerprint=fingerprint, render=render)
+        history.prune(RetentionPolicy())
+    print(f"✅ Snapshot {timestamp} recorded in: {history.root}")
+    
+    if export:
+        with metrics.stage('export'):
+            written += export_previews(data, export, export_dir, workers=workers,
+                                       mirrors=publisher.export_dirs(variables, deploy=deploy))
+    
+    # Only record the fingerprint once every copy is on disk
+    get_snapshot_cache().store(fingerprint, options_digest)
+    
+    return written
+
+
+def render_options_digest(render_options):
+    """Digest of what shapes the published diagram besides the scan: options and rule, category and manifest files"""
+    options = {key: render_options[key] for key in DIGESTED_OPTIONS}
+    paths = [os.environ.get('DRAWIO_RULES', DEFAULT_RULES_PATH), os.environ.get('DRAWIO_CATEGORIES'),
+             os.environ.get('DRAWIO_PUBLISH_MANIFEST', DEFAULT_MANIFEST_PATH)]
+    return options_digest(options, [path for path in paths if path])
+
+
+def get_publisher(manifest=None):
+    """Publisher for the publish manifest; DRAWIO_PUBLISH_MANIFEST overrides the bundled one"""
+    return Publisher.from_manifest(manifest or os.environ.get('DRAWIO_PUBLISH_MANIFEST', DEFAULT_MANIFEST_PATH))
+
+
+def publish_variables(timestamp):
+    """Values for the ${...} placeholders in publish manifest paths"""
+    return {
+        'OUTPUT_DIR': get_output_dir(),
+        'BASE_PATH': os.environ.get('DRAWIO_BASE_PATH', str(Path.home())),
+        'TIMESTAMP': timestamp,
+    }
+
+
+def export_previews(data, formats, export_dir=None, workers=None, mirrors=()):
+    """SVG/PNG pages and the HTML viewer of a serialized diagram, skipped if already exported
+
+    The export is then mirrored to `mirrors`, the manifest's export destinations (web roots).
+    """
+    from diagram_export import export_diagram, mirror_export
+    export_dir = Path(export_dir) if export_dir else get_output_dir() / "export"
+    written = export_diagram(data, export_dir, formats=formats, workers=workers)
+    if written:
+        print(f"🖼️  Exported {', '.join(formats).upper()} previews and viewer to: {export_dir / 'index.html'}")
+    else:
+        print(f"✅ Previews in {export_dir} are up to date")
+    for target in mirrors:
+        copied = mirror_export(export_dir, target)
+        if copied:
+            print(f"🖼️  Deployed previews to: {target / 'index.html'}")
+        written += copied
+    return written
+
+
+def render_document(infrastructure, layout='auto', lod='', compressed='0', workers=None):
+    """Serialized diagram of an inventory, kept in memory: nothing is published, merged or recorded
+
+    Options arrive as the service's query-string values; see service_options().
+    """
+    generator = DrawioDiagramGenerator(infrastructure, layout=get_layout(layout),
+                                       diagram=create_diagram('stream', compressed=compressed == '1'),
+                                       lod=lod or None, workers=workers)
+    generator.generate_diagram()
+    return generator.serialize()
+
+
+def render_inputs_digest(inventory):
+    """Digest of the files a render of `inventory` reads, by path, mtime and size: rules, categories, compose files
+
+    The diagram service keys its cache and ETags on it, so editing any of them reaches clients
+    without waiting for the topology to change.
+    """
+    rules_path = os.environ.get('DRAWIO_RULES', DEFAULT_RULES_PATH)
+    paths = [rules_path, os.environ.get('DRAWIO_CATEGORIES')]
+    dependencies = load_rules(rules_path).dependencies
+    if dependencies is not None:
+        paths += dependencies.compose_files(inventory.containers)
+    stamps = []
+    for path in paths:
+        if not path:
+            continue
+        try:
+            stat = os.stat(path)
+            stamps.append((str(path), stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamps.append((str(path), None, None))
+    return hashlib.sha256(repr(stamps).encode()).hexdigest()
+
+
+def service_options(args):
+    """Query parameters the diagram service accepts, each with its allowed values; the command line's come first"""
+    def first(default, values):
+        return (default,) + tuple(value for value in values if value != default)
+    return {
+        'layout': first(args.layout, sorted(LAYOUTS)),
+        'lod': first(args.lod or '', ('',) + LOD_MODES),
+        'compressed': first('1' if args.compressed else '0', ('0', '1')),
+    }
+
+
+def main():
+    """Main function to generate the infrastructure diagram"""
+    parser = argparse.ArgumentParser(description="Scan Docker infrastructure and generate a Draw.io diagram")
+    parser.add_argument('--force', action='store_true',
+                        help="regenerate even if the infrastructure is unchanged since the last run")
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default=os.environ.get('DRAWIO_LAYOUT', 'auto'),
+                        help="layout preset: auto-sized shelf packing or the original fixed layout (default: auto)")
+    parser.add_argument('--backend', choices=BACKENDS, default=os.environ.get('DRAWIO_BACKEND', 'stream'),
+                        help="diagram writer: built-in streaming writer or the N2G library (default: stream)")
+    parser.add_argument('--compressed', action='store_true',
+                        help="store diagram pages deflate+base64 compressed (streaming backend only)")
+    parser.add_argument('--deploy', action='store_true',
+                        help="also publish to the web-server destinations in the publish manifest")
+    parser.add_argument('--hosts', default=os.environ.get('DRAWIO_DOCKER_HOSTS', ''),
+                        help="comma-separated Docker endpoints to scan in parallel, each [name=]url "
+                             "(unix://, tcp://, ssh://); default: the local daemon only")
+    parser.add_argument('--host-timeout', type=float, default=float(os.environ.get('DRAWIO_HOST_TIMEOUT', 30)),
+                        help="seconds a host may take to scan before it is left out (default: 30)")
+    parser.add_argument('--host-pages', action='store_true',
+                        help="with --hosts, draw one page per host instead of stacking hosts on one page")
+    parser.add_argument('--lod', choices=LOD_MODES, default=os.environ.get('DRAWIO_LOD') or None,
+                        help="level of detail for large estates: an overview page of network summaries "
+                             "linked to one detail page per network or per host")
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('DRAWIO_WORKERS', 0)) or None,
+                        help="processes rendering --lod detail pages and --export previews (default: one per CPU)")
+    parser.add_argument('--export', metavar='FORMATS', nargs='?', const='svg', default=os.environ.get('DRAWIO_EXPORT'),
+                        help="also render each page to static previews with an HTML viewer: svg, png or "
+                             "svg,png (default: svg; png needs cairosvg)")
+    parser.add_argument('--export-dir', metavar='PATH', default=os.environ.get('DRAWIO_EXPORT_DIR'),
+                        help="where previews and the viewer go (default: <output>/export)")
+    parser.add_argument('--fresh', action='store_true',
+                        help="discard manual edits in infrastructure_latest.drawio instead of merging them")
+    parser.add_argument('--highlight-changes', action='store_true',
+                        help="add a page highlighting what changed since the previous snapshot")
+    parser.add_argument('--diff-only', action='store_true',
+                        help="only compare the scan with the last rendered snapshot and write the change "
+                             "report; exit 3 if unchanged, 4 if changed")
+    parser.add_argument('--dump-inventory', metavar='PATH',
+                        help="only scan and save the inventory to PATH (.json, or .msgpack), do not render")
+    parser.add_argument('--from-inventory', metavar='PATH',
+                        help="render from an inventory saved with --dump-inventory instead of scanning Docker")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and re-render whenever Docker events change the topology")
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help="seconds of event quiet before a watch-mode re-render (default: 2)")
+    parser.add_argument('--serve', metavar='ADDRESS', nargs='?', const=':8765', default=os.environ.get('DRAWIO_SERVE'),
+                        help="keep running, follow Docker events and serve the diagram over HTTP on "
+                             "[host]:port (default: :8765)")
+    parser.add_argument('--cache-size', type=int, default=int(os.environ.get('DRAWIO_CACHE_SIZE', 8)),
+                        help="renders the diagram service keeps, one per inventory and option set (default: 8)")
+    parser.add_argument('--metrics', metavar='PATH', default=os.environ.get('DRAWIO_METRICS'),
+                        help="where to write the run's timing report (default: <output>/infrastructure_metrics.json)")
+    parser.add_argument('--prometheus-textfile', metavar='PATH', default=os.environ.get('DRAWIO_PROMETHEUS_TEXTFILE'),
+                        help="also write the run's metrics for the node_exporter textfile collector, "
+                             "e.g. /var/lib/node_exporter/textfile_collector/drawio.prom")
+    parser.add_argument('--profile', metavar='PATH', nargs='?', const='',
+                        help="run under cProfile, print the top functions and save the stats to PATH "
+                             "(default: <output>/infrastructure.prof)")
+    args = parser.parse_args()
+    
+    if args.compressed and args.backend != 'stream':
+        parser.error("--compressed requires the stream backend")
+    if args.lod and args.backend != 'stream':
+        parser.error("--lod requires the stream backend")
+    if args.lod and args.host_pages:
+        parser.error("--lod already draws detail pages, it cannot be combined with --host-pages")
+    try:
+        endpoints = parse_endpoints(args.hosts)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.watch and endpoints:
+        parser.error("--watch follows the local Docker daemon only, it cannot be combined with --hosts")
+    if args.from_inventory and (args.watch or endpoints or args.dump_inventory):
+        parser.error("--from-inventory renders a saved scan, it cannot be combined with "
+                     "--watch, --hosts or --dump-inventory")
+    if args.dump_inventory and args.watch:
+        parser.error("--dump-inventory scans once, it cannot be combined with --watch")
+    if args.diff_only and (args.watch or args.dump_inventory):
+        parser.error("--diff-only cannot be combined with --watch or --dump-inventory")
+    if args.serve and (args.watch or endpoints or args.from_inventory or args.dump_inventory or args.diff_only
+                       or args.export):
+        parser.error("--serve follows the local Docker daemon, it cannot be combined with "
+                     "--watch, --hosts, --from-inventory, --dump-inventory, --diff-only or --export")
+    if args.export:
+        from diagram_export import parse_formats
+        try:
+            args.export = parse_formats(args.export)
+        except (ValueError, ImportError) as e:
+            parser.error(str(e))
+    if args.serve and args.backend != 'stream':
+        parser.error("--serve requires the stream backend")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
+    
+    metrics = RunMetrics()
+    exit_code = EXIT_FAILED
+    try:
+        if args.profile is not None:
+            profiler = cProfile.Profile()
+            try:
+                exit_code = profiler.runcall(run, args, endpoints, metrics)
+            finally:
+                write_profile(profiler, args.profile or get_output_dir() / "infrastructure.prof")
+        else:
+            exit_code = run(args, endpoints, metrics)
+    finally:
+        metrics.finish(exit_code)
+        write_metrics(metrics, args.metrics or get_output_dir() / "infrastructure_metrics.json",
+                      args.prometheus_textfile)
+    return exit_code
+
+
+def write_metrics(metrics, path, prometheus_textfile=None):
+    """Write the run's timing report, and node_exporter metrics if asked; never fails the run"""
+    try:
+        metrics.write_json(path)
+        if prometheus_textfile:
+            metrics.write_prometheus(prometheus_textfile)
+    except OSError as e:
+        print(f"⚠️  Could not write run metrics: {e}")
+        return
+    print(f"⏱️  {metrics.describe()} (report: {path})")
+
+
+def write_profile(profiler, path, top=20):
+    """Save cProfile stats for later analysis (e.g. snakeviz) and print the most expensive calls"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(path)
+    print(f"\n🔬 Profile saved to: {path}")
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+
+
+def run(args, endpoints, metrics):
+    """Scan (or load) the infrastructure and render it as the command line asks; returns the exit code"""
+    scan_mode = os.environ.get('DRAWIO_SCAN_MODE', 'bulk')
+    render_options = {'layout': args.layout, 'backend': args.backend, 'compressed': args.compressed,
+                      'deploy': args.deploy, 'host_pages': args.host_pages,
+                      'highlight_changes': args.highlight_changes, 'fresh': args.fresh,
+                      'lod': args.lod, 'workers': args.workers,
+                      'export': args.export, 'export_dir': args.export_dir}
+    render_options['options_digest'] = render_options_digest(render_options)
+    cache = get_snapshot_cache()
+    # Only the labels the connection rules look at (and Traefik router rules, for the change
+    # report) are kept; saved inventories keep them all, they may be rendered with other rules
+    label_keys = None if args.dump_inventory else LabelKeys(
+        load_rules(os.environ.get('DRAWIO_RULES', DEFAULT_RULES_PATH)).label_keys, [ROUTE_LABEL_PATTERN])
+    
+    if args.watch:
+        from watch import InfrastructureWatcher
+        print("👀 Watching Docker events for topology changes (Ctrl+C to stop)...")
+        watcher = InfrastructureWatcher(lambda: InfrastructureScanner(mode=scan_mode, label_keys=label_keys),
+                                        partial(render_diagram, **render_options),
+                                        debounce=args.debounce,
+                                        last_fingerprint=None if args.force else
+                                        cache.load(render_options['options_digest']))
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            watcher.stop()
+        return EXIT_OK
+    
+    if args.serve:
+        from diagram_service import DiagramService, run_service
+        from watch import InfrastructureWatcher
+        print("👀 Watching Docker events and serving the diagram (Ctrl+C to stop)...")
+        service = DiagramService(partial(render_document, workers=args.workers), service_options(args),
+                                 cache_size=args.cache_size, inputs=render_inputs_digest)
+        watcher = InfrastructureWatcher(lambda: InfrastructureScanner(mode=scan_mode, label_keys=label_keys),
+                                        service.publish, debounce=args.debounce)
+        try:
+            run_service(service, args.serve, watcher)
+        except KeyboardInterrupt:
+            pass
+        return EXIT_OK
+    
+    if args.from_inventory:
+        print(f"📂 Loading inventory from {args.from_inventory}...")
+        with metrics.stage('load_inventory'):
+            # Filtered like a live scan, so an unchanged estate keeps its fingerprint and diff
+            infrastructure = load_inventory(args.from_inventory, label_keys=label_keys)
+    elif endpoints:
+        print(f"🔍 Scanning {len(endpoints)} Docker hosts in parallel...")
+        try:
+            infrastructure = scan_hosts(endpoints, mode=scan_mode, timeout=args.host_timeout,
+                                        label_keys=label_keys, metrics=metrics)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return EXIT_FAILED
+        print(f"Hosts: {', '.join(infrastructure.hosts)}")
+    else:
+        print("🔍 Scanning Docker infrastructure...")
+        scanner = InfrastructureScanner(mode=scan_mode, label_keys=label_keys, metrics=metrics)
+        infrastructure = scan_infrastructure(scanner)
+    
+    print(f"Found: {len(infrastructure.containers)} containers, "
+          f"{len(infrastructure.networks)} networks, "
+          f"{len(infrastructure.volumes)} volumes")
+    metrics.count(containers=len(infrastructure.containers), networks=len(infrastructure.networks),
+                  volumes=len(infrastructure.volumes), hosts=len(infrastructure.hosts or [None]))
+    
+    if args.dump_inventory:
+        with metrics.stage('save_inventory'):
+            save_inventory(infrastructure, args.dump_inventory)
+        print(f"\n✅ Inventory saved to: {args.dump_inventory}")
+        print(f"   Render it anywhere with --from-inventory {args.dump_inventory}")
+        return EXIT_OK
+    
+    with metrics.stage('fingerprint'):
+        fingerprint = inventory_fingerprint(infrastructure)
+    if args.diff_only:
+        previous = get_history_store().latest_scan()
+        if previous is None:
+            print("❌ No previous snapshot with a stored scan to compare against")
+            return EXIT_FAILED
+        diff = diff_against(previous, infrastructure, fingerprint, get_output_dir())
+        return EXIT_CHANGED if diff.changed else EXIT_UNCHANGED
     
-    # Also save as latest
-    latest_file = output_dir / "infrastructure_latest.drawio"
-    generator.save_diagram(str(latest_file))
+    if not args.force and cache.matches(fingerprint, render_options['options_digest']):
+        print(f"\n✅ Infrastructure unchanged since last run ({fingerprint[:12]}), skipping generation")
+        print(f"   Use --force to regenerate anyway")
+        latest = get_output_dir() / "infrastructure_latest.drawio"
+        if args.export and latest.exists():
+            # Previews of the unchanged diagram, e.g. the first run with --export
+            variables = publish_variables(datetime.now().strftime("%Y%m%d_%H%M%S"))
+            with metrics.stage('export'):
+                export_previews(latest.read_bytes(), args.export, args.export_dir, workers=args.workers,
+                                mirrors=get_publisher().export_dirs(variables, deploy=args.deploy))
+        return EXIT_UNCHANGED
     
-    # Also save to history
-    history_file = history_dir / f"infrastructure_{timestamp}.drawio"
-    generator.save_diagram(str(history_file))
+    written = render_diagram(infrastructure, fingerprint, metrics=metrics, **render_options)
+    latest_file = next((p for p in written if p.name == "infrastructure_latest.drawio"), written[0])
     
     print(f"\n✅ Diagram generation complete!")
     print(f"📁 Files created:")
-    print(f"   - {output_file}")
-    print(f"   - {latest_file}")
-    print(f"   - {history_file}")
+    for path in written:
+        print(f"   - {path}")
     print(f"\n📝 Next steps:")
     print(f"   1. Open {latest_file} in Draw.io")
     print(f"   2. All shapes are editable - move, resize, recolor as needed")
-    print(f"   3. Save your manual edits back to the same file")
+    print(f"   3. Save your manual edits back to the same file - later runs keep them (--fresh discards them)")
+    return EXIT_OK
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Diagram History Store
+Compressed, content-addressed diagram snapshots with scan deltas and time-bucketed retention
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from inventory import Inventory
+
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+# Every Nth stored scan is a full copy, so restoring one never replays more than N-1 deltas
+SCAN_KEYFRAME_INTERVAL = 24
+
+SCAN_SECTIONS = ('containers', 'networks', 'volumes')
+
+# The writer stamps each document with its render time; it is left out of the content hash
+# so re-rendering an unchanged infrastructure (e.g. with --force) stores no new object
+_MODIFIED_ATTRIBUTE = re.compile(rb'^(<mxfile[^>]*?) modified="[^"]*"')
+
+
+def diagram_digest(data):
+    """Content hash of a serialized diagram, ignoring its render timestamp"""
+    head, sep, rest = data.partition(b'\n')
+    return hashlib.sha256(_MODIFIED_ATTRIBUTE.sub(rb'\1', head) + sep + rest).hexdigest()
+
+
+def _item_key(item):
+    # Names are only unique per host in multi-host scans
+    return f"{item['host']}/{item['name']}" if 'host' in item else item['name']
+
+
+def scan_delta(base, scan):
+    """Per-section changes turning the `base` scan into `scan`, keyed by (host-qualified) name"""
+    delta = {}
+    if base.get('hosts') != scan.get('hosts'):
+        delta['hosts'] = scan.get('hosts')
+    for section in SCAN_SECTIONS:
+        old = {_item_key(item): item for item in base.get(section, [])}
+        new = {_item_key(item): item for item in scan.get(section, [])}
+        changes = {
+            'set': {name: item for name, item in new.items() if old.get(name) != item},
+            'removed': [name for name in old if name not in new],
+        }
+        # Order matters to the layouts; only record it when applying the delta would get it wrong.
+        # Added items are appended in name order: stored deltas are JSON with sorted keys
+        if [n for n in old if n in new] + sorted(n for n in new if n not in old) != list(new):
+            changes['order'] = list(new)
+        if changes['set'] or changes['removed'] or 'order' in changes:
+            delta[section] = changes
+    return delta
+
+
+def apply_scan_delta(base, delta):
+    """Inverse of scan_delta()"""
+    scan = {}
+    hosts = delta['hosts'] if 'hosts' in delta else base.get('hosts')
+    if hosts is not None:
+        scan['hosts'] = hosts
+    for section in SCAN_SECTIONS:
+        items = {_item_key(item): item for item in base.get(section, [])}
+        changes = delta.get(section)
+        if changes:
+            for name in changes['removed']:
+                del items[name]
+            for name in sorted(changes['set']):
+                items[name] = changes['set'][name]
+            if 'order' in changes:
+                items = {name: items[name] for name in changes['order']}
+        scan[section] = list(items.values())
+    return scan
+
+
+class RetentionPolicy:
+    """Keep the newest snapshot per hour for `hourly` hours and per day for `daily` days"""
+
+    def __init__(self, hourly=24, daily=30):
+        self.hourly = hourly
+        self.daily = daily
+
+    def keep(self, entries, now=None):
+        """Subset of `entries` (oldest first) to retain; the newest entry is always kept"""
+        if not entries:
+            return []
+        now = now or datetime.now()
+        hourly_cutoff = now - timedelta(hours=self.hourly)
+        daily_cutoff = now - timedelta(days=self.daily)
+
+        kept = {}
+        for entry in entries:
+            taken = datetime.strptime(entry['timestamp'], TIMESTAMP_FORMAT)
+            if taken >= hourly_cutoff:
+                bucket = taken.strftime("%Y%m%d%H")
+            elif taken >= daily_cutoff:
+                bucket = taken.strftime("%Y%m%d")
+            else:
+                continue
+            # Later entries overwrite earlier ones, leaving the newest per bucket
+            kept[bucket] = entry
+        kept[entries[-1]['timestamp']] = entries[-1]
+        retained = {id(entry) for entry in kept.values()}
+        return [entry for entry in entries if id(entry) in retained]
+
+
+class HistoryStore:
+    """Diagram history under `root`: zlib objects named by content hash plus a JSON index
+
+    The index lists every snapshot (timestamp, diagram hash, scan fingerprint, scan object)
+    oldest first, so listing history never opens an object. Snapshots whose diagram carries
+    merged manual edits also name the unmerged render, the base the next merge starts from.
+    """
+
+    def __init__(self, root, keep_scans=True, keyframe_interval=SCAN_KEYFRAME_INTERVAL):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.index_path = self.root / "index.json"
+        self.keep_scans = keep_scans
+        self.keyframe_interval = keyframe_interval
+
+    def entries(self):
+        """Snapshots in the index, oldest first"""
+        try:
+            return json.loads(self.index_path.read_text())['snapshots']
+        except FileNotFoundError:
+            return []
+
+    def add(self, data, timestamp, infrastructure=None, fingerprint=None, render=None):
+        """Record one published diagram (and optionally the scan behind it); returns the index entry
+
+        `render` is the generator's output before manual edits were merged into `data`, if any.
+        """
+        entries = self.entries()
+        entry = {
+            'timestamp': timestamp,
+            'diagram': self._put(data, digest=diagram_digest(data)),
+            'size': len(data),
+            'fingerprint': fingerprint,
+            'scan': None,
+        }
+        if render is not None and diagram_digest(render) != entry['diagram']:
+            entry['render'] = self._put(render, digest=diagram_digest(render))
+        if self.keep_scans and infrastructure is not None:
+            entry['scan'] = self._put_scan(infrastructure, entries)
+        # Re-rendering within the same second replaces that snapshot instead of duplicating it
+        entries = [e for e in entries if e['timestamp'] != timestamp]
+        entries.append(entry)
+        entries.sort(key=lambda e: e['timestamp'])
+        self._write_index(entries)
+        return entry
+
+    def diagram(self, timestamp):
+        """Serialized diagram stored for a snapshot"""
+        return self._get(self._entry(timestamp)['diagram'])
+
+    def scan(self, timestamp):
+        """Inventory stored for a snapshot, rebuilt from its keyframe and deltas"""
+        digest = self._entry(timestamp)['scan']
+        if digest is None:
+            raise LookupError(f"No scan stored for snapshot {timestamp}")
+        return Inventory.from_dict(self._load_scan(digest))
+
+    def latest_diagram(self):
+        """Serialized diagram of the newest snapshot, or None"""
+        entries = self.entries()
+        return self._get(entries[-1]['diagram']) if entries else None
+
+    def latest_render(self):
+        """Unmerged render of the newest snapshot (its diagram if nothing was merged), or None"""
+        entries = self.entries()
+        if not entries:
+            return None
+        return self._get(entries[-1].get('render') or entries[-1]['diagram'])
+
+    def latest_scan(self):
+        """(timestamp, Inventory) of the newest snapshot with a stored scan, or None"""
+        for entry in reversed(self.entries()):
+            if entry.get('scan'):
+                return entry['timestamp'], Inventory.from_dict(self._load_scan(entry['scan']))
+        return None
+
+    def prune(self, policy=None, now=None):
+        """Apply the retention policy and delete objects nothing refers to; returns entries removed"""
+        entries = self.entries()
+        kept = (policy or RetentionPolicy()).keep(entries, now=now)
+        if len(kept) != len(entries):
+            self._write_index(kept)
+        self._collect_garbage(kept)
+        return len(entries) - len(kept)
+
+    def _entry(self, timestamp):
+        for entry in self.entries():
+            if entry['timestamp'] == timestamp:
+                return entry
+        raise LookupError(f"No snapshot {timestamp} in {self.root}")
+
+    def _put_scan(self, infrastructure, entries):
+        scan = infrastructure.as_dict()
+        previous = next((e for e in reversed(entries) if e.get('scan')), None)
+        if previous is not None:
+            record = json.loads(self._get(previous['scan']))
+            depth = record.get('depth', 0) + 1 if 'delta' in record else 1
+            if depth < self.keyframe_interval:
+                delta = scan_delta(self._load_scan(previous['scan']), scan)
+                return self._put_json({'base': previous['scan'], 'depth': depth, 'delta': delta})
+        return self._put_json({'scan': scan})
+
+    def _load_scan(self, digest):
+        # Walk back to the keyframe, then replay the deltas forwards
+        chain = []
+        record = json.loads(self._get(digest))
+        while 'delta' in record:
+            chain.append(record['delta'])
+            record = json.loads(self._get(record['base']))
+        scan = record['scan']
+        for delta in reversed(chain):
+            scan = apply_scan_delta(scan, delta)
+        return scan
+
+    def _collect_garbage(self, entries):
+        live = set()
+        for entry in entries:
+            live.add(entry['diagram'])
+            if entry.get('render'):
+                live.add(entry['render'])
+            digest = entry.get('scan')
+            while digest and digest not in live:
+                live.add(digest)
+                digest = json.loads(self._get(digest)).get('base')
+        if not self.objects.is_dir():
+            return
+        for path in self.objects.glob("*/*"):
+            if path.name not in live:
+                path.unlink()
+
+    def _object_path(self, digest):
+        return self.objects / digest[:2] / digest
+
+    def _put_json(self, record):
+        return self._put(json.dumps(record, sort_keys=True, separators=(',', ':')).encode())
+
+    def _put(self, data, digest=None):
+        """Store `data` compressed unless an object with the same hash exists; returns the hash"""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f".{digest}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(zlib.compress(data, 9))
+            tmp_path.replace(path)
+        return digest
+
+    def _get(self, digest):
+        return zlib.decompress(self._object_path(digest).read_bytes())
+
+    def _write_index(self, entries):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        tmp_path.write_text(json.dumps({'snapshots': entries}, indent=1))
+        tmp_path.replace(self.index_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and restore diagram history")
+    parser.add_argument('root', help="history directory, e.g. <output>/history")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="list snapshots from the index")
+    show = commands.add_parser('show', help="write a snapshot's diagram (or --scan) to stdout")
+    show.add_argument('timestamp')
+    show.add_argument('--scan', action='store_true', help="print the scan result instead of the diagram")
+    prune = commands.add_parser('prune', help="apply the retention policy")
+    prune.add_argument('--hourly', type=int, default=24, help="hours to keep one snapshot per hour")
+    prune.add_argument('--daily', type=int, default=30, help="days to keep one snapshot per day")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.root)
+    if args.command == 'list':
+        for entry in store.entries():
+            scan = "scan" if entry.get('scan') else "    "
+            print(f"{entry['timestamp']}  {entry['diagram'][:12]}  {scan}  {entry['size']:>9} bytes")
+    elif args.command == 'show':
+        if args.scan:
+            print(json.dumps(store.scan(args.timestamp).as_dict(), indent=2))
+        else:
+            sys.stdout.buffer.write(store.diagram(args.timestamp))
+    else:
+        removed = store.prune(RetentionPolicy(args.hourly, args.daily))
+        print(f"Removed {removed} snapshots")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Infrastructure Inventory Model
+Compact typed records for scan results, saved as row-based JSON or msgpack
+"""
+
+import json
+import re
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, only needed for .msgpack inventory files
+    msgpack = None
+
+# Bump when the file layout changes; older files are rejected rather than misread
+INVENTORY_FORMAT_VERSION = 1
+
+# `host` is None for single-host scans; `env_hosts` are the hostnames the container's
+# environment refers to (see dependencies.env_host_references), never the values themselves
+Container = namedtuple('Container', ['name', 'image', 'status', 'networks', 'ports', 'labels', 'host', 'env_hosts'],
+                       defaults=(None, ()))
+Network = namedtuple('Network', ['name', 'driver', 'scope', 'host'], defaults=(None,))
+Volume = namedtuple('Volume', ['name', 'driver', 'host'], defaults=(None,))
+
+RECORD_TYPES = {'containers': Container, 'networks': Network, 'volumes': Volume}
+
+_intern = sys.intern
+
+
+class LabelKeys:
+    """Container label keys to keep while scanning: exact keys plus full-match key patterns"""
+
+    __slots__ = ('keys', 'pattern')
+
+    def __init__(self, keys=(), patterns=()):
+        self.keys = frozenset(keys)
+        self.pattern = re.compile('|'.join(f"(?:{p})" for p in patterns)) if patterns else None
+
+    def __contains__(self, key):
+        return key in self.keys or (self.pattern is not None and self.pattern.fullmatch(key) is not None)
+
+
+def make_container(name, image, status, networks, ports, labels, host=None, label_keys=None, env_hosts=()):
+    """Container record with interned repeated strings and only the wanted label keys
+
+    `label_keys` is a set or LabelKeys of the label keys to keep; None keeps all.
+    """
+    if label_keys is not None:
+        labels = {k: v for k, v in labels.items() if k in label_keys}
+    return Container(
+        name,
+        _intern(image),
+        status,
+        tuple(_intern(n) for n in networks),
+        tuple(ports),
+        {_intern(k): v for k, v in labels.items()},
+        _intern(host) if host else None,
+        tuple(_intern(h) for h in env_hosts),
+    )
+
+
+def make_network(name, driver, scope, host=None):
+    return Network(_intern(name), _intern(driver), _intern(scope), _intern(host) if host else None)
+
+
+def make_volume(name, driver, host=None):
+    return Volume(name, _intern(driver), _intern(host) if host else None)
+
+
+def qualified_name(record):
+    """Name that is unique across hosts"""
+    return f"{record.host}/{record.name}" if record.host else record.name
+
+
+class Inventory(namedtuple('Inventory', ['containers', 'networks', 'volumes', 'hosts'], defaults=(None,))):
+    """One scan: containers, networks and volumes, plus the hosts they came from for multi-host scans"""
+
+    __slots__ = ()
+
+    def for_host(self, host):
+        """The part of a multi-host inventory that belongs to one host"""
+        return Inventory([c for c in self.containers if c.host == host],
+                         [n for n in self.networks if n.host == host],
+                         [v for v in self.volumes if v.host == host])
+
+    def as_dict(self):
+        """Plain dicts, the form fingerprints and history deltas are computed on"""
+        data = {section: [_record_dict(r) for r in getattr(self, section)] for section in RECORD_TYPES}
+        if self.hosts is not None:
+            data['hosts'] = list(self.hosts)
+        return data
+
+    @classmethod
+    def from_dict(cls, data, label_keys=None):
+        """Inverse of as_dict(); also reads older scan results stored as plain dicts
+
+        `label_keys` filters container labels as make_container() does; None keeps all.
+        """
+        return cls(
+            [make_container(**c, label_keys=label_keys) for c in data.get('containers', ())],
+            [make_network(n['name'], n['driver'], n.get('scope', 'local'), n.get('host')) for n in data.get('networks', ())],
+            [make_volume(v['name'], v['driver'], v.get('host')) for v in data.get('volumes', ())],
+            list(data['hosts']) if data.get('hosts') is not None else None,
+        )
+
+
+def _record_dict(record):
+    data = record._asdict()
+    if data['host'] is None:
+        del data['host']
+    # Left out when empty, so inventories and fingerprints without any stay as they were
+    if 'env_hosts' in data and not data['env_hosts']:
+        del data['env_hosts']
+    for key, value in data.items():
+        if isinstance(value, tuple):
+            data[key] = list(value)
+    return data
+
+
+def _to_rows(inventory):
+    # Records as positional rows; the field names are written once per section
+    return {
+        'version': INVENTORY_FORMAT_VERSION,
+        'hosts': inventory.hosts,
+        'fields': {section: list(record_type._fields) for section, record_type in RECORD_TYPES.items()},
+        **{section: [list(record) for record in getattr(inventory, section)] for section in RECORD_TYPES},
+    }
+
+
+def _from_rows(data, label_keys=None):
+    if data.get('version') != INVENTORY_FORMAT_VERSION:
+        raise ValueError(f"Unsupported inventory format version {data.get('version')!r}, "
+                         f"expected {INVENTORY_FORMAT_VERSION}")
+    sections = {}
+    for section, record_type in RECORD_TYPES.items():
+        fields = data['fields'][section]
+        sections[section] = [dict(zip(fields, row)) for row in data.get(section, ())]
+    return Inventory.from_dict(dict(sections, hosts=data.get('hosts')), label_keys=label_keys)
+
+
+def save_inventory(inventory, path):
+    """Write an inventory as JSON, or msgpack for a .msgpack path"""
+    path = Path(path)
+    rows = _to_rows(inventory)
+    if path.suffix == '.msgpack':
+        if msgpack is None:
+            raise ImportError(f"msgpack is required to write {path} (pip install msgpack)")
+        data = msgpack.packb(rows, use_bin_type=True)
+    else:
+        data = json.dumps(rows, separators=(',', ':')).encode()
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def load_inventory(path, label_keys=None):
+    """Read an inventory written by save_inventory()
+
+    Saved inventories keep every label; `label_keys` narrows them to what a live scan would keep.
+    """
+    path = Path(path)
+    if path.suffix == '.msgpack':
+        if msgpack is None:
+            raise ImportError(f"msgpack is required to read {path} (pip install msgpack)")
+        rows = msgpack.unpackb(path.read_bytes(), raw=False)
+    else:
+        rows = json.loads(path.read_bytes())
+    return _from_rows(rows, label_keys=label_keys)
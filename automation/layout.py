@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Diagram Layout Engines
+Positions network boxes and containers for DrawioDiagramGenerator
+"""
+
+import math
+from collections import namedtuple
+
+NetworkBox = namedtuple('NetworkBox', ['name', 'x', 'y', 'width', 'height', 'containers'])
+
+# Container node geometry shared by every layout
+NODE_WIDTH = 150
+NODE_HEIGHT = 80
+CELL_WIDTH = 180   # Horizontal pitch between containers inside a box
+CELL_HEIGHT = 120  # Vertical pitch between container rows
+BOX_PADDING = 50
+
+# Traefik is pinned right below the Internet cloud, between it and the network boxes
+TRAEFIK_POSITION = (425, 180)
+
+
+class LayoutResult:
+    """Network boxes in drawing order, container positions and where the legend goes"""
+
+    def __init__(self, boxes, positions, legend_position):
+        self.boxes = boxes
+        self.positions = positions
+        self.legend_position = legend_position
+
+
+class FixedLayout:
+    """The original hand-tuned layout: fixed 800px boxes stacked at fixed offsets"""
+
+    NETWORK_ORDER = ['traefik-proxy', 'keycloak-net', 'postgres-net', 'mailu']
+    NETWORK_Y_POSITIONS = {
+        'traefik-proxy': 280,   # Just below Traefik
+        'keycloak-net': 930,    # 280 + 600 (traefik-proxy height) + 50 (gap)
+        'postgres-net': 1280,   # 930 + 350
+        'mailu': 1630,          # 1280 + 350
+    }
+    OTHER_NETWORK_Y = 1980  # Start position for other networks (1630 + 350)
+
+    def arrange(self, networks, containers):
+        # Priority networks first in their fixed slots, then all others stacked below
+        by_name = {}
+        for network in networks:
+            by_name.setdefault(network.name, network)
+        boxes = {}
+        for name in self.NETWORK_ORDER:
+            if name in by_name:
+                # Make traefik-proxy network twice as tall
+                height = 600 if name == 'traefik-proxy' else 300
+                boxes[name] = NetworkBox(name, 100, self.NETWORK_Y_POSITIONS[name], 800, height, [])
+        other_y = self.OTHER_NETWORK_Y
+        for network in networks:
+            if network.name not in boxes:
+                boxes[network.name] = NetworkBox(network.name, 100, other_y, 800, 300, [])
+                other_y += 350
+
+        positions = {}
+        for placed, container in enumerate(containers):
+            if container.name == 'traefik':
+                positions[container.name] = TRAEFIK_POSITION
+                continue
+            # Place container in its primary network, in a 4-column grid
+            primary_network = container.networks[0] if container.networks else None
+            box = boxes.get(primary_network)
+            if box is not None:
+                slot = len(box.containers)
+                positions[container.name] = (box.x + BOX_PADDING + (slot % 4) * CELL_WIDTH,
+                                                box.y + BOX_PADDING + (slot // 4) * CELL_HEIGHT)
+                box.containers.append(container.name)
+            else:
+                # Standalone container, one row further down per container placed so far
+                positions[container.name] = (950, 100 + placed * CELL_HEIGHT)
+
+        return LayoutResult(list(boxes.values()), positions, (950, 600))
+
+
+class ShelfLayout:
+    """Boxes sized from their member count and packed onto shelves, tallest first"""
+
+    ORIGIN = (100, 280)  # Below the Internet cloud and Traefik
+    GAP = 50
+    MIN_BOX_WIDTH = 250
+    MIN_BOX_HEIGHT = 150
+
+    def __init__(self, max_width=None):
+        # Shelf width; by default derived from the total area so the result stays roughly square
+        self.max_width = max_width
+
+    def home_network(self, container, member_counts):
+        """Box a container is drawn in: its most specific (smallest) drawn network"""
+        candidates = [n for n in container.networks if n in member_counts]
+        if not candidates:
+            return None
+        # Multi-homed containers sit with their private backends, not inside the shared hub
+        return min(candidates, key=lambda n: member_counts[n])
+
+    def box_size(self, members):
+        """(columns, width, height) of a box for `members` containers: a square grid, no wider than a shelf"""
+        columns = max(1, math.ceil(math.sqrt(members)))
+        if self.max_width:
+            columns = min(columns, max(1, (self.max_width - 2 * BOX_PADDING + CELL_WIDTH - NODE_WIDTH) // CELL_WIDTH))
+        rows = math.ceil(members / columns)
+        width = 2 * BOX_PADDING + columns * CELL_WIDTH - (CELL_WIDTH - NODE_WIDTH)
+        height = 2 * BOX_PADDING + rows * CELL_HEIGHT - (CELL_HEIGHT - NODE_HEIGHT)
+        return columns, max(width, self.MIN_BOX_WIDTH), max(height, self.MIN_BOX_HEIGHT)
+
+    def arrange(self, networks, containers):
+        network_names = list(dict.fromkeys(n.name for n in networks))
+        member_counts = dict.fromkeys(network_names, 0)
+        for container in containers:
+            for network in container.networks:
+                if network in member_counts:
+                    member_counts[network] += 1
+
+        # Assign every container to one group; None collects standalone containers
+        groups = {name: [] for name in network_names}
+        groups[None] = []
+        positions = {}
+        for container in containers:
+            if container.name == 'traefik':
+                positions[container.name] = TRAEFIK_POSITION
+                continue
+            groups[self.home_network(container, member_counts)].append(container)
+
+        # Multi-homed containers go first, in the top rows closest to the boxes above
+        for members in groups.values():
+            members.sort(key=lambda c: len(c.networks) < 2)
+
+        sized = []
+        for name, members in groups.items():
+            if name is None and not members:
+                continue
+            columns, width, height = self.box_size(len(members))
+            sized.append((name, members, columns, width, height))
+
+        # Tallest boxes first so each shelf wastes little height; ties keep scan order
+        sized.sort(key=lambda s: -s[4])
+        max_width = self.max_width or max(
+            1600, int(math.sqrt(sum(s[3] * s[4] for s in sized)) * 1.5))
+
+        boxes = []
+        x, y = self.ORIGIN
+        shelf_height = 0
+        right_edge = x
+        for name, members, columns, width, height in sized:
+            if x > self.ORIGIN[0] and x + width > self.ORIGIN[0] + max_width:
+                x, y = self.ORIGIN[0], y + shelf_height + self.GAP
+                shelf_height = 0
+            for slot, container in enumerate(members):
+                positions[container.name] = (x + BOX_PADDING + (slot % columns) * CELL_WIDTH,
+                                                y + BOX_PADDING + (slot // columns) * CELL_HEIGHT)
+            # Standalone containers reserve space but get no network box
+            if name is not None:
+                boxes.append(NetworkBox(name, x, y, width, height, [c.name for c in members]))
+            right_edge = max(right_edge, x + width)
+            shelf_height = max(shelf_height, height)
+            x += width + self.GAP
+
+        return LayoutResult(boxes, positions, (right_edge + self.GAP, self.ORIGIN[1]))
+
+
+LAYOUTS = {
+    'auto': ShelfLayout,
+    'fixed': FixedLayout,
+}
+
+
+def get_layout(name):
+    """Layout engine instance for a preset name"""
+    if name not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{name}', expected one of {', '.join(LAYOUTS)}")
+    return LAYOUTS[name]()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Diagram Publisher
+Writes one serialized diagram to every destination in the publish manifest, atomically
+"""
+
+import json
+import os
+from pathlib import Path
+from string import Template
+
+DEFAULT_MANIFEST_PATH = Path(__file__).parent / "publish_manifest.json"
+
+
+class Destination:
+    """One place the diagram is published to"""
+
+    def __init__(self, spec):
+        self.path = spec['path']
+        # Shared destinations are never edited in place, so they may be hardlinks of each other
+        self.shared = spec.get('shared', False)
+        # Deploy destinations are web roots, only written when deploying
+        self.deploy = spec.get('deploy', False)
+        # Export destinations are directories --export previews are mirrored to, not diagram files
+        self.export = spec.get('export', False)
+
+
+class Publisher:
+    """Fans one serialized diagram out to the manifest destinations"""
+
+    def __init__(self, destinations):
+        self.destinations = destinations
+
+    @classmethod
+    def from_manifest(cls, path=DEFAULT_MANIFEST_PATH):
+        spec = json.loads(Path(path).read_text())
+        return cls([Destination(d) for d in spec['destinations']])
+
+    def publish(self, data, variables, deploy=False):
+        """Write `data` to every destination, returning the paths written"""
+        written = []
+        shared_source = None
+        for destination in self.destinations:
+            if destination.export or (destination.deploy and not deploy):
+                continue
+            path = Path(Template(destination.path).substitute(variables))
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            linked = False
+            if destination.shared and shared_source is not None:
+                linked = self._replace_with_link(shared_source, path)
+            if not linked:
+                self._replace_with_data(data, path)
+            if destination.shared and shared_source is None:
+                shared_source = path
+            written.append(path)
+        return written
+
+    def export_dirs(self, variables, deploy=False):
+        """Directories the static previews are mirrored to (see diagram_export.mirror_export)"""
+        return [Path(Template(destination.path).substitute(variables)) for destination in self.destinations
+                if destination.export and (deploy or not destination.deploy)]
+
+    @staticmethod
+    def _temp_path(path):
+        return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+    def _replace_with_data(self, data, path):
+        """Write to a temporary file and rename it over the destination"""
+        tmp_path = self._temp_path(path)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def _replace_with_link(self, source, path):
+        """Hardlink an already published copy into place; False where the filesystem refuses"""
+        tmp_path = self._temp_path(path)
+        try:
+            tmp_path.unlink(missing_ok=True)
+            os.link(source, tmp_path)
+            os.replace(tmp_path, path)
+            return True
+        except OSError:
+            # Different filesystem (EXDEV) or no hardlink support: fall back to a copy
+            tmp_path.unlink(missing_ok=True)
+            return False
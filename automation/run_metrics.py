@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Run Metrics
+Per-stage timings, Docker call counts, diagram size and peak memory of one pipeline run,
+written as a JSON report and as Prometheus textfile metrics for node_exporter
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+REPORT_VERSION = 1
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+PROMETHEUS_PREFIX = "drawio"
+
+
+def peak_rss(who=resource.RUSAGE_SELF):
+    """High-water mark of resident memory in bytes, of this process or its waited-for children"""
+    return resource.getrusage(who).ru_maxrss * _RSS_UNIT
+
+
+class RunMetrics:
+    """Measurements of one run; safe to record into from several threads
+
+    Stages may nest (add_connections runs inside generate_diagram) and may repeat (one
+    scan per host), so stage times are summed per name and not additive across names.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.calls = {}
+        self.counts = {}
+        self.output = {}
+        self.exit_code = None
+        self.duration = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as one run of stage `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stage = self.stages.setdefault(name, {'seconds': 0.0, 'runs': 0, 'peak_rss_bytes': 0})
+                stage['seconds'] += elapsed
+                stage['runs'] += 1
+                # Memory high-water mark when the stage ended, shows which stage raised it
+                stage['peak_rss_bytes'] = peak_rss()
+
+    def record_call(self, kind, seconds):
+        """Count one external call, e.g. kind='subprocess' for a docker CLI run"""
+        with self._lock:
+            call = self.calls.setdefault(kind, {'count': 0, 'seconds': 0.0})
+            call['count'] += 1
+            call['seconds'] += seconds
+
+    def count(self, **counts):
+        """Record sizes such as containers=..., nodes=..., edges=..."""
+        with self._lock:
+            self.counts.update(counts)
+
+    def finish(self, exit_code):
+        """Close the run with its total wall time and exit code"""
+        self.duration = time.perf_counter() - self._start
+        self.exit_code = exit_code
+
+    def as_dict(self):
+        return {
+            'version': REPORT_VERSION,
+            'started': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            'exit_code': self.exit_code,
+            'duration_seconds': self.duration,
+            'stages': self.stages,
+            'calls': self.calls,
+            'counts': self.counts,
+            'output': self.output,
+            'peak_rss_bytes': peak_rss(),
+            'peak_rss_children_bytes': peak_rss(resource.RUSAGE_CHILDREN),
+        }
+
+    def write_json(self, path):
+        """Write the report atomically"""
+        _write_atomic(Path(path), json.dumps(self.as_dict(), indent=2) + "\n")
+
+    def write_prometheus(self, path):
+        """Write node_exporter textfile collector metrics atomically (the collector must never see half a file)"""
+        report = self.as_dict()
+        metrics = [
+            ('run_timestamp_seconds', "Start time of the last run", [({}, self.started)]),
+            ('run_duration_seconds', "Wall time of the last run", [({}, report['duration_seconds'])]),
+            ('run_exit_code', "Exit code of the last run (3: unchanged, skipped)", [({}, report['exit_code'])]),
+            ('stage_duration_seconds', "Wall time per pipeline stage in the last run",
+             [({'stage': name}, stage['seconds']) for name, stage in report['stages'].items()]),
+            ('calls', "External calls made in the last run, by kind",
+             [({'kind': kind}, call['count']) for kind, call in report['calls'].items()]),
+            ('call_duration_seconds', "Time spent in external calls in the last run, by kind",
+             [({'kind': kind}, call['seconds']) for kind, call in report['calls'].items()]),
+            ('inventory_items', "Items in the last scan and diagram, by kind",
+             [({'kind': kind}, value) for kind, value in report['counts'].items()]),
+            ('output_bytes', "Size of the last serialized diagram", [({}, report['output'].get('bytes'))]),
+            ('peak_rss_bytes', "Peak resident memory of the last run",
+             [({'process': 'self'}, report['peak_rss_bytes']),
+              ({'process': 'children'}, report['peak_rss_children_bytes'])]),
+        ]
+        lines = []
+        for name, description, samples in metrics:
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                continue
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape_label(text)}"' for key, text in labels.items())
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value!r}" if label_text
+                             else f"{PROMETHEUS_PREFIX}_{name} {value!r}")
+        _write_atomic(Path(path), "\n".join(lines) + "\n")
+
+    def describe(self):
+        """Short human-readable timing summary"""
+        parts = [f"{name} {stage['seconds']:.2f}s" for name, stage in self.stages.items()]
+        for kind, call in self.calls.items():
+            parts.append(f"{call['count']} {kind} calls {call['seconds']:.2f}s")
+        return ', '.join(parts)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text)
+    tmp_path.replace(path)
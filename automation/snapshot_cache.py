@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Snapshot Cache
+Content-addresses scan results so unchanged infrastructure skips regeneration
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+# Bump when the canonical form changes so older fingerprints stop matching
+FINGERPRINT_VERSION = 2
+
+# Fields that change on every scan without changing the topology (e.g. "Up 3 hours")
+VOLATILE_CONTAINER_FIELDS = {'status'}
+
+
+def _canonical_container(container):
+    canonical = {k: v for k, v in container.items() if k not in VOLATILE_CONTAINER_FIELDS}
+    canonical['networks'] = sorted(container.get('networks', []))
+    canonical['ports'] = sorted(container.get('ports', []))
+    return canonical
+
+
+def _sort_key(item):
+    # Names are only unique per host in multi-host inventories
+    return item.get('host', ''), item['name']
+
+
+def inventory_fingerprint(inventory):
+    """Order-independent SHA-256 of a scan result (an Inventory)"""
+    infrastructure = inventory.as_dict()
+    canonical = {
+        'version': FINGERPRINT_VERSION,
+        'containers': sorted((_canonical_container(c) for c in infrastructure['containers']), key=_sort_key),
+        'networks': sorted(infrastructure['networks'], key=_sort_key),
+        'volumes': sorted(infrastructure['volumes'], key=_sort_key),
+    }
+    # Multi-host inventories; left out otherwise so single-host fingerprints stay the same
+    if 'hosts' in infrastructure:
+        canonical['hosts'] = sorted(infrastructure['hosts'])
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _file_digest(path):
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def options_digest(options, paths=()):
+    """SHA-256 of render options and of the contents of the files that shape the diagram"""
+    canonical = {
+        'options': options,
+        'files': [_file_digest(path) for path in paths],
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SnapshotCache:
+    """Fingerprint of the last rendered scan and digest of its render options, stored next to the latest diagram
+
+    The file holds `fingerprint:options_digest`; a scan only counts as unchanged when both match.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self, options_digest=None):
+        """Return the stored fingerprint, or None if nothing has been rendered yet
+
+        With `options_digest`, also None if the last render used other options.
+        """
+        try:
+            fingerprint, _, stored_options = self.path.read_text().strip().partition(':')
+        except FileNotFoundError:
+            return None
+        if options_digest is not None and stored_options != options_digest:
+            return None
+        return fingerprint or None
+
+    def matches(self, fingerprint, options_digest=None):
+        return self.load(options_digest) == fingerprint
+
+    def store(self, fingerprint, options_digest=None):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(f"{fingerprint}:{options_digest}\n" if options_digest else fingerprint + "\n")
+        tmp_path.replace(self.path)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+The shipped connection_rules.json draws the same edges as the hand-written linking it replaced
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from connection_rules import DEFAULT_RULES_PATH, load_rules
+from inventory import make_container
+
+ROUTED = {'traefik.enable': 'true'}
+
+
+def container(name, image, labels=None):
+    return make_container(name, image, 'Up 2 days', ['traefik-proxy'], [], labels or {})
+
+
+ESTATE = [
+    container('traefik', 'traefik:v3.1', ROUTED),
+    container('traefik-certs-dumper', 'ldez/traefik-certs-dumper:v2.8.3', ROUTED),
+    container('traefik-internal', 'traefik:v3.1'),
+    container('keycloak', 'quay.io/keycloak/keycloak:26.0', ROUTED),
+    container('keycloak-postgres', 'postgres:16'),
+    container('postgres', 'postgres:16'),
+    container('pgadmin', 'dpage/pgadmin4:8.12', ROUTED),
+    container('portainer', 'portainer/portainer-ce:2.21'),
+    container('drawio', 'jgraph/drawio:24.7', ROUTED),
+    container('drawio-auth-proxy', 'quay.io/oauth2-proxy/oauth2-proxy:v7.6.0', ROUTED),
+]
+
+
+def rule_edges(containers):
+    rules = load_rules(DEFAULT_RULES_PATH)
+    return [(source, target, rule.label)
+            for source, target, rule in rules.evaluate(containers, node_id=lambda c: f"container_{c.name}")]
+
+
+def baseline_edges(containers):
+    """The linking logic of add_connections before the rule engine, transcribed"""
+    edges = []
+    names = {c.name for c in containers}
+    if 'traefik' in names:
+        edges.append(('internet', 'container_traefik', "HTTPS (443)\nHTTP (80)"))
+        for name, port in (('keycloak', '8443'), ('pgadmin', '8901'), ('postgres', '5432'),
+                           ('portainer', '9000'), ('shellhub-ssh', '2222')):
+            if name in names:
+                edges.append(('internal_network', f"container_{name}", f"Port {port}"))
+    for traefik in containers:
+        if 'traefik' not in traefik.name.lower() or 'certs-dumper' in traefik.name.lower():
+            continue
+        for target in containers:
+            if target.name != traefik.name and any('traefik.enable=true' in f"{key}={value}"
+                                                   for key, value in target.labels.items()):
+                edges.append((f"container_{traefik.name}", f"container_{target.name}", "routes"))
+    if 'keycloak' in names and 'keycloak-postgres' in names:
+        edges.append(('container_keycloak', 'container_keycloak-postgres', "database"))
+    for proxy in containers:
+        if ('oauth2-proxy' in proxy.image.lower() or 'oauth' in proxy.name.lower()) \
+                and proxy.name == 'drawio-auth-proxy' and 'drawio' in names:
+            edges.append(('container_drawio-auth-proxy', 'container_drawio', "protects"))
+    if 'pgadmin' in names and 'postgres' in names:
+        edges.append(('container_pgadmin', 'container_postgres', "manages"))
+    return edges
+
+
+class ConnectionRulesTest(unittest.TestCase):
+
+    def test_exact_edges(self):
+        self.assertEqual(rule_edges(ESTATE), [
+            ('internet', 'container_traefik', "HTTPS (443)\nHTTP (80)"),
+            ('internal_network', 'container_keycloak', "Port 8443"),
+            ('internal_network', 'container_pgadmin', "Port 8901"),
+            ('internal_network', 'container_postgres', "Port 5432"),
+            ('internal_network', 'container_portainer', "Port 9000"),
+            # The certs dumper is routed to, but never routes; no container routes to itself
+            ('container_traefik', 'container_traefik-certs-dumper', "routes"),
+            ('container_traefik', 'container_keycloak', "routes"),
+            ('container_traefik', 'container_pgadmin', "routes"),
+            ('container_traefik', 'container_drawio', "routes"),
+            ('container_traefik', 'container_drawio-auth-proxy', "routes"),
+            ('container_traefik-internal', 'container_traefik', "routes"),
+            ('container_traefik-internal', 'container_traefik-certs-dumper', "routes"),
+            ('container_traefik-internal', 'container_keycloak', "routes"),
+            ('container_traefik-internal', 'container_pgadmin', "routes"),
+            ('container_traefik-internal', 'container_drawio', "routes"),
+            ('container_traefik-internal', 'container_drawio-auth-proxy', "routes"),
+            ('container_keycloak', 'container_keycloak-postgres', "database"),
+            ('container_drawio-auth-proxy', 'container_drawio', "protects"),
+            ('container_pgadmin', 'container_postgres', "manages"),
+        ])
+
+    def test_matches_baseline(self):
+        self.assertEqual(rule_edges(ESTATE), baseline_edges(ESTATE))
+
+    def test_lan_edges_require_traefik(self):
+        estate = [c for c in ESTATE if c.name != 'traefik']
+        edges = rule_edges(estate)
+        self.assertFalse([e for e in edges if e[0] in ('internet', 'internal_network')])
+        self.assertIn(('container_keycloak', 'container_keycloak-postgres', "database"), edges)
+        self.assertEqual(edges, baseline_edges(estate))
+
+    def test_auth_proxy_needs_name_and_image(self):
+        impostors = [
+            container('drawio', 'jgraph/drawio:24.7'),
+            container('drawio-auth-proxy', 'nginx:1.27'),
+            container('other-proxy', 'quay.io/oauth2-proxy/oauth2-proxy:v7.6.0'),
+        ]
+        self.assertEqual(rule_edges(impostors), [])
+        self.assertEqual(baseline_edges(impostors), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+History snapshots restore exactly across keyframes and survive pruning
+"""
+
+import json
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from history_store import TIMESTAMP_FORMAT, HistoryStore, RetentionPolicy, apply_scan_delta, scan_delta
+from inventory import Inventory, make_container, make_network, make_volume
+
+NOW = datetime(2026, 10, 17, 12, 0, 0)
+
+
+def scan(step):
+    """Inventory that changes a little with every step: additions, removals, edits and reordering"""
+    names = [f"app-{i}" for i in range(step % 5, step % 5 + 4)] + ['traefik']
+    if step % 3 == 0:
+        names.reverse()
+    containers = [make_container(name, f"nginx:1.{step % 4}" if name == 'app-3' else 'nginx:1.27', 'Up',
+                                 ['web'] + (['db'] if step % 2 else []), [], {}) for name in names]
+    networks = [make_network('web', 'bridge', 'local')] + ([make_network('db', 'bridge', 'local')] if step % 2 else [])
+    volumes = [make_volume(f"data-{i}", 'local') for i in range(step % 3)]
+    return Inventory(containers, networks, volumes)
+
+
+def diagram(step):
+    return f'<mxfile modified="{step}">\n<diagram name="step {step}"/></mxfile>'.encode()
+
+
+class ScanDeltaTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for step in range(12):
+            base, current = scan(step).as_dict(), scan(step + 1).as_dict()
+            self.assertEqual(apply_scan_delta(base, scan_delta(base, current)), current)
+
+    def test_round_trip_through_stored_form(self):
+        # Deltas are stored as JSON with sorted keys, which reorders the items they add
+        base, current = scan(1).as_dict(), scan(15).as_dict()
+        stored = json.loads(json.dumps(scan_delta(base, current), sort_keys=True))
+        self.assertEqual(apply_scan_delta(base, stored), current)
+
+    def test_unchanged_scan_has_empty_delta(self):
+        self.assertEqual(scan_delta(scan(4).as_dict(), scan(4).as_dict()), {})
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.store = HistoryStore(self.root.name, keyframe_interval=4)
+
+    def add_scans(self, timestamps):
+        for step, taken in enumerate(timestamps):
+            self.store.add(diagram(step), taken.strftime(TIMESTAMP_FORMAT), infrastructure=scan(step),
+                           fingerprint=f"fp-{step}")
+
+    def test_restores_every_scan_across_keyframes(self):
+        timestamps = [NOW - timedelta(minutes=10 * (11 - step)) for step in range(11)]
+        self.add_scans(timestamps)
+        for step, taken in enumerate(timestamps):
+            timestamp = taken.strftime(TIMESTAMP_FORMAT)
+            self.assertEqual(self.store.scan(timestamp).as_dict(), scan(step).as_dict(), timestamp)
+            self.assertEqual(self.store.diagram(timestamp), diagram(step))
+        self.assertEqual(self.store.latest_scan()[1].as_dict(), scan(10).as_dict())
+
+    def test_prune_keeps_everything_kept_entries_need(self):
+        # Every 5 hours for 40 days: some fall in hourly buckets, most in daily ones, some expire
+        timestamps = [NOW - timedelta(hours=5 * step) for step in reversed(range(40 * 24 // 5))]
+        self.add_scans(timestamps)
+        before = {path.name for path in Path(self.root.name, "objects").glob("*/*")}
+
+        removed = self.store.prune(RetentionPolicy(hourly=24, daily=30), now=NOW)
+
+        kept = self.store.entries()
+        self.assertEqual(removed, len(timestamps) - len(kept))
+        self.assertGreater(removed, 0)
+        self.assertEqual(kept[-1]['timestamp'], timestamps[-1].strftime(TIMESTAMP_FORMAT))
+        steps = {taken.strftime(TIMESTAMP_FORMAT): step for step, taken in enumerate(timestamps)}
+        for entry in kept:
+            # Restoring walks the delta chain back to its keyframe: every object on it must remain
+            self.assertEqual(self.store.scan(entry['timestamp']).as_dict(), scan(steps[entry['timestamp']]).as_dict())
+            self.assertEqual(self.store.diagram(entry['timestamp']), diagram(steps[entry['timestamp']]))
+        after = {path.name for path in Path(self.root.name, "objects").glob("*/*")}
+        self.assertLess(after, before)
+
+    def test_retention_buckets(self):
+        entries = [{'timestamp': (NOW - offset).strftime(TIMESTAMP_FORMAT)} for offset in (
+            timedelta(days=40),                      # past the daily window: dropped
+            timedelta(days=3, hours=5),              # same day as the next one: dropped
+            timedelta(days=3, hours=2),              # newest of its day
+            timedelta(hours=5, minutes=50),          # same hour as the next one: dropped
+            timedelta(hours=5, minutes=10),          # newest of its hour
+            timedelta(minutes=1),                    # newest overall
+        )]
+        kept = RetentionPolicy(hourly=24, daily=30).keep(entries, now=NOW)
+        self.assertEqual(kept, [entries[2], entries[4], entries[5]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Manual edits to infrastructure_latest.drawio survive consecutive regenerations
+"""
+
+import os
+import re
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generate_infrastructure_diagram import get_output_dir, render_diagram
+from inventory import Inventory, make_container, make_network
+
+_TRAEFIK_GEOMETRY = re.compile(r'(id="container_traefik".*?<mxGeometry x=")([^"]*)(" y=")([^"]*)(")', re.S)
+
+
+def inventory(*extra):
+    containers = [
+        make_container('traefik', 'traefik:v3.1', 'Up 2 days', ['traefik-proxy'], ['80:80', '443:443'], {}),
+        make_container('keycloak', 'quay.io/keycloak/keycloak:26.0', 'Up 2 days', ['traefik-proxy'], [], {}),
+    ]
+    containers += [make_container(name, 'nginx:1.27', 'Up 1 minute', ['traefik-proxy'], [], {}) for name in extra]
+    return Inventory(containers, [make_network('traefik-proxy', 'bridge', 'local')], [])
+
+
+def traefik_position(path):
+    match = _TRAEFIK_GEOMETRY.search(path.read_text())
+    return match.group(2), match.group(4)
+
+
+def move_traefik(path, x, y):
+    path.write_text(_TRAEFIK_GEOMETRY.sub(rf'\g<1>{x}\g<3>{y}\g<5>', path.read_text(), count=1))
+
+
+class PreserveEditsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.TemporaryDirectory()
+        self.addCleanup(self.base.cleanup)
+        environ = mock.patch.dict(os.environ, {'DRAWIO_BASE_PATH': self.base.name})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.latest = get_output_dir() / "infrastructure_latest.drawio"
+
+    def test_edits_survive_two_regenerations(self):
+        render_diagram(inventory(), 'first')
+        move_traefik(self.latest, 4321, 8765)
+
+        render_diagram(inventory('web'), 'second')
+        self.assertEqual(traefik_position(self.latest), ('4321', '8765'))
+        # The merged file is now the latest; the next merge must still see the move as an edit
+        render_diagram(inventory('web', 'api'), 'third')
+        self.assertEqual(traefik_position(self.latest), ('4321', '8765'))
+        self.assertIn('container_api', self.latest.read_text())
+
+    def test_fresh_discards_edits(self):
+        render_diagram(inventory(), 'first')
+        generated = traefik_position(self.latest)
+        move_traefik(self.latest, 4321, 8765)
+
+        render_diagram(inventory('web'), 'second', fresh=True)
+        self.assertEqual(traefik_position(self.latest), generated)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Topology diffs between two small inventories, single- and multi-host
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from inventory import Inventory, make_container, make_network, make_volume
+from topology_diff import TopologyDiff, changes_inventory
+
+ROUTE = 'traefik.http.routers.{}.rule'
+
+
+def container(name, image='nginx:1.27', networks=('web',), ports=(), labels=None, host=None, status='Up 2 days'):
+    return make_container(name, image, status, list(networks), list(ports), labels or {}, host=host)
+
+
+def network(name, driver='bridge', host=None):
+    return make_network(name, driver, 'local', host=host)
+
+
+PREVIOUS = Inventory(
+    [
+        container('traefik', 'traefik:v3.1', ports=['443:443']),
+        container('drawio', labels={ROUTE.format('drawio'): 'Host(`drawio.example.com`)'}),
+        container('wiki', labels={ROUTE.format('wiki'): 'Host(`wiki.example.com`)'}),
+        container('mailu', 'mailu/nginx:2.0', networks=['web', 'mailu'], ports=['25:25']),
+        container('legacy'),
+    ],
+    [network('web'), network('mailu'), network('old-net')],
+    [make_volume('data', 'local')],
+)
+
+CURRENT = Inventory(
+    [
+        # Uptime alone is not a change
+        container('traefik', 'traefik:v3.1', ports=['443:443'], status='Up 3 days'),
+        container('drawio', labels={ROUTE.format('drawio'): 'Host(`diagrams.example.com`)'}),
+        container('wiki', image='nginx:1.28', labels={ROUTE.format('wiki'): 'Host(`wiki.example.com`)'}),
+        container('api', ports=['8080:8080'], labels={ROUTE.format('api'): 'Host(`api.example.com`)'}),
+        container('mailu-front', 'mailu/nginx:2.0', networks=['web', 'mailu'], ports=['25:25']),
+    ],
+    [network('web'), network('mailu', driver='overlay'), network('new-net')],
+    [make_volume('data', 'local'), make_volume('cache', 'local')],
+)
+
+
+class TopologyDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.diff = TopologyDiff(PREVIOUS, CURRENT)
+
+    def test_containers(self):
+        self.assertEqual(self.diff.containers['added'], ['api', 'mailu-front'])
+        self.assertEqual(self.diff.containers['removed'], ['mailu', 'legacy'])
+        self.assertEqual(self.diff.containers['changed'], {'wiki': {'image': ['nginx:1.27', 'nginx:1.28']}})
+
+    def test_networks_and_volumes(self):
+        self.assertEqual(self.diff.networks, {
+            'added': ['new-net'],
+            'removed': ['old-net'],
+            'changed': {'mailu': {'driver': ['bridge', 'overlay']}},
+        })
+        self.assertEqual(self.diff.volumes, {'added': ['cache'], 'removed': []})
+
+    def test_ports_and_routes(self):
+        self.assertEqual(self.diff.ports, {'added': [['api', '8080:8080'], ['mailu-front', '25:25']],
+                                           'removed': [['mailu', '25:25']]})
+        self.assertEqual(self.diff.routes, {
+            'added': {'http/api': {'container': 'api', 'rule': 'Host(`api.example.com`)'}},
+            'removed': {},
+            'changed': {'http/drawio': {
+                'before': {'container': 'drawio', 'rule': 'Host(`drawio.example.com`)'},
+                'after': {'container': 'drawio', 'rule': 'Host(`diagrams.example.com`)'},
+            }},
+        })
+        # A route change is reported as a route, not as a label change of its container
+        self.assertNotIn('drawio', self.diff.containers['changed'])
+
+    def test_summary(self):
+        self.assertTrue(self.diff.changed)
+        self.assertEqual(self.diff.describe(),
+                         "containers +2 -2 ~1, networks +1 -1 ~1, volumes +1, ports +2 -1, routes +1 ~1")
+
+    def test_unchanged(self):
+        diff = TopologyDiff(PREVIOUS, Inventory(*PREVIOUS))
+        self.assertFalse(diff.changed)
+        self.assertEqual(diff.describe(), "no changes")
+
+    def test_container_and_network_with_the_same_name(self):
+        # The removed container `mailu` must not mark the changed network `mailu` as removed
+        self.assertEqual(self.diff.highlights(), {
+            'containers': {'api': 'added', 'mailu-front': 'added', 'mailu': 'removed', 'legacy': 'removed',
+                           'wiki': 'changed'},
+            'networks': {'new-net': 'added', 'old-net': 'removed', 'mailu': 'changed'},
+        })
+
+    def test_changes_inventory_keeps_removed_records(self):
+        inventory = changes_inventory(PREVIOUS, CURRENT)
+        self.assertEqual([c.name for c in inventory.containers],
+                         ['traefik', 'drawio', 'wiki', 'api', 'mailu-front', 'mailu', 'legacy'])
+        self.assertEqual([n.name for n in inventory.networks], ['web', 'mailu', 'new-net', 'old-net'])
+
+
+class MultiHostDiffTest(unittest.TestCase):
+
+    def test_qualified_names(self):
+        previous = Inventory(
+            [container('web', host='a', labels={ROUTE.format('web'): 'Host(`a.example.com`)'}),
+             container('web', host='b', labels={ROUTE.format('web'): 'Host(`b.example.com`)'})],
+            [network('web', host='a'), network('web', host='b')], [], ['a', 'b'])
+        current = Inventory(
+            [container('web', host='a', labels={ROUTE.format('web'): 'Host(`a.example.com`)'}),
+             container('web', host='c', labels={ROUTE.format('web'): 'Host(`c.example.com`)'})],
+            [network('web', host='a'), network('web', host='c', driver='overlay')], [], ['a', 'c'])
+        diff = TopologyDiff(previous, current)
+
+        # The same name on another host is another container, network and route
+        self.assertEqual(diff.containers, {'added': ['c/web'], 'removed': ['b/web'], 'changed': {}})
+        self.assertEqual(diff.networks, {'added': ['c/web'], 'removed': ['b/web'], 'changed': {}})
+        self.assertEqual(list(diff.routes['added']), ['c/http/web'])
+        self.assertEqual(list(diff.routes['removed']), ['b/http/web'])
+        self.assertEqual(diff.routes['added']['c/http/web']['container'], 'c/web')
+        self.assertEqual(diff.highlights()['containers'], {'c/web': 'added', 'b/web': 'removed'})
+        self.assertEqual(changes_inventory(previous, current).hosts, ['a', 'c', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
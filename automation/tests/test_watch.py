@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+The event watcher survives failed scans, failed renders and malformed events
+"""
+
+import io
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from inventory import make_container, make_network
+from watch import InfrastructureWatcher
+
+
+class FakeScanner:
+    """Scanner whose next `failures` calls raise, standing in for a Docker CLI hiccup"""
+
+    def __init__(self, state):
+        self.state = state
+
+    def _check(self):
+        if self.state['failures']:
+            self.state['failures'] -= 1
+            raise RuntimeError("docker: connection refused")
+
+    def scan_containers(self, container_ids=None):
+        self._check()
+        return [make_container(name, 'nginx:1.27', 'Up', ['web'], [], {}) for name in self.state['containers']]
+
+    def scan_networks(self):
+        self._check()
+        return [make_network('web', 'bridge', 'local')]
+
+    def scan_volumes(self):
+        return []
+
+
+class WatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state = {'containers': ['web'], 'failures': 0}
+        self.renders = []
+        self.render_failures = 0
+        self.watcher = InfrastructureWatcher(lambda: FakeScanner(self.state), self.render, retry_interval=0)
+
+    def render(self, infrastructure, fingerprint):
+        if self.render_failures:
+            self.render_failures -= 1
+            raise RuntimeError("render failed")
+        self.renders.append(sorted(c.name for c in infrastructure.containers))
+
+    def start(self):
+        # What run() does before consuming events, without a `docker events` subprocess
+        self.watcher._stale = True
+        self.watcher._apply([])
+
+    def test_failed_full_scan_is_retried(self):
+        self.state['failures'] = 1
+        self.start()
+        self.assertEqual(self.renders, [])
+        self.watcher._apply([])
+        self.assertEqual(self.renders, [['web']])
+
+    def test_failed_render_is_retried_with_the_same_snapshot(self):
+        self.render_failures = 1
+        self.start()
+        self.assertEqual(self.renders, [])
+        self.watcher._apply([])
+        self.assertEqual(self.renders, [['web']])
+
+    def test_failed_partial_rescan_falls_back_to_full_rescan(self):
+        self.start()
+        self.state['containers'] = ['web', 'api']
+        self.state['failures'] = 1
+        self.watcher._apply([{'Type': 'container', 'Action': 'start', 'Actor': {'ID': 'api', 'Attributes': {}}}])
+        self.assertEqual(self.renders, [['web'], ['api', 'web']])
+
+    def test_malformed_event_lines_are_skipped(self):
+        class Process:
+            stdout = io.StringIO('{"Type": "container"\n5\n{"Type": "volume", "Action": "create"}\n')
+        self.watcher._read_events(Process())
+        self.assertEqual(self.watcher._events.get_nowait(), {'Type': 'volume', 'Action': 'create'})
+        self.assertIsNone(self.watcher._events.get_nowait())
+
+
+if __name__ == '__main__':
+    unittest.main()
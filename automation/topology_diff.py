@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Topology Diff
+Compares two inventories and reports added, removed and changed containers, networks,
+volumes, published ports and Traefik routes
+"""
+
+import json
+import re
+from pathlib import Path
+
+from inventory import Inventory, qualified_name
+
+REPORT_VERSION = 1
+
+# Traefik router rules, e.g. traefik.http.routers.drawio.rule = Host(`drawio.example.com`)
+ROUTE_LABEL_PATTERN = r'traefik\.(?:http|tcp|udp)\.routers\.[^.]+\.rule'
+_ROUTE_LABEL = re.compile(r'traefik\.(http|tcp|udp)\.routers\.([^.]+)\.rule')
+
+# Change highlighting on the changes page: status -> style overrides appended to the node style
+HIGHLIGHT_STYLES = {
+    'added': "strokeColor=#00AA00;strokeWidth=4;",
+    'changed': "strokeColor=#FF8800;strokeWidth=4;",
+    'removed': "strokeColor=#CC0000;strokeWidth=4;dashed=1;opacity=50;",
+}
+
+
+def container_routes(container):
+    """Traefik routers a container declares: {protocol/router: rule}"""
+    routes = {}
+    for key, value in container.labels.items():
+        match = _ROUTE_LABEL.fullmatch(key)
+        if match:
+            routes[f"{match.group(1)}/{match.group(2)}"] = value
+    return routes
+
+
+def _diff_index(old, new):
+    """Keys added and removed between two dicts, and keys present in both with different values"""
+    added = [key for key in new if key not in old]
+    removed = [key for key in old if key not in new]
+    changed = [key for key in new if key in old and old[key] != new[key]]
+    return added, removed, changed
+
+
+def _container_changes(old, new):
+    changes = {}
+    if old.image != new.image:
+        changes['image'] = [old.image, new.image]
+    for field in ('networks', 'ports', 'env_hosts'):
+        before, after = set(getattr(old, field)), set(getattr(new, field))
+        if before != after:
+            changes[field] = {'added': sorted(after - before), 'removed': sorted(before - after)}
+    route_keys = {k for k in set(old.labels) | set(new.labels) if _ROUTE_LABEL.fullmatch(k)}
+    labels = sorted(k for k in set(old.labels) | set(new.labels)
+                    if k not in route_keys and old.labels.get(k) != new.labels.get(k))
+    if labels:
+        changes['labels'] = labels
+    return changes
+
+
+class TopologyDiff:
+    """Differences between a previous and a current inventory
+
+    Every section is built from name-keyed indexes of both inventories, so a diff costs
+    O(n) in the number of records rather than comparing every pair.
+    """
+
+    SECTIONS = ('containers', 'networks', 'volumes', 'ports', 'routes')
+
+    def __init__(self, previous, current):
+        old_containers = {qualified_name(c): c for c in previous.containers}
+        new_containers = {qualified_name(c): c for c in current.containers}
+        added, removed, candidates = _diff_index(_comparable(old_containers), _comparable(new_containers))
+        changed = {}
+        for name in candidates:
+            container_changes = _container_changes(old_containers[name], new_containers[name])
+            if container_changes:
+                changed[name] = container_changes
+        self.containers = {'added': added, 'removed': removed, 'changed': changed}
+
+        old_networks = {qualified_name(n): n for n in previous.networks}
+        new_networks = {qualified_name(n): n for n in current.networks}
+        added, removed, changed = _diff_index(old_networks, new_networks)
+        self.networks = {
+            'added': added,
+            'removed': removed,
+            'changed': {name: {field: [getattr(old_networks[name], field), getattr(new_networks[name], field)]
+                               for field in ('driver', 'scope')
+                               if getattr(old_networks[name], field) != getattr(new_networks[name], field)}
+                        for name in changed},
+        }
+
+        added, removed, _ = _diff_index({qualified_name(v): v for v in previous.volumes},
+                                        {qualified_name(v): v for v in current.volumes})
+        self.volumes = {'added': added, 'removed': removed}
+
+        old_ports = _port_index(old_containers)
+        new_ports = _port_index(new_containers)
+        self.ports = {
+            'added': [list(p) for p in new_ports if p not in old_ports],
+            'removed': [list(p) for p in old_ports if p not in new_ports],
+        }
+
+        old_routes = _route_index(old_containers)
+        new_routes = _route_index(new_containers)
+        added, removed, changed = _diff_index(old_routes, new_routes)
+        self.routes = {
+            'added': {route: new_routes[route] for route in added},
+            'removed': {route: old_routes[route] for route in removed},
+            'changed': {route: {'before': old_routes[route], 'after': new_routes[route]} for route in changed},
+        }
+
+    @property
+    def changed(self):
+        """True if anything at all differs"""
+        return any(any(entries for entries in getattr(self, section).values()) for section in self.SECTIONS)
+
+    def summary(self):
+        """Counts per section and kind, e.g. {'containers': {'added': 1, 'removed': 0, 'changed': 2}}"""
+        return {section: {kind: len(entries) for kind, entries in getattr(self, section).items()}
+                for section in self.SECTIONS}
+
+    def describe(self):
+        """One-line summary of the sections that changed, e.g. 'containers +1 ~2, routes -1'"""
+        parts = []
+        for section, counts in self.summary().items():
+            marks = ' '.join(f"{sign}{counts[kind]}" for kind, sign in (('added', '+'), ('removed', '-'), ('changed', '~'))
+                             if counts.get(kind))
+            if marks:
+                parts.append(f"{section} {marks}")
+        return ', '.join(parts) or "no changes"
+
+    def highlights(self):
+        """Change status of every container and network that differs, by section and qualified name
+
+        Sections are kept apart because Compose routinely names a container and a network alike.
+        """
+        status = {'containers': {}, 'networks': {}}
+        for section, names in status.items():
+            for kind in ('added', 'removed', 'changed'):
+                for name in getattr(self, section)[kind]:
+                    names[name] = kind
+        return status
+
+    def as_dict(self):
+        return {section: getattr(self, section) for section in self.SECTIONS}
+
+
+def _comparable(containers):
+    # Status ("Up 3 hours") changes on every scan and is not a topology change
+    return {name: c._replace(status=None) for name, c in containers.items()}
+
+
+def _port_index(containers):
+    return dict.fromkeys((name, port) for name, container in containers.items() for port in container.ports)
+
+
+def _route_index(containers):
+    """{router: {'container': name, 'rule': rule}}, routers qualified by host where there is one"""
+    routes = {}
+    for name, container in containers.items():
+        for router, rule in container_routes(container).items():
+            key = f"{container.host}/{router}" if container.host else router
+            routes[key] = {'container': name, 'rule': rule}
+    return routes
+
+
+def changes_inventory(previous, current):
+    """Current inventory plus the containers and networks that were removed, for the changes page"""
+    current_containers = {qualified_name(c) for c in current.containers}
+    current_networks = {qualified_name(n) for n in current.networks}
+    hosts = current.hosts
+    if hosts is not None and previous.hosts is not None:
+        hosts = list(hosts) + [h for h in previous.hosts if h not in hosts]
+    return Inventory(
+        list(current.containers) + [c for c in previous.containers if qualified_name(c) not in current_containers],
+        list(current.networks) + [n for n in previous.networks if qualified_name(n) not in current_networks],
+        list(current.volumes),
+        hosts,
+    )
+
+
+def write_report(diff, path, previous_snapshot=None, fingerprint=None):
+    """Write the machine-readable change report atomically"""
+    path = Path(path)
+    report = {
+        'version': REPORT_VERSION,
+        'previous': previous_snapshot,
+        'fingerprint': fingerprint,
+        'changed': diff.changed if diff else None,
+        'summary': diff.summary() if diff else None,
+        **(diff.as_dict() if diff else {}),
+    }
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(report, indent=2))
+    tmp_path.replace(path)
+    return report
@@ -7,12 +7,10 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 # Use environment variable or default to user home
 BASE_PATH="${DRAWIO_BASE_PATH:-$HOME}"
-OUTPUT_DIR="${BASE_PATH}/projects/data/drawio/output"
-NGINX_DIR="${BASE_PATH}/projects/data/nginx/nginx-portal"
-DIAGRAMS_NGINX_DIR="${BASE_PATH}/projects/data/diagrams-nginx"
 
 # Colors for output
 GREEN='\033[0;32m'
+RED='\033[0;31m'
 YELLOW='\033[1;33m'
 BLUE='\033[0;34m'
 NC='\033[0m' # No Color
@@ -20,38 +18,47 @@ NC='\033[0m' # No Color
 echo -e "${BLUE}=== Infrastructure Diagram Update Pipeline ===${NC}"
 echo ""
 
-# Generate new diagram
+# Static previews for readers who only view the diagram: svg (default), png or svg,png;
+# DRAWIO_EXPORT= (empty) turns them off
+EXPORT_FORMATS="${DRAWIO_EXPORT-svg}"
+EXPORT_ARGS=()
+if [ -n "$EXPORT_FORMATS" ]; then
+    EXPORT_ARGS=(--export "$EXPORT_FORMATS")
+fi
+
+# Generate new diagram (pass --force to regenerate an unchanged infrastructure)
 echo -e "${YELLOW}Generating new diagram from current infrastructure...${NC}"
 cd "$SCRIPT_DIR"
 # Export the base path for the Python script
 export DRAWIO_BASE_PATH="${BASE_PATH}"
-python3 generate_infrastructure_diagram.py
+python3 generate_infrastructure_diagram.py --deploy "${EXPORT_ARGS[@]}" "$@"
+STATUS=$?
+
+# Exit code 3: scan matched the last rendered fingerprint, nothing new to deploy
+# (missing previews of the unchanged diagram are still exported and deployed)
+if [ $STATUS -eq 3 ]; then
+    echo -e "${GREEN}✅ Infrastructure unchanged since last run, nothing to deploy${NC}"
+    exit 0
+fi
 
-if [ $? -eq 0 ]; then
+if [ $STATUS -eq 0 ]; then
+    # --deploy serialized the diagram once and atomically replaced it in both web roots,
+    # previews under infrastructure/ next to it (see publish_manifest.json), so nginx
+    # never serves a half-written file
     echo -e "${GREEN}✅ Diagram generated successfully${NC}"
-    
-    # Copy to web servers
-    echo -e "${YELLOW}Deploying to web servers...${NC}"
-    
-    # Copy from output directory to web servers
-    cp "${OUTPUT_DIR}/infrastructure_latest.drawio" "$NGINX_DIR/infrastructure.drawio"
     echo -e "${GREEN}✅ Deployed to nginx.ai-servicers.com${NC}"
-    
-    # Copy to diagrams nginx (ensure directory exists)
-    mkdir -p "$DIAGRAMS_NGINX_DIR"
-    cp "${OUTPUT_DIR}/infrastructure_latest.drawio" "$DIAGRAMS_NGINX_DIR/infrastructure.drawio"
     echo -e "${GREEN}✅ Deployed to diagrams.nginx.ai-servicers.com${NC}"
     
-    # Clean up old versions in history (keep only last 10)
-    if [ -d "${OUTPUT_DIR}/history" ]; then
-        ls -t "${OUTPUT_DIR}/history"/*.drawio 2>/dev/null | tail -n +11 | xargs -r rm
-    fi
-    
     echo ""
     echo -e "${GREEN}=== Update Complete ===${NC}"
     echo -e "${BLUE}Access your diagram at:${NC}"
     echo -e "  • https://nginx.ai-servicers.com/infrastructure.drawio"
     echo -e "  • https://diagrams.nginx.ai-servicers.com/infrastructure.drawio"
+    if [ -n "$EXPORT_FORMATS" ]; then
+        echo -e "${BLUE}Browse the previews at:${NC}"
+        echo -e "  • https://nginx.ai-servicers.com/infrastructure/"
+        echo -e "  • https://diagrams.nginx.ai-servicers.com/infrastructure/"
+    fi
     echo ""
     echo -e "${BLUE}To edit:${NC}"
     echo -e "  1. Open Draw.io: https://drawio.ai-servicers.com"
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Docker Event Watcher
+Keeps an infrastructure snapshot current from `docker events` and re-renders
+the diagram only when the topology changes
+"""
+
+import json
+import queue
+import subprocess
+import threading
+import time
+
+from inventory import Inventory, make_volume
+from snapshot_cache import inventory_fingerprint
+
+# Events that can change what the diagram shows
+WATCHED_EVENTS = {
+    'container': {'start', 'stop', 'die', 'destroy', 'rename'},
+    'network': {'create', 'destroy', 'connect', 'disconnect'},
+    'volume': {'create', 'destroy'},
+}
+
+
+class InfrastructureWatcher:
+    """Maintains a live infrastructure snapshot from the Docker event stream"""
+
+    def __init__(self, scanner_factory, on_change, debounce=2.0, max_delay=30.0, last_fingerprint=None,
+                 retry_interval=30.0):
+        self.scanner_factory = scanner_factory
+        self.on_change = on_change
+        self.debounce = debounce
+        self.max_delay = max_delay  # Upper bound on render latency during a constant event storm
+        # Seconds of quiet after a failed scan or render before a full rescan and render are retried
+        self.retry_interval = retry_interval
+
+        self.containers = {}
+        self.networks = {}
+        self.volumes = {}
+        self._rendered = last_fingerprint
+        # Set after a failed scan or render: the snapshot cannot be trusted until a full rescan
+        self._stale = False
+        self._events = queue.Queue()
+        self._process = None
+        self._stopping = threading.Event()
+
+    @property
+    def infrastructure(self):
+        """Current snapshot in the same shape as a full scan"""
+        return Inventory(list(self.containers.values()), list(self.networks.values()), list(self.volumes.values()))
+
+    def run(self):
+        """Take a full snapshot, then apply events until stop() is called"""
+        while not self._stopping.is_set():
+            # Subscribe before the snapshot so nothing between the two is missed
+            self._start_event_stream()
+            self._stale = True
+            self._apply([])
+            self._consume_events()
+            if not self._stopping.is_set():
+                print("⚠️  Docker event stream ended, resubscribing with a full rescan...")
+                time.sleep(self.debounce)
+
+    def stop(self):
+        """Stop watching and terminate the `docker events` subprocess"""
+        self._stopping.set()
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+
+    def resync(self):
+        """Replace the snapshot with a full scan"""
+        scanner = self.scanner_factory()
+        self.containers = {c.name: c for c in scanner.scan_containers()}
+        self.networks = {n.name: n for n in scanner.scan_networks()}
+        self.volumes = {v.name: v for v in scanner.scan_volumes()}
+
+    def _start_event_stream(self):
+        cmd = ["docker", "events", "--format", "{{json .}}"]
+        for event_type in WATCHED_EVENTS:
+            cmd += ["--filter", f"type={event_type}"]
+        self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        threading.Thread(target=self._read_events, args=(self._process,), daemon=True).start()
+
+    def _read_events(self, process):
+        for line in process.stdout:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                event = None
+            if isinstance(event, dict):
+                self._events.put(event)
+            else:
+                print(f"⚠️  Ignoring malformed Docker event: {line.strip()[:200]}")
+        self._events.put(None)  # End-of-stream marker
+
+    def _consume_events(self):
+        """Batch events until the stream is quiet for `debounce` seconds, then apply them"""
+        pending = []
+        first_at = None
+        while not self._stopping.is_set():
+            timeout = self.retry_interval if self._stale else None
+            if pending:
+                timeout = max(0.0, min(self.debounce, first_at + self.max_delay - time.monotonic()))
+            try:
+                event = self._events.get(timeout=timeout)
+            except queue.Empty:
+                self._apply(pending)
+                pending, first_at = [], None
+                continue
+
+            if event is None:
+                return
+            if event.get('Action') not in WATCHED_EVENTS.get(event.get('Type'), ()):
+                continue
+            if not pending:
+                first_at = time.monotonic()
+            pending.append(event)
+
+    def _apply(self, events):
+        """Fold a batch of events into the snapshot and render once if the topology changed
+
+        A failed partial rescan falls back to a full one; if that fails too (or the render
+        does), the watcher keeps running and retries after `retry_interval` seconds of quiet.
+        """
+        try:
+            if not self._stale:
+                try:
+                    self._fold(events)
+                except Exception as e:
+                    print(f"⚠️  Rescan of changed objects failed, falling back to a full rescan: {e}")
+                    self._stale = True
+            if self._stale:
+                self.resync()
+        except Exception as e:
+            print(f"⚠️  Full rescan failed, retrying in {self.retry_interval:g}s: {e}")
+            return
+        self._stale = False
+        self._render_if_changed()
+
+    def _fold(self, events):
+        """Apply a batch of events to the snapshot, rescanning only what they touched"""
+        refresh_ids = set()
+        rescan_networks = False
+
+        for event in events:
+            actor = event.get('Actor', {})
+            attributes = actor.get('Attributes', {})
+            event_type, action = event['Type'], event['Action']
+
+            if event_type == 'container':
+                if action in ('start', 'rename'):
+                    refresh_ids.add(actor['ID'])
+                    self.containers.pop(attributes.get('oldName', '').lstrip('/'), None)
+                else:
+                    self.containers.pop(attributes.get('name'), None)
+                    refresh_ids.discard(actor['ID'])
+            elif event_type == 'network':
+                if action in ('connect', 'disconnect'):
+                    refresh_ids.add(attributes['container'])
+                else:
+                    rescan_networks = True
+            elif event_type == 'volume':
+                if action == 'create':
+                    self.volumes[actor['ID']] = make_volume(actor['ID'], attributes.get('driver', 'local'))
+                else:
+                    self.volumes.pop(actor['ID'], None)
+
+        # One batched scan for every container touched by the burst
+        if refresh_ids:
+            for container in self.scanner_factory().scan_containers(container_ids=sorted(refresh_ids)):
+                self.containers[container.name] = container
+        if rescan_networks:
+            self.networks = {n.name: n for n in self.scanner_factory().scan_networks()}
+
+    def _render_if_changed(self):
+        infrastructure = self.infrastructure
+        fingerprint = inventory_fingerprint(infrastructure)
+        if fingerprint == self._rendered:
+            return
+        print(f"🔄 Topology changed: {len(self.containers)} containers, "
+              f"{len(self.networks)} networks, {len(self.volumes)} volumes")
+        try:
+            self.on_change(infrastructure, fingerprint)
+        except Exception as e:
+            # _rendered stays as it was, so the retry renders this snapshot again
+            print(f"❌ Render failed, retrying in {self.retry_interval:g}s: {e}")
+            self._stale = True
+            return
+        self._rendered = fingerprint